@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Memory report: size of parsed segments and their primitives, default vs. compact."""
+
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from core.parsers import *
+from visualizer.primitives import *
+
+
+def deep_size(obj) -> int:
+    # bytes of everything reachable from `obj`, each object counted once; arrays that own
+    # their data include it in `getsizeof`, views count the array they look into
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack:
+        x = stack.pop()
+        if id(x) in seen or isinstance(x, type):
+            continue
+        seen.add(id(x))
+        total += sys.getsizeof(x)
+        if isinstance(x, np.ndarray):
+            if x.base is not None:
+                stack.append(x.base)
+            continue
+        if isinstance(x, dict):
+            stack.extend(x.keys())
+            stack.extend(x.values())
+        elif isinstance(x, (list, tuple, set, frozenset)):
+            stack.extend(x)
+        if hasattr(x, '__dict__'):
+            stack.append(x.__dict__)
+        for name in getattr(type(x), '__slots__', ()):
+            if hasattr(x, name):
+                stack.append(getattr(x, name))
+    return total
+
+
+def main():
+    argument_parser = argparse.ArgumentParser()
+    argument_parser.add_argument('-i', '--input',
+                                 type=str,
+                                 required=True,
+                                 help='.ds project file to measure')
+    args = argument_parser.parse_args()
+
+    with open(args.input, 'r', encoding='utf-8') as f:
+        ds = json.load(f)
+    if not isinstance(ds, list):
+        ds = [ds]
+
+    # compact segments keep their MIDI pitch once it is computed, hence the size after layout too
+    print("{} segment(s), sizes in KiB per segment".format(len(ds)))
+    print("{:<32s}{:>10s}{:>14s}{:>12s}".format('', 'parsed', 'after layout', 'primitives'))
+    paths = [
+        ('parse_segment', parse_segment, get_visualize_unit_table_segment),
+        ('parse_segment_arrays', parse_segment_arrays, get_visualize_unit_table_arrays),
+    ]
+    for name, parse, layout in paths:
+        for compact in (False, True):
+            segments = [parse(x, compact) for x in ds]
+            parsed = deep_size(segments)
+            primitives = [get_segment_primitives(x, layout(x)) for x in segments]
+            print("{:<32s}{:10.1f}{:14.1f}{:12.1f}".format(name + (' (compact)' if compact else ''),
+                                                           parsed / len(ds) / 1024,
+                                                           deep_size(segments) / len(ds) / 1024,
+                                                           deep_size(primitives) / len(ds) / 1024))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
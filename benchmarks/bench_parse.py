@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Micro-benchmark: `parse_segment` vs. `parse_segment_arrays`."""
+
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from core.parsers import *
+
+
+def make_segment(num_notes=2000, f0_len=50000):
+    # every third note is a slur, every word has two phonemes
+    note_slur = [1 if i % 3 == 2 else 0 for i in range(num_notes)]
+    num_words = note_slur.count(0)
+    return {
+        'offset': 0.0,
+        'text': ' '.join('la' for _ in range(num_words)),
+        'ph_seq': ' '.join('a k' for _ in range(num_words)),
+        'ph_dur': ' '.join('0.2 0.05' for _ in range(num_words)),
+        'ph_num': ' '.join('2' for _ in range(num_words)),
+        'note_seq': ' '.join(('C4', 'D#4', 'rest', 'G♭4')[i % 4] for i in range(num_notes)),
+        'note_dur': ' '.join('0.125' for _ in range(num_notes)),
+        'note_slur': ' '.join(str(x) for x in note_slur),
+        'f0_seq': ' '.join('{:.1f}'.format(220.0 + i % 220) for i in range(f0_len)),
+        'f0_timestep': '0.005',
+    }
+
+
+def main():
+    argument_parser = argparse.ArgumentParser()
+    argument_parser.add_argument('-i', '--input',
+                                 type=str,
+                                 required=False,
+                                 help='.ds project file to parse (a synthetic segment is used if omitted)')
+    argument_parser.add_argument('-n', '--number',
+                                 type=int,
+                                 default=5,
+                                 help='number of runs per path')
+    args = argument_parser.parse_args()
+
+    if args.input is not None:
+        with open(args.input, 'r', encoding='utf-8') as f:
+            ds = json.load(f)
+        if not isinstance(ds, list):
+            ds = [ds]
+    else:
+        ds = [make_segment()]
+
+    paths = [
+        ('parse_segment', lambda: [parse_segment(s) for s in ds]),
+        ('parse_segment_arrays', lambda: [parse_segment_arrays(s) for s in ds]),
+        ('parse_segment_arrays + to_segment', lambda: [parse_segment_arrays(s).to_segment() for s in ds]),
+    ]
+    for name, func in paths:
+        best = min(timeit.repeat(func, number=1, repeat=args.number))
+        print("{:<36s}{:10.2f} ms".format(name, best * 1000))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
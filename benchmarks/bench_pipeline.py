@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Pipeline benchmark: time and peak memory of every stage on synthetic projects.
+
+Each scenario is a project from `synth.make_project`; starting from a base shape,
+one dimension at a time (segments, notes per segment, slur ratio, phonemes per
+word, f0 timestep) is pushed to a small and a large extreme. Every stage runs on the
+output of the one before it, and the best of `--number` runs is reported. Peak
+memory (`tracemalloc`) is taken from one extra run, so that tracing does not skew
+the timings. With `--save-baseline` the results are stored as JSON; with `--baseline`
+they are compared against a stored run and the script exits with 1 if a stage got
+slower or bigger than the tolerance allows.
+"""
+
+import argparse
+import fnmatch
+import json
+import os
+import sys
+import tempfile
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from core.models import *
+from core.parsers import *
+from visualizer.backends import *
+from visualizer.primitives import *
+from visualizer.svg import *
+from compare_layout import count_fallback_groups
+from synth import make_project
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+BASE = dict(segments=10, notes=100, slur_ratio=0.2, phonemes=2, f0_timestep=0.005)
+# (dimension, value of the smallest workload, value of the largest workload)
+EXTREMES = [
+    ('segments', 1, 200),
+    ('notes', 2, 2000),
+    ('slur_ratio', 0.0, 0.9),
+    ('phonemes', 1, 6),
+    ('f0_timestep', 0.05, 0.001),
+]
+STAGES = ('parse', 'parse_arrays', 'layout', 'layout_arrays', 'primitives', 'render_svg', 'render_matplotlib')
+# stages with shorter runs than this are not checked against the baseline, they are noise
+MIN_CHECKED_TIME = 0.002
+
+
+def get_scenarios():
+    scenarios = {'base': dict(BASE)}
+    for key, small, large in EXTREMES:
+        for suffix, value in (('min', small), ('max', large)):
+            scenarios['{}-{}'.format(key.replace('_', '-'), suffix)] = dict(BASE, **{key: value})
+    return scenarios
+
+
+def get_default_font():
+    font_name = os.path.join(ROOT, 'fonts', 'NotoSansCJKsc-Medium.otf')
+    if os.path.exists(font_name):
+        return font_name
+    from matplotlib import font_manager
+    return font_manager.findfont('DejaVu Sans')
+
+
+def get_stages(raw_segments, output_dir, font_name):
+    """Stage name -> function of the outputs of the stages before it."""
+    def parse(_):
+        return Track(segments=[parse_segment(x) for x in raw_segments])
+
+    def parse_arrays(_):
+        return [parse_segment_arrays(x) for x in raw_segments]
+
+    def layout(results):
+        return get_visualize_units_track(results['parse'])
+
+    def layout_arrays(results):
+        return [get_visualize_unit_table_arrays(x) for x in results['parse_arrays']]
+
+    def primitives(results):
+        return [get_segment_primitives(segment, units)
+                for segment, units in zip(results['parse_arrays'], results['layout_arrays'])]
+
+    def render_svg(results):
+        render_primitives_svg(iter(results['primitives']), os.path.join(output_dir, 'bench.svg'), font_name=font_name)
+
+    def render_matplotlib(results):
+        from visualizer.visualizers import render_primitives
+        render_primitives(iter(results['primitives']), os.path.join(output_dir, 'bench.png'), font_name=font_name)
+
+    return {
+        'parse': parse,
+        'parse_arrays': parse_arrays,
+        'layout': layout,
+        'layout_arrays': layout_arrays,
+        'primitives': primitives,
+        'render_svg': render_svg,
+        'render_matplotlib': render_matplotlib,
+    }
+
+
+def measure(stages, names, number):
+    """Return {stage: {'time': best seconds, 'peak_memory': bytes}}."""
+    results = {}
+    measurements = {}
+    for name in names:
+        func = stages[name]
+        results[name] = func(results)
+        best = min(timeit.repeat(lambda: func(results), number=1, repeat=number))
+        tracemalloc.start()
+        func(results)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        measurements[name] = {'time': best, 'peak_memory': peak}
+    return measurements
+
+
+def compare(name, stage, measurement, baseline, tolerance):
+    """Return the report suffix and whether `measurement` regressed against `baseline`."""
+    old = baseline.get(name, {}).get(stage)
+    if old is None:
+        return '', False
+    time_limit = old['time'] * (1 + tolerance)
+    memory_limit = old['peak_memory'] * (1 + tolerance)
+    slower = measurement['time'] > time_limit and max(old['time'], measurement['time']) >= MIN_CHECKED_TIME
+    bigger = measurement['peak_memory'] > memory_limit
+    suffix = "   baseline {:9.2f} ms {:9.2f} MB".format(old['time'] * 1000, old['peak_memory'] / 2 ** 20)
+    if slower or bigger:
+        suffix += "   REGRESSION ({})".format(', '.join(x for x, y in (('time', slower), ('memory', bigger)) if y))
+    return suffix, slower or bigger
+
+
+def main():
+    scenarios = get_scenarios()
+    argument_parser = argparse.ArgumentParser()
+    argument_parser.add_argument('-n', '--number',
+                                 type=int,
+                                 default=3,
+                                 help='runs per stage (the best is reported)')
+    argument_parser.add_argument('-s', '--scenario',
+                                 type=str,
+                                 action='append',
+                                 help='scenario to run (glob pattern, may be repeated); one of: {}'.format(
+                                     ', '.join(scenarios)))
+    argument_parser.add_argument('--stage',
+                                 type=str,
+                                 action='append',
+                                 choices=STAGES,
+                                 help='stage to run (may be repeated); the stages it depends on run as well')
+    argument_parser.add_argument('--font-name',
+                                 type=str,
+                                 required=False,
+                                 help='font for the render stages (default: the bundled font, or DejaVu Sans)')
+    argument_parser.add_argument('--baseline',
+                                 type=str,
+                                 required=False,
+                                 help='JSON file of a previous run to compare against')
+    argument_parser.add_argument('--tolerance',
+                                 type=float,
+                                 default=0.25,
+                                 help='allowed relative slowdown and memory growth against the baseline')
+    argument_parser.add_argument('--save-baseline',
+                                 type=str,
+                                 required=False,
+                                 help='write the results to this JSON file')
+    args = argument_parser.parse_args()
+
+    if args.scenario:
+        names = [x for x in scenarios if any(fnmatch.fnmatch(x, pattern) for pattern in args.scenario)]
+        if not names:
+            argument_parser.error("no scenario matches {}".format(', '.join(args.scenario)))
+        scenarios = {x: scenarios[x] for x in names}
+    stage_names = list(STAGES)
+    if args.stage:
+        # a stage needs all the ones before it in `STAGES`, except the other render stage
+        last = max(STAGES.index(x) for x in args.stage)
+        stage_names = [x for x in STAGES[:last + 1] if not x.startswith('render_') or x in args.stage]
+    font_name = args.font_name if args.font_name is not None else get_default_font()
+    if 'render_matplotlib' in stage_names:
+        use_non_interactive_backend()
+
+    baseline = {}
+    if args.baseline is not None:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    results = {}
+    failures = []
+    with tempfile.TemporaryDirectory() as output_dir:
+        for name, shape in scenarios.items():
+            raw_segments = make_project(**shape)
+            print("{}: {}".format(name, ', '.join('{} {}'.format(k, v) for k, v in shape.items())))
+            measurements = measure(get_stages(raw_segments, output_dir, font_name), stage_names, args.number)
+            results[name] = measurements
+            for stage, measurement in measurements.items():
+                suffix, regressed = compare(name, stage, measurement, baseline, args.tolerance)
+                print("    {:20s} {:9.2f} ms {:9.2f} MB{}".format(
+                    stage, measurement['time'] * 1000, measurement['peak_memory'] / 2 ** 20, suffix))
+                if regressed:
+                    failures.append('{}/{}'.format(name, stage))
+            if 'layout_arrays' in stage_names:
+                # groups the vectorized engine leaves to the loop engine's state machine
+                fallback, groups = count_fallback_groups([parse_segment_arrays(x) for x in raw_segments])
+                print("    {:20s} {} of {} slur group(s)".format('fallback', fallback, groups))
+
+    if args.save_baseline is not None:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=1)
+    if failures:
+        print("FAILED: {}".format(', '.join(failures)))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Render server benchmark: request latency of `main.py --serve` against one `main.py` run per file.
+
+Starts a server on a free local port, sends `--number` render requests from
+`--concurrency` client threads, and prints the client-side latencies together with
+the server's `/metrics`. With `--compare-cli`, the same document is also rendered by
+running `main.py` once per request, as a preview service without the server would.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from visualizer.server import request_render
+from synth import make_project
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+MAIN = os.path.join(ROOT, 'main.py')
+
+
+def start_server(arguments):
+    """Start `main.py --serve` on a free port; returns the process and its URL."""
+    process = subprocess.Popen([sys.executable, MAIN, '--serve', '0', '--host', '127.0.0.1'] + arguments,
+                               cwd=ROOT, stdout=subprocess.PIPE, text=True)
+    for line in process.stdout:
+        if line.startswith('Serving on '):
+            return process, line.split()[2].rstrip('/')
+    process.wait()
+    raise RuntimeError("The render server exited with code {}".format(process.returncode))
+
+
+def summary(latencies):
+    latencies = sorted(latencies)
+    return "mean {:7.1f} ms   p50 {:7.1f} ms   p90 {:7.1f} ms   max {:7.1f} ms".format(
+        statistics.mean(latencies) * 1000, latencies[len(latencies) // 2] * 1000,
+        latencies[min(len(latencies) - 1, int(len(latencies) * 0.9))] * 1000, latencies[-1] * 1000)
+
+
+def main():
+    argument_parser = argparse.ArgumentParser()
+    argument_parser.add_argument('-i', '--input',
+                                 type=str,
+                                 required=False,
+                                 help='.ds project file to render (a small synthetic project is used if omitted)')
+    argument_parser.add_argument('-n', '--number',
+                                 type=int,
+                                 default=20,
+                                 help='number of requests')
+    argument_parser.add_argument('-c', '--concurrency',
+                                 type=int,
+                                 default=1,
+                                 help='number of client threads')
+    argument_parser.add_argument('-j', '--jobs',
+                                 type=int,
+                                 default=2,
+                                 help='number of server worker processes')
+    argument_parser.add_argument('--format',
+                                 type=str,
+                                 choices=('svg', 'png'),
+                                 default='svg',
+                                 help='output format')
+    argument_parser.add_argument('--backend',
+                                 type=str,
+                                 choices=('matplotlib', 'svg'),
+                                 default='matplotlib',
+                                 help='renderer')
+    argument_parser.add_argument('--font-name',
+                                 type=str,
+                                 required=False,
+                                 help='font file of the server (and of the command line runs)')
+    argument_parser.add_argument('--compare-cli',
+                                 action='store_true',
+                                 help='also time one `main.py` run per request')
+    args = argument_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_filename = args.input
+        if input_filename is None:
+            input_filename = os.path.join(work_dir, 'bench.ds')
+            with open(input_filename, 'w', encoding='utf-8') as f:
+                json.dump(make_project(segments=2, notes=50), f)
+        with open(input_filename, 'rb') as f:
+            document = f.read()
+        font_arguments = ['--font-name', args.font_name] if args.font_name is not None else []
+
+        start = time.perf_counter()
+        process, url = start_server(['-j', str(args.jobs)] + font_arguments)
+        print("server started in {:.2f}s at {}".format(time.perf_counter() - start, url))
+        try:
+            def render(_):
+                request_start = time.perf_counter()
+                request_render(url, document, fmt=args.format, backend=args.backend)
+                return time.perf_counter() - request_start
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+                latencies = list(executor.map(render, range(args.number)))
+            elapsed = time.perf_counter() - start
+            print("server:  {}   {:.1f} request(s)/s".format(summary(latencies), args.number / elapsed))
+            with urllib.request.urlopen(url + '/metrics') as response:
+                print(response.read().decode('utf-8'))
+        finally:
+            process.terminate()
+            process.wait()
+
+        if args.compare_cli:
+            latencies = []
+            output_filename = os.path.join(work_dir, 'bench.' + args.format)
+            for _ in range(min(args.number, 5)):
+                start = time.perf_counter()
+                subprocess.run([sys.executable, MAIN, '-i', input_filename, '-o', output_filename,
+                                '--backend', args.backend] + font_arguments,
+                               cwd=ROOT, stdout=subprocess.DEVNULL, check=True)
+                latencies.append(time.perf_counter() - start)
+            print("main.py: {}".format(summary(latencies)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Startup benchmark: import time (`python -X importtime`) of the CLI and the render backends.
+
+Each scenario is run in a fresh interpreter `--number` times; the median total import
+time is reported together with the heaviest modules. With `--save-baseline` the results
+are stored as JSON; with `--baseline` they are compared against a stored run and the
+script exits with 1 if a scenario got slower than the tolerance allows, or if a scenario
+imports a module it must not (e.g. `--help` importing matplotlib).
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+MAIN = os.path.join(ROOT, 'main.py')
+
+# name: (arguments of the interpreter, modules that must not be imported)
+SCENARIOS = {
+    'cli-help': ([MAIN, '--help'], ('numpy', 'matplotlib')),
+    'cli-no-input': ([MAIN], ('numpy', 'matplotlib')),
+    'svg-backend': (['-c', 'import visualizer.pipeline'], ('matplotlib',)),
+    'matplotlib-backend': (['-c', 'import visualizer.pipeline, visualizer.visualizers'], ()),
+}
+
+
+def run_importtime(arguments):
+    """Return {module: (self_us, cumulative_us, depth)} for one run."""
+    process = subprocess.run([sys.executable, '-X', 'importtime'] + arguments,
+                             cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                             text=True)
+    modules = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules[name.strip()] = (int(self_us), int(cumulative_us), depth)
+    return modules
+
+
+def measure(arguments, number):
+    totals = []
+    modules = {}
+    for _ in range(number):
+        modules = run_importtime(arguments)
+        # top-level entries contain the time of everything they import
+        totals.append(sum(x[1] for x in modules.values() if x[2] == 0))
+    return statistics.median(totals), modules
+
+
+def main():
+    argument_parser = argparse.ArgumentParser()
+    argument_parser.add_argument('-n', '--number',
+                                 type=int,
+                                 default=5,
+                                 help='runs per scenario (the median is reported)')
+    argument_parser.add_argument('--top',
+                                 type=int,
+                                 default=5,
+                                 help='number of heaviest top-level imports to list per scenario')
+    argument_parser.add_argument('--baseline',
+                                 type=str,
+                                 required=False,
+                                 help='JSON file of a previous run to compare against')
+    argument_parser.add_argument('--tolerance',
+                                 type=float,
+                                 default=0.25,
+                                 help='allowed relative slowdown against the baseline')
+    argument_parser.add_argument('--save-baseline',
+                                 type=str,
+                                 required=False,
+                                 help='write the results to this JSON file')
+    args = argument_parser.parse_args()
+
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    results = {}
+    failures = []
+    for name, (arguments, forbidden) in SCENARIOS.items():
+        total_us, modules = measure(arguments, args.number)
+        results[name] = total_us / 1000
+        line = "{:20s} {:9.1f} ms".format(name, total_us / 1000)
+        if baseline is not None and name in baseline:
+            limit = baseline[name] * (1 + args.tolerance)
+            line += "   baseline {:9.1f} ms".format(baseline[name])
+            if results[name] > limit:
+                line += "   REGRESSION"
+                failures.append(name)
+        print(line)
+        heaviest = sorted(((x[1], m) for m, x in modules.items() if x[2] == 0), reverse=True)[:args.top]
+        for cumulative_us, module in heaviest:
+            print("    {:9.1f} ms  {}".format(cumulative_us / 1000, module))
+        imported = [m for m in forbidden if m in modules]
+        if imported:
+            print("    imports {}".format(', '.join(imported)))
+            failures.append(name)
+
+    if args.save_baseline is not None:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=1)
+    if failures:
+        print("FAILED: {}".format(', '.join(failures)))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Check that both layout engines give identical units on a corpus, and time them.
+
+Also reports how many slur groups the vectorized engine leaves to the loop engine's
+state machine (see `get_visualize_unit_table_arrays`).
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import core.parsers
+from core.parsers import *
+
+
+def unit_key(unit):
+    return str(unit.text_lyric), str(unit.text_phoneme), unit.offset, unit.duration, unit.midi_pitch, unit.category
+
+
+def count_fallback_groups(segments) -> tuple:
+    """Slur groups of `segments` (`SegmentArrays`) laid out by the state machine, and all slur groups."""
+    calls = []
+    layout_slur_group = core.parsers._layout_slur_group
+
+    def counting(*args):
+        calls.append(None)
+        return layout_slur_group(*args)
+
+    core.parsers._layout_slur_group = counting
+    try:
+        for segment in segments:
+            get_visualize_unit_table_arrays(segment)
+    finally:
+        core.parsers._layout_slur_group = layout_slur_group
+    groups = sum(1 + int((~segment.note_slur[1:]).sum()) for segment in segments if len(segment.note_slur) > 0)
+    return len(calls), groups
+
+
+def main():
+    argument_parser = argparse.ArgumentParser()
+    argument_parser.add_argument('-i', '--input',
+                                 type=str,
+                                 nargs='+',
+                                 required=True,
+                                 help='.ds project files or glob patterns')
+    args = argument_parser.parse_args()
+
+    filenames = []
+    for item in args.input:
+        filenames.extend(sorted(glob.glob(item, recursive=True)) if glob.has_magic(item) else [item])
+
+    mismatches = 0
+    segments = 0
+    fallback_groups = 0
+    groups = 0
+    time_loop = 0.0
+    time_vectorized = 0.0
+    for filename in filenames:
+        with open(filename, 'r', encoding='utf-8') as f:
+            ds = json.load(f)
+        if not isinstance(ds, list):
+            ds = [ds]
+        for index, raw_segment in enumerate(ds):
+            start = time.perf_counter()
+            segment = parse_segment(raw_segment)
+            if segment is None:
+                continue
+            units_loop = get_visualize_unit_table_segment(segment)
+            time_loop += time.perf_counter() - start
+
+            start = time.perf_counter()
+            segment_arrays = parse_segment_arrays(raw_segment)
+            units_vectorized = get_visualize_unit_table_arrays(segment_arrays)
+            time_vectorized += time.perf_counter() - start
+            counts = count_fallback_groups([segment_arrays])
+            fallback_groups += counts[0]
+            groups += counts[1]
+
+            segments += 1
+            if [unit_key(x) for x in units_loop.to_units()] != [unit_key(x) for x in units_vectorized.to_units()]:
+                mismatches += 1
+                print("MISMATCH: {} segment {}".format(filename, index))
+
+    print("{} file(s), {} segment(s), {} mismatch(es)".format(len(filenames), segments, mismatches))
+    print("fallback:   {} of {} slur group(s)".format(fallback_groups, groups))
+    print("loop:       {:10.2f} ms".format(time_loop * 1000))
+    print("vectorized: {:10.2f} ms".format(time_vectorized * 1000))
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Check `notes_to_midi` against `note_to_midi` on every spelling, and time both."""
+
+import itertools
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from utils import *
+
+SHARPS = ['#', '♯', '\U0001d12a']
+FLATS = ['b', 'B', '♭', '\U0001d12b']
+# invalid accidentals and junk exercise the memoized fallback
+OTHERS = ['x', 'X', '-', ' ', 's', '#b', 'b#', '♯b']
+
+
+def all_spellings():
+    accidentals = [''] + [''.join(x) for n in (1, 2, 3) for x in itertools.product(SHARPS + FLATS, repeat=n)] + OTHERS
+    letters = 'ABCDEFGHabcdefgh'
+    octaves = [str(x) for x in range(-12, 21)] + ['', '-', '00', '04', '+4']
+    for letter, accidental, octave in itertools.product(letters, accidentals, octaves):
+        yield letter + accidental + octave
+    for word in ('rest', 'REST', 'Rest', 'rEsT', 'r', 'res', 'rest4', '', 'C4C5', 'xC4', 'C4 ', ' C4', '4'):
+        yield word
+
+
+def main():
+    spellings = list(all_spellings())
+    expected = np.array([note_to_midi(x) for x in spellings], dtype=np.int64)
+    actual = notes_to_midi(spellings)
+    mismatches = np.flatnonzero(expected != actual)
+    for index in mismatches[:20].tolist():
+        print("MISMATCH: {!r}: note_to_midi {} != notes_to_midi {}".format(
+            spellings[index], expected[index], actual[index]))
+    print("{} spelling(s), {} mismatch(es)".format(len(spellings), len(mismatches)))
+
+    # a typical note_seq: a few distinct names repeated many times
+    rng = np.random.default_rng(0)
+    names = ['rest'] + ['{}{}{}'.format(letter, accidental, octave)
+                        for letter in 'CDEFGAB' for accidental in ('', '#', 'b') for octave in (3, 4, 5)]
+    note_seq = np.array(names)[rng.integers(0, len(names), 5000)]
+    number = 20
+    time_scalar = timeit.timeit(lambda: [note_to_midi(x) for x in note_seq], number=number) / number
+    time_vectorized = timeit.timeit(lambda: notes_to_midi(note_seq), number=number) / number
+    print("note_to_midi:  {:8.3f} ms per {} notes".format(time_scalar * 1000, len(note_seq)))
+    print("notes_to_midi: {:8.3f} ms per {} notes".format(time_vectorized * 1000, len(note_seq)))
+    return 1 if len(mismatches) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
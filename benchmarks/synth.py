@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Synthetic .ds projects of a given size and shape, for benchmarks.
+
+Every segment starts with a rest and holds `notes` notes, of which about `slur_ratio`
+are slurs; each word has `phonemes` phonemes in DiffSinger's order: the vowel (a body)
+first, then the consonants leading into the next word, the last of which is the
+head. The pitch curve covers the whole segment at `f0_timestep`, with unvoiced
+gaps. The output only depends on the arguments and `seed`.
+"""
+
+import argparse
+import json
+import sys
+
+import numpy as np
+
+NOTE_NAMES = ['C', 'C#', 'D', 'Eb', 'E', 'F', 'F#', 'G', 'Ab', 'A', 'Bb', 'B']
+CONSONANTS = ['k', 't', 'sh', 'zh', 'l', 'm', 'n', 'ch']
+VOWELS = ['a', 'i', 'u', 'e', 'o']
+
+
+def _format(values, precision):
+    return ' '.join('{:.{}f}'.format(x, precision) for x in values)
+
+
+def make_segment(rng: "np.random.Generator", offset: float = 0.0,
+                 notes: int = 100,
+                 slur_ratio: float = 0.2,
+                 phonemes: int = 2,
+                 f0_timestep: float = 0.005) -> dict:
+    """One raw segment as found in a .ds file."""
+    notes = max(notes, 1)
+    phonemes = max(phonemes, 1)
+    # the leading rest (SP) is never a slur, neither is the first sung note
+    note_slur = (rng.random(notes) < slur_ratio).astype(np.int64)
+    note_slur[:2] = 0
+    note_dur = np.round(rng.uniform(0.08, 0.5, notes), 3)
+    note_dur[0] = 0.4
+    note_midi = rng.integers(55, 77, notes)
+    note_seq = ['rest'] + ['{}{}'.format(NOTE_NAMES[x % 12], x // 12 - 1) for x in note_midi[1:].tolist()]
+
+    text = []
+    ph_seq = []
+    ph_dur = []
+    ph_num = []
+    word_starts = np.flatnonzero(note_slur == 0)
+    word_ends = np.append(word_starts[1:], notes)
+    for w, (start, end) in enumerate(zip(word_starts.tolist(), word_ends.tolist())):
+        duration = float(note_dur[start:end].sum())
+        if w == 0:
+            text.append('SP')
+            ph_seq.append('SP')
+            ph_dur.append(duration)
+            ph_num.append(1)
+            continue
+        text.append('la{}'.format(w))
+        # consonants are short, the vowel takes what is left of the word
+        names = [VOWELS[int(rng.integers(0, len(VOWELS)))]]
+        names.extend(CONSONANTS[x] for x in rng.integers(0, len(CONSONANTS), phonemes - 1).tolist())
+        consonant_dur = min(0.05, duration / (2 * phonemes))
+        ph_seq.extend(names)
+        ph_dur.extend([duration - consonant_dur * (phonemes - 1)] + [consonant_dur] * (phonemes - 1))
+        ph_num.append(phonemes)
+
+    # note pitches with vibrato, unvoiced in rests and before about one word in eight
+    f0_len = max(int(note_dur.sum() / f0_timestep), 1)
+    t = np.arange(1, f0_len + 1) * f0_timestep
+    note_index = np.minimum(np.searchsorted(np.cumsum(note_dur), t), notes - 1)
+    f0_midi = note_midi[note_index] + 0.3 * np.sin(2 * np.pi * 5.5 * t)
+    f0 = 440.0 * 2 ** ((f0_midi - 69) / 12)
+    unvoiced_words = word_starts[rng.random(len(word_starts)) < 0.125]
+    f0[np.isin(note_index, unvoiced_words) | (note_index == 0)] = 0.0
+
+    return {
+        'offset': round(offset, 3),
+        'text': ' '.join(text),
+        'ph_seq': ' '.join(ph_seq),
+        'ph_dur': _format(ph_dur, 3),
+        'ph_num': ' '.join(str(x) for x in ph_num),
+        'note_seq': ' '.join(note_seq),
+        'note_dur': _format(note_dur, 3),
+        'note_slur': ' '.join(str(x) for x in note_slur.tolist()),
+        'f0_seq': _format(f0, 1),
+        'f0_timestep': str(f0_timestep),
+    }
+
+
+def make_project(segments: int = 10,
+                 notes: int = 100,
+                 slur_ratio: float = 0.2,
+                 phonemes: int = 2,
+                 f0_timestep: float = 0.005,
+                 seed: int = 0) -> list:
+    """A list of `segments` raw segments placed one after the other with a short gap."""
+    rng = np.random.default_rng(seed)
+    project = []
+    offset = 0.0
+    for _ in range(segments):
+        segment = make_segment(rng, offset, notes=notes, slur_ratio=slur_ratio, phonemes=phonemes,
+                               f0_timestep=f0_timestep)
+        project.append(segment)
+        offset += sum(float(x) for x in segment['note_dur'].split()) + 0.5
+    return project
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    argument_parser.add_argument('-o', '--output',
+                                 type=str,
+                                 required=True,
+                                 help='.ds file to write')
+    argument_parser.add_argument('--segments',
+                                 type=int,
+                                 default=10,
+                                 help='number of segments')
+    argument_parser.add_argument('--notes',
+                                 type=int,
+                                 default=100,
+                                 help='notes per segment, including the leading rest')
+    argument_parser.add_argument('--slur-ratio',
+                                 type=float,
+                                 default=0.2,
+                                 help='fraction of notes that are slurs')
+    argument_parser.add_argument('--phonemes',
+                                 type=int,
+                                 default=2,
+                                 help='phonemes per word')
+    argument_parser.add_argument('--f0-timestep',
+                                 type=float,
+                                 default=0.005,
+                                 help='pitch curve timestep in seconds')
+    argument_parser.add_argument('--seed',
+                                 type=int,
+                                 default=0,
+                                 help='random seed')
+    args = argument_parser.parse_args()
+
+    project = make_project(segments=args.segments, notes=args.notes, slur_ratio=args.slur_ratio,
+                           phonemes=args.phonemes, f0_timestep=args.f0_timestep, seed=args.seed)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(project, f, ensure_ascii=False, indent=1)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+__all__ = [
+    'NoteStatistics',
+    'PhonemeStatistics',
+    'FileAnalysis',
+    'note_statistics',
+    'phoneme_statistics',
+    'analyze_segments',
+    'analyze_file',
+    'write_note_csv',
+    'write_phoneme_csv'
+]
+
+import csv
+from dataclasses import dataclass, field, fields
+from typing import Iterable, List, Optional
+
+import numpy as np
+
+from .binary import *
+from .models import *
+from .parsers import *
+from .readers import *
+from .validation import *
+
+# quantiles of the phoneme duration distributions
+_QUANTILES = (('p10', 0.1), ('median', 0.5), ('p90', 0.9))
+
+
+@dataclass
+class NoteStatistics:
+    """Pitch and timing statistics per note (parallel arrays, one item per note).
+
+    The f0 samples drawn within a note's time span (sample i at `offset + (i + 1) *
+    timestep`) are compared to its `midi_pitch`: `*_cents` are the signed mean, the
+    mean absolute and the largest absolute deviation of the voiced samples, NaN for
+    rests and notes without voiced samples. `voiced_ratio` is the voiced share of the
+    samples, NaN for notes that span no sample. `start` is in seconds from the start
+    of the project.
+    """
+    segment: "np.array" = field(default_factory=lambda: np.array([], dtype=np.int64))
+    note: "np.array" = field(default_factory=lambda: np.array([], dtype=np.int64))
+    lyric: "np.array" = field(default_factory=lambda: np.array([], dtype=str))
+    midi_pitch: "np.array" = field(default_factory=lambda: np.array([], dtype=np.int64))
+    slur: "np.array" = field(default_factory=lambda: np.array([], dtype=bool))
+    start: "np.array" = field(default_factory=lambda: np.array([], dtype=np.float64))
+    duration: "np.array" = field(default_factory=lambda: np.array([], dtype=np.float64))
+    f0_samples: "np.array" = field(default_factory=lambda: np.array([], dtype=np.int64))
+    voiced_ratio: "np.array" = field(default_factory=lambda: np.array([], dtype=np.float64))
+    mean_cents: "np.array" = field(default_factory=lambda: np.array([], dtype=np.float64))
+    mean_abs_cents: "np.array" = field(default_factory=lambda: np.array([], dtype=np.float64))
+    max_abs_cents: "np.array" = field(default_factory=lambda: np.array([], dtype=np.float64))
+
+    def __len__(self):
+        return len(self.note)
+
+    @classmethod
+    def concatenate(cls, tables: List['NoteStatistics']) -> 'NoteStatistics':
+        if not tables:
+            return cls()
+        return cls(**{x.name: np.concatenate([getattr(t, x.name) for t in tables]) for x in fields(cls)})
+
+
+@dataclass
+class PhonemeStatistics:
+    """Duration distribution (seconds) per phoneme symbol, sorted by symbol."""
+    phoneme: "np.array" = field(default_factory=lambda: np.array([], dtype=str))
+    count: "np.array" = field(default_factory=lambda: np.array([], dtype=np.int64))
+    mean: "np.array" = field(default_factory=lambda: np.array([], dtype=np.float64))
+    std: "np.array" = field(default_factory=lambda: np.array([], dtype=np.float64))
+    min: "np.array" = field(default_factory=lambda: np.array([], dtype=np.float64))
+    p10: "np.array" = field(default_factory=lambda: np.array([], dtype=np.float64))
+    median: "np.array" = field(default_factory=lambda: np.array([], dtype=np.float64))
+    p90: "np.array" = field(default_factory=lambda: np.array([], dtype=np.float64))
+    max: "np.array" = field(default_factory=lambda: np.array([], dtype=np.float64))
+
+    def __len__(self):
+        return len(self.phoneme)
+
+
+@dataclass
+class FileAnalysis:
+    """Statistics of one project file: its notes, and the symbols and durations of all its phonemes."""
+    filename: Optional[str] = None
+    segments: int = 0
+    notes: NoteStatistics = field(default_factory=NoteStatistics)
+    ph_seq: "np.array" = field(default_factory=lambda: np.array([], dtype=str))
+    ph_dur: "np.array" = field(default_factory=lambda: np.array([], dtype=np.float64))
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def note_statistics(segment: SegmentArrays, index: int = 0) -> NoteStatistics:
+    """Statistics of every note of a segment (see `NoteStatistics`), computed over the whole segment at once."""
+    count = len(segment.note_dur)
+    start = segment.offset + segment.note_offset
+    end = start + segment.note_dur
+    pitch_curve = segment.pitch_curve
+    sample_t = segment.offset + np.arange(1, len(pitch_curve.f0) + 1) * pitch_curve.timestep
+    sample_midi = pitch_curve.get_midi_pitch()
+
+    # samples of note k are lo[k]:hi[k]; `sample_note` maps the gathered samples back to their note
+    lo = np.searchsorted(sample_t, start, side='left')
+    hi = np.maximum(np.searchsorted(sample_t, end, side='left'), lo)
+    samples = hi - lo
+    sample_note = np.repeat(np.arange(count), samples)
+    first = np.cumsum(samples) - samples
+    sample_index = np.arange(len(sample_note)) - first[sample_note] + lo[sample_note]
+
+    note_midi = np.where(segment.note_midi >= 0, segment.note_midi, np.nan)
+    deviation = 100 * (sample_midi[sample_index] - note_midi[sample_note])
+    voiced = np.bincount(sample_note, weights=np.isfinite(sample_midi[sample_index]), minlength=count)
+    valid = np.isfinite(deviation)
+    valid_note = sample_note[valid]
+    deviation = deviation[valid]
+    deviation_count = np.bincount(valid_note, minlength=count)
+    deviation_sum = np.bincount(valid_note, weights=deviation, minlength=count)
+    deviation_abs_sum = np.bincount(valid_note, weights=np.abs(deviation), minlength=count)
+    max_abs_cents = np.full(count, np.nan)
+    if len(valid_note) > 0:
+        # the samples of a note are contiguous, so every run of `valid_note` is one note
+        runs = np.flatnonzero(np.concatenate([[True], valid_note[1:] != valid_note[:-1]]))
+        max_abs_cents[valid_note[runs]] = np.maximum.reduceat(np.abs(deviation), runs)
+
+    def ratio(a, b):
+        return np.divide(a, b, out=np.full(count, np.nan), where=b > 0)
+
+    return NoteStatistics(segment=np.full(count, index, dtype=np.int64),
+                          note=np.arange(count, dtype=np.int64),
+                          lyric=np.where(segment.note_slur, '-', segment.text[segment.note_word]),
+                          midi_pitch=segment.note_midi.astype(np.int64),
+                          slur=segment.note_slur.astype(bool),
+                          start=start,
+                          duration=segment.note_dur.astype(np.float64),
+                          f0_samples=samples.astype(np.int64),
+                          voiced_ratio=ratio(voiced, samples),
+                          mean_cents=ratio(deviation_sum, deviation_count),
+                          mean_abs_cents=ratio(deviation_abs_sum, deviation_count),
+                          max_abs_cents=max_abs_cents)
+
+
+def phoneme_statistics(ph_seq: "np.array", ph_dur: "np.array") -> PhonemeStatistics:
+    """Duration distribution per phoneme symbol of the phonemes `ph_seq` with durations `ph_dur`."""
+    if len(ph_seq) == 0:
+        return PhonemeStatistics()
+    symbols, symbol_index = np.unique(ph_seq, return_inverse=True)
+    symbol_index = symbol_index.ravel()
+    ph_dur = np.asarray(ph_dur, dtype=np.float64)
+    count = np.bincount(symbol_index, minlength=len(symbols))
+    mean = np.bincount(symbol_index, weights=ph_dur, minlength=len(symbols)) / count
+    variance = np.bincount(symbol_index, weights=(ph_dur - mean[symbol_index]) ** 2, minlength=len(symbols)) / count
+
+    # durations sorted within each symbol; quantiles interpolate linearly like `np.quantile`
+    durations = ph_dur[np.lexsort((ph_dur, symbol_index))]
+    first = np.cumsum(count) - count
+
+    def quantile(q):
+        position = first + q * (count - 1)
+        below = np.floor(position).astype(np.int64)
+        above = np.ceil(position).astype(np.int64)
+        return durations[below] + (durations[above] - durations[below]) * (position - below)
+
+    return PhonemeStatistics(phoneme=symbols, count=count, mean=mean, std=np.sqrt(variance),
+                             min=durations[first], max=durations[first + count - 1],
+                             **{name: quantile(q) for name, q in _QUANTILES})
+
+
+def analyze_segments(segments: Iterable[SegmentArrays], filename: Optional[str] = None) -> FileAnalysis:
+    analysis = FileAnalysis(filename=filename)
+    notes = []
+    ph_seq = []
+    ph_dur = []
+    for segment in segments:
+        notes.append(note_statistics(segment, analysis.segments))
+        ph_seq.append(segment.ph_seq)
+        ph_dur.append(segment.ph_dur)
+        analysis.segments += 1
+    analysis.notes = NoteStatistics.concatenate(notes)
+    if ph_seq:
+        analysis.ph_seq = np.concatenate(ph_seq)
+        analysis.ph_dur = np.concatenate(ph_dur)
+    return analysis
+
+
+def _parse_all(raw_segments: Iterable) -> Iterable[SegmentArrays]:
+    for index, raw_segment in enumerate(raw_segments):
+        try:
+            segment = parse_segment_arrays(raw_segment)
+        except (KeyError, TypeError, ValueError, AttributeError):
+            segment = None
+        if segment is None:
+            raise invalid_segment_error(raw_segment, index)
+        yield segment
+
+
+def analyze_file(filename: str) -> FileAnalysis:
+    """Statistics of a .ds file or binary track. Raises `FileNotFoundError` and, for segments that cannot be parsed, `ValueError`."""
+    if is_track_binary(filename):
+        return analyze_segments(read_track_binary(filename), filename)
+    with open(filename, 'r', encoding='utf-8') as f:
+        return analyze_segments(_parse_all(iter_segments(f)), filename)
+
+
+def _format(values: "np.array", digits: int) -> List[str]:
+    # fixed decimals, NaN as an empty cell
+    return ['' if x != x else '{:.{}f}'.format(x, digits) for x in values.tolist()]
+
+
+def write_note_csv(analyses: Iterable[FileAnalysis], filename: str):
+    """Write the notes of all analyses as one CSV table, a row per note, led by the file it belongs to."""
+    with open(filename, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['file'] + [x.name for x in fields(NoteStatistics)])
+        for analysis in analyses:
+            notes = analysis.notes
+            if len(notes) == 0:
+                continue
+            writer.writerows(zip([analysis.filename] * len(notes),
+                                 notes.segment.tolist(), notes.note.tolist(), notes.lyric.tolist(),
+                                 notes.midi_pitch.tolist(), notes.slur.astype(np.int8).tolist(),
+                                 _format(notes.start, 4), _format(notes.duration, 4), notes.f0_samples.tolist(),
+                                 _format(notes.voiced_ratio, 3), _format(notes.mean_cents, 1),
+                                 _format(notes.mean_abs_cents, 1), _format(notes.max_abs_cents, 1)))
+
+
+def write_phoneme_csv(statistics: PhonemeStatistics, filename: str):
+    """Write phoneme duration distributions as a CSV table, a row per phoneme symbol."""
+    columns = [x.name for x in fields(PhonemeStatistics)]
+    with open(filename, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        writer.writerows(zip(statistics.phoneme.tolist(), statistics.count.tolist(),
+                             *[_format(getattr(statistics, x), 4) for x in columns[2:]]))
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+__all__ = [
+    'TRACK_BINARY_EXTENSION',
+    'BinaryTrack',
+    'is_track_binary',
+    'write_track_binary',
+    'read_track_binary'
+]
+
+import json
+import os
+import struct
+from typing import Dict, Iterable, Iterator
+
+import numpy as np
+
+from .models import *
+
+TRACK_BINARY_EXTENSION = '.dsb'
+
+# file layout: magic, header length (uint64, little endian), JSON header, then the
+# arrays, each starting at a multiple of `_ALIGNMENT` bytes
+_MAGIC = b'DSTRACK\x00'
+_FORMAT_VERSION = 1
+_ALIGNMENT = 64
+
+# per-note, per-phoneme and per-word arrays of `SegmentArrays`, concatenated over all
+# segments; `note_word` and `ph_word` stay relative to their segment
+_NOTE_FIELDS = ('note_midi', 'note_dur', 'note_offset', 'note_slur', 'note_word')
+_PH_FIELDS = ('ph_dur', 'ph_category', 'ph_word')
+
+
+def is_track_binary(filename: str) -> bool:
+    return os.path.splitext(filename)[1].lower() == TRACK_BINARY_EXTENSION
+
+
+def _bounds(lengths) -> "np.array":
+    bounds = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=bounds[1:])
+    return bounds
+
+
+def write_track_binary(segments: Iterable[SegmentArrays], filename: str):
+    """Write parsed segments into one memory-mappable file (see `BinaryTrack`)."""
+    segments = list(segments)
+    strings: Dict[str, int] = {}
+
+    def string_indexes(values):
+        return np.array([strings.setdefault(x, len(strings)) for x in values.tolist()], dtype=np.int32)
+
+    def concatenate(values, dtype):
+        return np.concatenate([np.asarray(x, dtype=dtype) for x in values]) if values else np.zeros(0, dtype=dtype)
+
+    arrays = {
+        'segment_offset': np.array([x.offset for x in segments], dtype=np.float64),
+        'segment_f0_timestep': np.array([x.pitch_curve.timestep for x in segments], dtype=np.float64),
+        'segment_word_bounds': _bounds([len(x.text) for x in segments]),
+        'segment_note_bounds': _bounds([len(x.note_dur) for x in segments]),
+        'segment_ph_bounds': _bounds([len(x.ph_dur) for x in segments]),
+        'segment_f0_bounds': _bounds([len(x.pitch_curve.f0) for x in segments]),
+        'text': concatenate([string_indexes(x.text) for x in segments], np.int32),
+        'ph_seq': concatenate([string_indexes(x.ph_seq) for x in segments], np.int32),
+        'f0': concatenate([x.pitch_curve.f0 for x in segments], np.float64),
+    }
+    defaults = SegmentArrays()
+    for name in _NOTE_FIELDS + _PH_FIELDS:
+        arrays[name] = concatenate([getattr(x, name) for x in segments], getattr(defaults, name).dtype)
+    encoded = [x.encode('utf-8') for x in strings]
+    arrays['strings_data'] = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    arrays['strings_bounds'] = _bounds([len(x) for x in encoded])
+
+    # lay out the arrays behind a header that is padded to the alignment
+    layout = {}
+    position = 0
+    for name, array in arrays.items():
+        layout[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': position}
+        position += -(-array.nbytes // _ALIGNMENT) * _ALIGNMENT
+    header = json.dumps({'version': _FORMAT_VERSION, 'segments': len(segments), 'arrays': layout},
+                        separators=(',', ':')).encode('utf-8')
+    data_start = -(-(len(_MAGIC) + 8 + len(header)) // _ALIGNMENT) * _ALIGNMENT
+    header = header.ljust(data_start - len(_MAGIC) - 8)
+
+    # written next to the destination and moved into place, so readers never see half a file
+    tmp_path = '{}.{}.tmp'.format(filename, os.getpid())
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(_MAGIC)
+            f.write(struct.pack('<Q', len(header)))
+            f.write(header)
+            for name, array in arrays.items():
+                f.write(np.ascontiguousarray(array).tobytes())
+                f.write(b'\x00' * (-array.nbytes % _ALIGNMENT))
+        os.replace(tmp_path, filename)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class BinaryTrack:
+    """Track file written by `write_track_binary`, memory-mapped.
+
+    `arrays` holds the concatenated arrays of all segments as read-only views into
+    the file, e.g. `arrays['note_midi']` or `arrays['f0']`; `segment_*_bounds[i]`
+    is where segment i starts in them. `strings` is the decoded string table that
+    `text` and `ph_seq` index into. Segments are read as `SegmentArrays` whose numeric
+    arrays are views as well, so nothing is parsed or copied except the strings.
+    """
+
+    def __init__(self, filename: str):
+        with open(filename, 'rb') as f:
+            magic = f.read(len(_MAGIC))
+            if magic != _MAGIC:
+                raise ValueError("Not a binary track file: {}".format(filename))
+            header_length, = struct.unpack('<Q', f.read(8))
+            header = json.loads(f.read(header_length).decode('utf-8'))
+        if header['version'] != _FORMAT_VERSION:
+            raise ValueError("Unsupported binary track version {} in {}".format(header['version'], filename))
+        data_start = len(_MAGIC) + 8 + header_length
+        buffer = np.memmap(filename, dtype=np.uint8, mode='r')
+        self.arrays: Dict[str, "np.array"] = {}
+        for name, spec in header['arrays'].items():
+            dtype = np.dtype(spec['dtype'])
+            count = int(np.prod(spec['shape'], dtype=np.int64))
+            start = data_start + spec['offset']
+            self.arrays[name] = buffer[start:start + count * dtype.itemsize].view(dtype).reshape(spec['shape'])
+        data = self.arrays['strings_data'].tobytes()
+        bounds = self.arrays['strings_bounds'].tolist()
+        self.strings = np.array([data[a:b].decode('utf-8') for a, b in zip(bounds[:-1], bounds[1:])], dtype=str)
+        self._length = header['segments']
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self) -> Iterator[SegmentArrays]:
+        for index in range(self._length):
+            yield self.segment(index)
+
+    def segment(self, index: int) -> SegmentArrays:
+        a = self.arrays
+        words = slice(*a['segment_word_bounds'][index:index + 2].tolist())
+        notes = slice(*a['segment_note_bounds'][index:index + 2].tolist())
+        phonemes = slice(*a['segment_ph_bounds'][index:index + 2].tolist())
+        f0 = slice(*a['segment_f0_bounds'][index:index + 2].tolist())
+        segment = SegmentArrays(offset=float(a['segment_offset'][index]),
+                                text=self.strings[a['text'][words]],
+                                ph_seq=self.strings[a['ph_seq'][phonemes]],
+                                pitch_curve=PitchCurve(f0=a['f0'][f0],
+                                                       timestep=float(a['segment_f0_timestep'][index])))
+        for name in _NOTE_FIELDS:
+            setattr(segment, name, a[name][notes])
+        for name in _PH_FIELDS:
+            setattr(segment, name, a[name][phonemes])
+        return segment
+
+    def to_track(self) -> Track:
+        return Track(segments=[x.to_segment() for x in self])
+
+
+def read_track_binary(filename: str) -> BinaryTrack:
+    return BinaryTrack(filename)
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+__all__ = [
+    'segment_span',
+    'TrackIndex'
+]
+
+from typing import Dict, List, Mapping, Sequence, Tuple, Union
+
+import numpy as np
+
+from .models import *
+from .parsers import *
+
+
+def segment_span(segment: Union[Mapping, Segment, SegmentArrays]) -> Tuple[float, float]:
+    """Start and end time (seconds) of everything drawn for a segment: its notes, phonemes and pitch curve.
+
+    Works on raw segments of a .ds file as well, parsing only the durations; those
+    raise `KeyError`, `TypeError` or `ValueError` if they are malformed.
+    """
+    if isinstance(segment, SegmentArrays):
+        offset = segment.offset
+        length = max(float(segment.note_dur.sum()), float(segment.ph_dur.sum()))
+        f0_length = len(segment.pitch_curve.f0) * segment.pitch_curve.timestep
+    elif isinstance(segment, Segment):
+        offset = segment.offset
+        length = max(sum(x.duration for x in segment.notes),
+                     sum(p.duration for x in segment.notes for p in x.phonemes))
+        f0_length = len(segment.pitch_curve.f0) * segment.pitch_curve.timestep
+    else:
+        offset = float(segment.get('offset', 0.0))
+        length = max(float(np.array(segment['note_dur'].split(), dtype=np.float64).sum()),
+                     float(np.array(segment['ph_dur'].split(), dtype=np.float64).sum()))
+        f0_length = len(segment['f0_seq'].split()) * float(segment['f0_timestep'])
+    return offset, offset + max(length, f0_length, 0.0)
+
+
+def _overlapping(starts: "np.array", max_ends: "np.array", t0: float, t1: float) -> Tuple[int, int]:
+    # range of items, sorted by start, that may overlap [t0, t1): they start before t1, and
+    # the running maximum of the ends says from where on an item may end after t0
+    return int(np.searchsorted(max_ends, t0, side='right')), int(np.searchsorted(starts, t1, side='left'))
+
+
+class TrackIndex:
+    """Interval index over the segments of a track, their visualize units and pitch samples.
+
+    Segment spans (see `segment_span`) are sorted by start time, with a running
+    maximum of the end times, so that the segments overlapping a time window are
+    found with two binary searches even if segments overlap each other. The unit
+    table of a segment is laid out the first time a window touches it, and indexed
+    the same way; pitch sample ranges follow from the sample times. Queries then cost
+    in proportion to what lies in the window, not to the length of the track.
+    """
+
+    def __init__(self, segments: Union[Track, Sequence[Union[Segment, SegmentArrays]]]):
+        self.segments = list(segments.segments if isinstance(segments, Track) else segments)
+        spans = np.array([segment_span(x) for x in self.segments], dtype=np.float64).reshape(-1, 2)
+        self._order = np.argsort(spans[:, 0], kind='stable')
+        self.starts = spans[self._order, 0]
+        self.ends = spans[self._order, 1]
+        self._max_ends = np.maximum.accumulate(self.ends) if len(self.ends) > 0 else self.ends
+        self._units: Dict[int, Tuple[VisualizeUnitTable, "np.array", "np.array"]] = {}
+
+    def __len__(self):
+        return len(self.segments)
+
+    @property
+    def start(self) -> float:
+        return float(self.starts[0]) if len(self.starts) > 0 else 0.0
+
+    @property
+    def end(self) -> float:
+        return float(self._max_ends[-1]) if len(self._max_ends) > 0 else 0.0
+
+    def segments_in(self, t0: float, t1: float) -> List[int]:
+        """Indexes of the segments overlapping [t0, t1), in order of their start."""
+        lo, hi = _overlapping(self.starts, self._max_ends, t0, t1)
+        positions = np.arange(lo, max(lo, hi))[self.ends[lo:hi] > t0]
+        return self._order[positions].tolist()
+
+    def units(self, index: int) -> VisualizeUnitTable:
+        """Visualize units of segment `index`, laid out on first use."""
+        return self._unit_entry(index)[0]
+
+    def _unit_entry(self, index: int):
+        entry = self._units.get(index)
+        if entry is None:
+            segment = self.segments[index]
+            if isinstance(segment, SegmentArrays):
+                units = get_visualize_unit_table_arrays(segment)
+            else:
+                units = get_visualize_unit_table_segment(segment)
+            order = np.argsort(units.offset, kind='stable')
+            ends = units.offset[order] + units.duration[order]
+            max_ends = np.maximum.accumulate(ends) if len(ends) > 0 else ends
+            entry = self._units[index] = (units, order, max_ends)
+        return entry
+
+    def units_in(self, index: int, t0: float, t1: float) -> "np.array":
+        """Positions in `units(index)` of the units overlapping [t0, t1), in time order."""
+        units, order, max_ends = self._unit_entry(index)
+        starts = units.offset[order]
+        lo, hi = _overlapping(starts, max_ends, t0, t1)
+        positions = order[lo:max(lo, hi)]
+        return positions[units.offset[positions] + units.duration[positions] > t0]
+
+    def f0_range(self, index: int, t0: float, t1: float) -> slice:
+        """Samples of the pitch curve of segment `index` drawn within [t0, t1]."""
+        segment = self.segments[index]
+        timestep = segment.pitch_curve.timestep
+        count = len(segment.pitch_curve.f0)
+        # sample i is drawn at offset + (i + 1) * timestep
+        lo = int(np.ceil((t0 - segment.offset) / timestep - 1 - 1e-9))
+        hi = int(np.floor((t1 - segment.offset) / timestep - 1 + 1e-9)) + 1
+        return slice(min(max(lo, 0), count), min(max(hi, 0), count))
@@ -3,17 +3,27 @@
 __all__ = [
     'PhonemeCategory', 'Phoneme',
     'Note', 'PitchCurve',
-    'Segment', 'Track',
-    'VisualizeUnit', 'Label'
+    'Segment', 'SegmentArrays', 'Track',
+    'VisualizeUnit', 'VisualizeUnitTable',
+    'Label', 'SegmentPrimitives'
 ]
 
 import enum
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, fields
 from typing import List, Mapping, Optional
 
 import numpy as np
 
 
+def _slotted(cls):
+    # rebuild a dataclass with `__slots__` for its fields, like `dataclass(slots=True)` of
+    # Python 3.10+: instances have no `__dict__`, which saves memory when there are many
+    names = tuple(x.name for x in fields(cls))
+    cls_dict = {k: v for k, v in cls.__dict__.items() if k not in names + ('__dict__', '__weakref__')}
+    cls_dict['__slots__'] = names
+    return type(cls)(cls.__name__, cls.__bases__, cls_dict)
+
+
 class PhonemeCategory(enum.Enum):
     BODY = enum.auto()  # usually vowel
     HEAD = enum.auto()  # usually consonant
@@ -21,6 +31,7 @@ class PhonemeCategory(enum.Enum):
     AP = enum.auto()  # aspiration
 
 
+@_slotted
 @dataclass
 class Phoneme:
     name: str = ''
@@ -28,6 +39,7 @@ class Phoneme:
     category: PhonemeCategory = PhonemeCategory.SP
 
 
+@_slotted
 @dataclass
 class Note:
     text: str = ''
@@ -40,15 +52,47 @@ class Note:
 
 @dataclass
 class PitchCurve:
+    """f0 samples (Hz) every `timestep` seconds.
+
+    With `compact`, f0 is kept as a read-only float32 copy, and `get_midi_pitch`
+    computes the pitch once (in float32) and returns the same read-only array on later
+    calls until f0 is assigned again.
+    """
     f0: "np.array" = field(default_factory=lambda: np.array([]))
     timestep: float = 0.05
+    compact: bool = False
+    _midi_pitch: Optional[tuple] = field(default=None, init=False, repr=False, compare=False)
 
     def __post_init__(self):
-        self.f0 = np.asarray(self.f0)
         self.timestep = float(self.timestep)
 
+    def __setattr__(self, name, value):
+        # `__init__` assigns the fields one by one, so only look at those already set
+        state = self.__dict__
+        if name == 'f0':
+            value = np.asarray(value)
+            if state.get('compact', False):
+                value = np.array(value, dtype=np.float32)
+                value.flags.writeable = False
+            state['_midi_pitch'] = None
+        object.__setattr__(self, name, value)
+        if name == 'compact':
+            state['_midi_pitch'] = None
+            if value and 'f0' in state:
+                self.f0 = state['f0']
+
     def get_midi_pitch(self, a4_midi=69, base_pitch=440.0):
-        m = 12 * np.log2(self.f0 / base_pitch) + a4_midi
+        """MIDI pitch of each sample; NaN for unvoiced (zero or NaN) samples so that plots break there."""
+        if self._midi_pitch is not None and self._midi_pitch[0] == (a4_midi, base_pitch):
+            return self._midi_pitch[1]
+        m = np.where(self.f0 > 0, self.f0, np.nan)
+        np.divide(m, base_pitch, out=m)
+        np.log2(m, out=m)
+        m *= 12
+        m += a4_midi
+        if self.compact:
+            m.flags.writeable = False
+            self._midi_pitch = ((a4_midi, base_pitch), m)
         return m
 
 
@@ -59,12 +103,53 @@ class Segment:
     pitch_curve: PitchCurve = None
 
 
+@dataclass
+class SegmentArrays:
+    """Struct-of-arrays form of a `Segment`, filled by `parse_segment_arrays`.
+
+    Note arrays are indexed by note, phoneme arrays by phoneme; `note_word` and
+    `ph_word` map each item to its index in `text`. `ph_category` holds
+    `PhonemeCategory` values.
+    """
+    offset: float = 0.0
+    text: "np.array" = field(default_factory=lambda: np.array([], dtype=str))
+    note_midi: "np.array" = field(default_factory=lambda: np.array([], dtype=np.int64))
+    note_dur: "np.array" = field(default_factory=lambda: np.array([], dtype=np.float64))
+    note_offset: "np.array" = field(default_factory=lambda: np.array([], dtype=np.float64))
+    note_slur: "np.array" = field(default_factory=lambda: np.array([], dtype=bool))
+    note_word: "np.array" = field(default_factory=lambda: np.array([], dtype=np.int64))
+    ph_seq: "np.array" = field(default_factory=lambda: np.array([], dtype=str))
+    ph_dur: "np.array" = field(default_factory=lambda: np.array([], dtype=np.float64))
+    ph_category: "np.array" = field(default_factory=lambda: np.array([], dtype=np.int8))
+    ph_word: "np.array" = field(default_factory=lambda: np.array([], dtype=np.int64))
+    pitch_curve: PitchCurve = None
+
+    def to_segment(self) -> Segment:
+        categories = [PhonemeCategory(c) for c in self.ph_category.tolist()]
+        ph_bounds = np.searchsorted(self.ph_word, np.arange(len(self.text) + 1))
+        notes = []
+        for i in range(len(self.note_dur)):
+            word = self.note_word[i]
+            phoneme_list = []
+            if not self.note_slur[i]:
+                phoneme_list = [Phoneme(name=self.ph_seq[k], duration=self.ph_dur[k], category=categories[k])
+                                for k in range(ph_bounds[word], ph_bounds[word + 1])]
+            notes.append(Note(text=self.text[word] if not self.note_slur[i] else '-',
+                              phonemes=phoneme_list,
+                              duration=self.note_dur[i],
+                              offset=self.note_offset[i],
+                              midi_pitch=int(self.note_midi[i]),
+                              is_slur=self.note_slur[i]))
+        return Segment(offset=self.offset, notes=notes, pitch_curve=self.pitch_curve)
+
+
 @dataclass
 class Track:
     segments: List[Segment] = field(default_factory=lambda: [])
     attributes: str = ""
 
 
+@_slotted
 @dataclass
 class VisualizeUnit:
     text_lyric: str = ''
@@ -75,8 +160,105 @@ class VisualizeUnit:
     category: PhonemeCategory = PhonemeCategory.SP
 
 
+@dataclass
+class VisualizeUnitTable:
+    """Parallel-array form of a list of `VisualizeUnit`s.
+
+    `category` holds `PhonemeCategory` values; lyrics and phonemes are indexes
+    into the `strings` table.
+    """
+    offset: "np.array" = field(default_factory=lambda: np.array([], dtype=np.float64))
+    duration: "np.array" = field(default_factory=lambda: np.array([], dtype=np.float64))
+    midi_pitch: "np.array" = field(default_factory=lambda: np.array([], dtype=np.int64))
+    category: "np.array" = field(default_factory=lambda: np.array([], dtype=np.int8))
+    lyric_index: "np.array" = field(default_factory=lambda: np.array([], dtype=np.int32))
+    phoneme_index: "np.array" = field(default_factory=lambda: np.array([], dtype=np.int32))
+    strings: List[str] = field(default_factory=lambda: [])
+
+    def __len__(self):
+        return len(self.offset)
+
+    @property
+    def text_lyric(self) -> "np.array":
+        return np.asarray(self.strings, dtype=object)[self.lyric_index]
+
+    @property
+    def text_phoneme(self) -> "np.array":
+        return np.asarray(self.strings, dtype=object)[self.phoneme_index]
+
+    @classmethod
+    def from_units(cls, units: List[VisualizeUnit]) -> 'VisualizeUnitTable':
+        string_index = {}
+        lyric_index = [string_index.setdefault(str(x.text_lyric), len(string_index)) for x in units]
+        phoneme_index = [string_index.setdefault(str(x.text_phoneme), len(string_index)) for x in units]
+        return cls(offset=np.array([x.offset for x in units], dtype=np.float64),
+                   duration=np.array([x.duration for x in units], dtype=np.float64),
+                   midi_pitch=np.array([x.midi_pitch for x in units], dtype=np.int64),
+                   category=np.array([x.category.value for x in units], dtype=np.int8),
+                   lyric_index=np.array(lyric_index, dtype=np.int32),
+                   phoneme_index=np.array(phoneme_index, dtype=np.int32),
+                   strings=list(string_index))
+
+    def to_units(self) -> List[VisualizeUnit]:
+        categories = {x.value: x for x in PhonemeCategory}
+        return [VisualizeUnit(text_lyric=self.strings[lyric],
+                              text_phoneme=self.strings[phoneme],
+                              offset=offset,
+                              duration=duration,
+                              midi_pitch=midi_pitch,
+                              category=categories[category])
+                for offset, duration, midi_pitch, category, lyric, phoneme
+                in zip(self.offset.tolist(), self.duration.tolist(), self.midi_pitch.tolist(),
+                       self.category.tolist(), self.lyric_index.tolist(), self.phoneme_index.tolist())]
+
+    def take(self, positions: "np.array") -> 'VisualizeUnitTable':
+        """Units at `positions`, sharing the string table."""
+        return VisualizeUnitTable(offset=self.offset[positions],
+                                  duration=self.duration[positions],
+                                  midi_pitch=self.midi_pitch[positions],
+                                  category=self.category[positions],
+                                  lyric_index=self.lyric_index[positions],
+                                  phoneme_index=self.phoneme_index[positions],
+                                  strings=self.strings)
+
+    @classmethod
+    def concatenate(cls, tables: List['VisualizeUnitTable']) -> 'VisualizeUnitTable':
+        if not tables:
+            return cls()
+        string_index = {}
+        lyric_index = []
+        phoneme_index = []
+        for table in tables:
+            remap = np.array([string_index.setdefault(x, len(string_index)) for x in table.strings], dtype=np.int32)
+            lyric_index.append(remap[table.lyric_index] if len(remap) else table.lyric_index)
+            phoneme_index.append(remap[table.phoneme_index] if len(remap) else table.phoneme_index)
+        return cls(offset=np.concatenate([x.offset for x in tables]),
+                   duration=np.concatenate([x.duration for x in tables]),
+                   midi_pitch=np.concatenate([x.midi_pitch for x in tables]),
+                   category=np.concatenate([x.category for x in tables]),
+                   lyric_index=np.concatenate(lyric_index),
+                   phoneme_index=np.concatenate(phoneme_index),
+                   strings=list(string_index))
+
+
+@_slotted
 @dataclass
 class Label:
     text: str
     x: float
     y: float
+
+
+@dataclass
+class SegmentPrimitives:
+    """Drawing primitives of one segment, independent of any plotting backend."""
+    rects: "np.array" = field(default_factory=lambda: np.zeros((0, 4)))  # rows of (x, y, width, height)
+    rect_colors: List[str] = field(default_factory=lambda: [])
+    ph_labels: List[Label] = field(default_factory=lambda: [])
+    lyrics_labels: List[Label] = field(default_factory=lambda: [])
+    f0_t: "np.array" = None
+    f0_midi: "np.array" = None
+    # extents of all visualize units; None if the segment has no units
+    xmax: Optional[float] = None
+    pitch_min: Optional[int] = None  # lowest pitch other than -1, or -1 if there is none
+    pitch_max: Optional[int] = None
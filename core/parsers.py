@@ -1,9 +1,15 @@
 # -*- coding: utf-8 -*-
 __all__ = [
     'parse_segment',
+    'parse_segment_arrays',
+    'get_visualize_unit_table_segment',
+    'get_visualize_unit_table_arrays',
+    'get_visualize_units_segment',
+    'get_visualize_unit_table_track',
     'get_visualize_units_track'
 ]
 
+import sys
 from typing import List, Mapping, Optional
 
 import numpy as np
@@ -12,7 +18,13 @@ from .models import *
 from utils import *
 
 
-def parse_segment(segment: Mapping) -> Optional[Segment]:
+def parse_segment(segment: Mapping, compact: bool = False) -> Optional[Segment]:
+    """Parse a raw segment into notes and phonemes; None if its fields do not fit together.
+
+    With `compact`, lyric and phoneme names are interned (shared by all notes and
+    segments that use them), durations are plain floats, and the pitch curve is
+    compact (see `PitchCurve`).
+    """
     offset = segment.get('offset', 0.0)
     f0_seq = np.array([float(x) for x in segment['f0_seq'].split()])
     f0_timestep = float(segment['f0_timestep'])
@@ -35,6 +47,12 @@ def parse_segment(segment: Mapping) -> Optional[Segment]:
     ]
     if not all(assert_conditions):
         return None
+    if compact:
+        # items of the arrays would each be a new numpy scalar
+        text = [sys.intern(x) for x in text.tolist()]
+        ph_seq = [sys.intern(x) for x in ph_seq.tolist()]
+        ph_dur = ph_dur.tolist()
+        note_dur = note_dur.tolist()
 
     # index_notes_nonslur = np.nonzero(~note_slur)[0]  # `nonzero` returns a tuple
     # for index, item in enumerate(index_notes_nonslur):
@@ -44,12 +62,12 @@ def parse_segment(segment: Mapping) -> Optional[Segment]:
     i = 0
     j = 0
     k = 0
-    note_offset_cumsum = 0.0
-    epsilon = 10000  # Deal with float precision. Avoid something like 0.1 + 0.2 -> 0.30000000000000004
+    note_offset_ticks = 0  # integer time base, see `utils.numeric.TIME_RESOLUTION`
+    note_midi = notes_to_midi(note_seq)
     while i < len(note_seq) and j < len(text) and k < len(ph_seq):
         ph_count = ph_num[j]
         phoneme_list = []
-        midi_pitch = note_to_midi(note_seq[i])
+        midi_pitch = int(note_midi[i])
         if not note_slur[i]:
             for m in range(1, 1 + ph_count):
                 if ph_seq[k] == 'AP':
@@ -65,12 +83,12 @@ def parse_segment(segment: Mapping) -> Optional[Segment]:
         note_cv = Note(text=text[j] if not note_slur[i] else '-',
                        phonemes=phoneme_list,
                        duration=note_dur[i],
-                       offset=note_offset_cumsum / epsilon,
+                       offset=from_ticks(note_offset_ticks),
                        midi_pitch=midi_pitch,
                        is_slur=note_slur[i])
         notes.append(note_cv)
 
-        note_offset_cumsum = (note_offset_cumsum + note_dur[i] * epsilon)
+        note_offset_ticks += to_ticks(note_dur[i])
         i += 1
         if ((i < len(note_slur)) and (not note_slur[i])) \
                 or (i >= len(note_slur)):
@@ -78,114 +96,378 @@ def parse_segment(segment: Mapping) -> Optional[Segment]:
             # or current note is already the last note
             j += 1
 
-    pitch_curve = PitchCurve(f0=f0_seq, timestep=f0_timestep)
+    pitch_curve = PitchCurve(f0=f0_seq, timestep=f0_timestep, compact=compact)
     output_segment = Segment(offset=offset, notes=notes, pitch_curve=pitch_curve)
     return output_segment
 
 
-def get_visualize_units_track(track: Track) -> List[VisualizeUnit]:
-    visualize_units_track = []
-    for segment in track.segments:
-        visualize_units_segment = []
-        slur_stack = []
-        for i in range(len(segment.notes)):
-            note = segment.notes[i]
-            next_note = segment.notes[i + 1] if i + 1 < len(segment.notes) else None
-            slur_stack.append(note)
-            if not ((next_note is None) or ((next_note is not None) and (not next_note.is_slur))):
+def parse_segment_arrays(segment: Mapping, compact: bool = False) -> Optional[SegmentArrays]:
+    """Columnar counterpart of `parse_segment`.
+
+    Converts the space-separated fields straight into typed arrays; call
+    `SegmentArrays.to_segment()` when the object-based `Segment` is needed.
+    `compact` only makes the pitch curve compact, names are stored in arrays anyway.
+    """
+    offset = segment.get('offset', 0.0)
+    f0_seq = np.fromstring(segment['f0_seq'], dtype=np.float64, sep=' ')
+    f0_timestep = float(segment['f0_timestep'])
+    text = np.array(segment['text'].split())
+    ph_seq = np.array(segment['ph_seq'].split())
+    ph_dur = np.fromstring(segment['ph_dur'], dtype=np.float64, sep=' ')
+    ph_num = np.fromstring(segment['ph_num'], dtype=np.int64, sep=' ')
+    note_seq = np.array(segment['note_seq'].split())
+    note_dur = np.fromstring(segment['note_dur'], dtype=np.float64, sep=' ')
+    note_slur = np.fromstring(segment['note_slur'], dtype=np.int64, sep=' ').astype(bool)
+
+    # sanity check (same conditions as `parse_segment`)
+    assert_conditions = [
+        len(note_slur) == len(note_dur),
+        len(note_slur) == len(note_seq),
+        len(text) == len(ph_num),
+        ph_num.sum() == len(ph_seq),
+        len(ph_seq) == len(ph_dur),
+        np.count_nonzero(~note_slur) == len(ph_num),
+    ]
+    if not all(assert_conditions):
+        return None
+
+    ph_end = np.cumsum(ph_num)
+    ph_start = ph_end - ph_num
+    note_word = np.zeros(len(note_slur), dtype=np.int64)
+    np.cumsum(~note_slur[1:], out=note_word[1:])
+    # `parse_segment` stops as soon as every phoneme has been consumed, which
+    # drops trailing slur notes of the last word; keep the same notes here.
+    note_word_clipped = np.minimum(note_word, len(ph_num) - 1)
+    k_before = np.where(note_slur, ph_end[note_word_clipped], ph_start[note_word_clipped])
+    exhausted = np.flatnonzero((k_before >= len(ph_seq)) | (note_word >= len(ph_num)))
+    if len(exhausted) > 0:
+        n_notes = exhausted[0]
+        note_seq, note_dur, note_slur, note_word = \
+            note_seq[:n_notes], note_dur[:n_notes], note_slur[:n_notes], note_word[:n_notes]
+
+    note_offset = from_ticks(ticks_cumsum(note_dur))
+
+    note_midi = notes_to_midi(note_seq)
+
+    ph_word = np.repeat(np.arange(len(ph_num)), ph_num)
+    ph_count = ph_num[ph_word]
+    ph_position = np.arange(len(ph_seq)) - ph_start[ph_word] + 1
+    ph_category = np.full(len(ph_seq), PhonemeCategory.BODY.value, dtype=np.int8)
+    ph_category[(ph_count > 1) & (ph_position == ph_count)] = PhonemeCategory.HEAD.value
+    ph_category[ph_seq == 'SP'] = PhonemeCategory.SP.value
+    ph_category[ph_seq == 'AP'] = PhonemeCategory.AP.value
+
+    pitch_curve = PitchCurve(f0=f0_seq, timestep=f0_timestep, compact=compact)
+    return SegmentArrays(offset=offset,
+                         text=text,
+                         note_midi=note_midi,
+                         note_dur=note_dur,
+                         note_offset=note_offset,
+                         note_slur=note_slur,
+                         note_word=note_word,
+                         ph_seq=ph_seq,
+                         ph_dur=ph_dur,
+                         ph_category=ph_category,
+                         ph_word=ph_word,
+                         pitch_curve=pitch_curve)
+
+
+def _layout_slur_group(offset_cumsum, note_durs, note_texts, note_pitches,
+                       ph_names, ph_durs, ph_categories, add_unit):
+    # Split the phonemes of one slur group (a note followed by its slur notes) into
+    # visualize units. All durations and offsets are integer ticks (see
+    # `utils.numeric.TIME_RESOLUTION`); units are passed to `add_unit`.
+    dur_all_notes_in_slur_stack = sum(note_durs)
+    dur_all_heads_in_slur_stack = sum(d for d, c in zip(ph_durs, ph_categories)
+                                      if c == PhonemeCategory.HEAD)
+    dur_all_bodies_in_slur_stack_ds = sum(d for d, c in zip(ph_durs, ph_categories)
+                                          if c != PhonemeCategory.HEAD)
+    dur_all_bodies_in_slur_stack = dur_all_notes_in_slur_stack - dur_all_heads_in_slur_stack
+    dur_all_bodies_in_slur_stack_delta = dur_all_bodies_in_slur_stack - dur_all_bodies_in_slur_stack_ds
+    #bodies_count_in_slur_stack = len([x for x in current_phonemes if x.category != PhonemeCategory.HEAD])
+    #dur_bodies_balance_in_slur_stack = dur_all_bodies_in_slur_stack
+    idx_note = 0
+    idx_ph = 0
+    #current_ph_duration_balance = 0
+
+    # find the split point (in which note) of body and head phonemes.
+    body_head_split_index = 0
+    tmp = dur_all_bodies_in_slur_stack
+    for curr_note_dur in note_durs:
+        tmp -= curr_note_dur
+        if tmp < 0:
+            break
+        body_head_split_index += 1
+    curr_ph_dur_remaining = 0
+    curr_note_dur_remaining = 0
+    while idx_note < len(note_durs) and idx_ph < len(ph_durs):
+        # if slur_stack[idx_note].duration <= current_phonemes[idx_ph].duration:
+        #     current_ph_duration_balance = current_phonemes[idx_ph].duration
+        #     current_duration = current_phonemes[idx_ph].duration
+        #     idx_ph += 1
+        # else:
+        #     current_duration = slur_stack[idx_note].duration
+        if curr_ph_dur_remaining == 0:
+            curr_ph_dur_remaining = ph_durs[idx_ph]
+        current_text_lyric = '' if ph_categories[idx_ph] != PhonemeCategory.BODY \
+            else note_texts[idx_note]
+        if ph_categories[idx_ph] != PhonemeCategory.HEAD:
+            if idx_note < body_head_split_index:
+                use_dur = note_durs[idx_note]
+                add_unit(current_text_lyric, ph_names[idx_ph], offset_cumsum, use_dur,
+                         note_pitches[idx_note], ph_categories[idx_ph])
+                offset_cumsum += use_dur
+                curr_ph_dur_remaining -= use_dur
+                idx_note += 1
                 continue
-            current_phonemes = slur_stack[0].phonemes
-            dur_all_notes_in_slur_stack = float_sum(x.duration for x in slur_stack)
-            dur_all_heads_in_slur_stack = float_sum(x.duration for x in current_phonemes
-                                                    if x.category == PhonemeCategory.HEAD)
-            dur_all_bodies_in_slur_stack_ds = float_sum(x.duration for x in current_phonemes
-                                                        if x.category != PhonemeCategory.HEAD)
-            dur_all_bodies_in_slur_stack = float_sum([dur_all_notes_in_slur_stack,
-                                                      -dur_all_heads_in_slur_stack])
-            dur_all_bodies_in_slur_stack_delta = float_sum([dur_all_bodies_in_slur_stack, -dur_all_bodies_in_slur_stack_ds])
-            #bodies_count_in_slur_stack = len([x for x in current_phonemes if x.category != PhonemeCategory.HEAD])
-            #dur_bodies_balance_in_slur_stack = dur_all_bodies_in_slur_stack
-            offset_cumsum = float_sum([segment.offset, slur_stack[0].offset])
-            idx_note = 0
-            idx_ph = 0
-            #current_ph_duration_balance = 0
-
-            # find the split point (in which note) of body and head phonemes.
-            body_head_split_index = 0
-            tmp = dur_all_bodies_in_slur_stack
-            for curr_note in slur_stack:
-                tmp = float_sum([tmp, -curr_note.duration])
-                if tmp < 0:
-                    break
-                body_head_split_index += 1
-            curr_ph_dur_remaining = 0
-            curr_note_dur_remaining = 0
-            while idx_note < len(slur_stack) and idx_ph < len(current_phonemes):
-                # if slur_stack[idx_note].duration <= current_phonemes[idx_ph].duration:
-                #     current_ph_duration_balance = current_phonemes[idx_ph].duration
-                #     current_duration = current_phonemes[idx_ph].duration
-                #     idx_ph += 1
-                # else:
-                #     current_duration = slur_stack[idx_note].duration
-                if curr_ph_dur_remaining == 0:
-                    curr_ph_dur_remaining = current_phonemes[idx_ph].duration
-                current_text_lyric = '' if current_phonemes[idx_ph].category != PhonemeCategory.BODY \
-                    else slur_stack[idx_note].text
-                if current_phonemes[idx_ph].category != PhonemeCategory.HEAD:
-                    if idx_note < body_head_split_index:
-                        visualize_unit = VisualizeUnit(text_lyric=current_text_lyric,# if not slur_stack[idx_note].is_slur else '-',
-                                                       text_phoneme=current_phonemes[idx_ph].name,# if not slur_stack[idx_note].is_slur else '-',
-                                                       offset=offset_cumsum,
-                                                       midi_pitch=slur_stack[idx_note].midi_pitch,
-                                                       duration=slur_stack[idx_note].duration,
-                                                       category=current_phonemes[idx_ph].category)
-                        offset_cumsum = float_sum([offset_cumsum, visualize_unit.duration])
-                        visualize_units_segment.append(visualize_unit)
-                        curr_ph_dur_remaining = float_sum([curr_ph_dur_remaining, -slur_stack[idx_note].duration])
-                        idx_note += 1
-                        continue
-                    else:
-                        curr_ph_dur_remaining = float_sum([curr_ph_dur_remaining, dur_all_bodies_in_slur_stack_delta])
-                        visualize_unit = VisualizeUnit(text_lyric=current_text_lyric,# if not slur_stack[idx_note].is_slur else '-',
-                                                       text_phoneme=current_phonemes[idx_ph].name,# if not slur_stack[idx_note].is_slur else '-',
-                                                       offset=offset_cumsum,
-                                                       midi_pitch=slur_stack[idx_note].midi_pitch,
-                                                       duration=curr_ph_dur_remaining,
-                                                       category=current_phonemes[idx_ph].category)
-                        offset_cumsum = float_sum([offset_cumsum, visualize_unit.duration])
-                        visualize_units_segment.append(visualize_unit)
-                        curr_note_dur_remaining = max(0.0, float_sum([slur_stack[idx_note].duration, -curr_ph_dur_remaining]))
-                        if curr_note_dur_remaining == 0:
-                            idx_note += 1
-                        curr_ph_dur_remaining = 0
-                        idx_ph += 1
-                        continue
-                else:  # "head" phonemes
-                    if idx_note == body_head_split_index:
-                        use_dur = curr_note_dur_remaining
-                    else:
-                        use_dur = curr_ph_dur_remaining
-                    visualize_unit = VisualizeUnit(text_lyric=current_text_lyric,# if not slur_stack[idx_note].is_slur else '-',
-                                                   text_phoneme=current_phonemes[idx_ph].name,# if not slur_stack[idx_note].is_slur else '-',
-                                                   offset=offset_cumsum,
-                                                   midi_pitch=slur_stack[idx_note].midi_pitch,
-                                                   duration=use_dur,
-                                                   category=current_phonemes[idx_ph].category)
-                    offset_cumsum = float_sum([offset_cumsum, visualize_unit.duration])
-                    visualize_units_segment.append(visualize_unit)
-                    curr_ph_dur_remaining = float_sum([curr_ph_dur_remaining, -use_dur])
+            else:
+                curr_ph_dur_remaining += dur_all_bodies_in_slur_stack_delta
+                add_unit(current_text_lyric, ph_names[idx_ph], offset_cumsum, curr_ph_dur_remaining,
+                         note_pitches[idx_note], ph_categories[idx_ph])
+                offset_cumsum += curr_ph_dur_remaining
+                curr_note_dur_remaining = max(0, note_durs[idx_note] - curr_ph_dur_remaining)
+                if curr_note_dur_remaining == 0:
                     idx_note += 1
-                    continue
-            slur_stack.clear()
-
-        last_pitch = None
-        for vu in reversed(visualize_units_segment):
-            if vu.category in [PhonemeCategory.SP, PhonemeCategory.AP]:
+                curr_ph_dur_remaining = 0
+                idx_ph += 1
                 continue
-            if last_pitch is not None and vu.midi_pitch == -1:
-                vu.midi_pitch = last_pitch
-            last_pitch = vu.midi_pitch
+        else:  # "head" phonemes
+            if idx_note == body_head_split_index:
+                use_dur = curr_note_dur_remaining
+            else:
+                use_dur = curr_ph_dur_remaining
+            add_unit(current_text_lyric, ph_names[idx_ph], offset_cumsum, use_dur,
+                     note_pitches[idx_note], ph_categories[idx_ph])
+            offset_cumsum += use_dur
+            curr_ph_dur_remaining -= use_dur
+            idx_note += 1
+            continue
+
+
+def _fill_missing_pitches(pitches: "np.array", categories: "np.array"):
+    # pitchless units (-1) take the pitch of the next voiced unit, skipping SP and AP
+    voiced = np.flatnonzero((categories != PhonemeCategory.SP.value) & (categories != PhonemeCategory.AP.value))
+    voiced_pitches = pitches[voiced]
+    positions = np.where(voiced_pitches != -1, np.arange(len(voiced)), len(voiced))
+    next_valid = np.minimum.accumulate(positions[::-1])[::-1]
+    pitches[voiced] = np.append(voiced_pitches, -1)[next_valid]
 
-        visualize_units_track.extend(visualize_units_segment)
 
-    return visualize_units_track
+def get_visualize_unit_table_segment(segment: Segment) -> VisualizeUnitTable:
+    # columns of the unit table; offsets and durations are in ticks
+    unit_offsets = []
+    unit_durations = []
+    unit_pitches = []
+    unit_categories = []
+    unit_lyrics = []
+    unit_phonemes = []
+    string_index = {}
+
+    def add_unit(text_lyric, text_phoneme, offset, duration, midi_pitch, category):
+        unit_offsets.append(offset)
+        unit_durations.append(duration)
+        unit_pitches.append(midi_pitch)
+        unit_categories.append(category.value)
+        unit_lyrics.append(string_index.setdefault(str(text_lyric), len(string_index)))
+        unit_phonemes.append(string_index.setdefault(str(text_phoneme), len(string_index)))
+
+    slur_stack = []
+    for i in range(len(segment.notes)):
+        note = segment.notes[i]
+        next_note = segment.notes[i + 1] if i + 1 < len(segment.notes) else None
+        slur_stack.append(note)
+        if not ((next_note is None) or ((next_note is not None) and (not next_note.is_slur))):
+            continue
+        current_phonemes = slur_stack[0].phonemes
+        _layout_slur_group(to_ticks(segment.offset) + to_ticks(slur_stack[0].offset),
+                           [to_ticks(x.duration) for x in slur_stack],
+                           [x.text for x in slur_stack],
+                           [x.midi_pitch for x in slur_stack],
+                           [x.name for x in current_phonemes],
+                           [to_ticks(x.duration) for x in current_phonemes],
+                           [x.category for x in current_phonemes],
+                           add_unit)
+        slur_stack.clear()
+
+    unit_pitches = np.array(unit_pitches, dtype=np.int64)
+    unit_categories = np.array(unit_categories, dtype=np.int8)
+    _fill_missing_pitches(unit_pitches, unit_categories)
+
+    return VisualizeUnitTable(offset=from_ticks(np.array(unit_offsets, dtype=np.int64)),
+                              duration=from_ticks(np.array(unit_durations, dtype=np.int64)),
+                              midi_pitch=unit_pitches,
+                              category=unit_categories,
+                              lyric_index=np.array(unit_lyrics, dtype=np.int32),
+                              phoneme_index=np.array(unit_phonemes, dtype=np.int32),
+                              strings=list(string_index))
+
+
+def get_visualize_unit_table_arrays(segment: SegmentArrays) -> VisualizeUnitTable:
+    """Vectorized counterpart of `get_visualize_unit_table_segment` for `SegmentArrays`.
+
+    Slur groups are laid out with array operations, following the state machine of
+    the loop engine: groups without a head get a unit of their first phoneme per note;
+    in groups with a head, the first body spans all notes but the last, and on the last
+    note every body in turn (each measured against the whole note) and then the head
+    take what the note has left. Groups the closed form does not cover go through the
+    same state machine as the loop engine: negative note durations, heads longer than
+    the last note or not in the last place, and a first body that is used up exactly
+    at a note boundary. Both engines produce identical units.
+    """
+    n_notes = len(segment.note_dur)
+    if n_notes == 0 or len(segment.text) == 0:
+        return VisualizeUnitTable()
+    head = PhonemeCategory.HEAD.value
+    body = PhonemeCategory.BODY.value
+
+    # notes; all durations and offsets are in ticks
+    note_ticks = to_ticks(segment.note_dur)
+    note_start = to_ticks(segment.note_offset) + to_ticks(segment.offset)
+    note_text = np.where(segment.note_slur, '-', segment.text[segment.note_word])
+
+    # slur groups: a note followed by its slur notes
+    is_group_start = ~segment.note_slur
+    is_group_start[0] = True
+    first_note = np.flatnonzero(is_group_start)
+    group_id = np.cumsum(is_group_start) - 1
+    last_note = np.append(first_note[1:], n_notes) - 1
+    note_end = np.cumsum(note_ticks)
+    prefix = note_end - note_ticks - (note_end - note_ticks)[first_note][group_id]  # within the group
+    group_dur = np.add.reduceat(note_ticks, first_note)
+    group_start = note_start[first_note]
+    last_ticks = note_ticks[last_note]
+
+    # phonemes of each group (those of its first note; none if that note is a slur)
+    ph_ticks = to_ticks(segment.ph_dur)
+    ph_category = segment.ph_category
+    ph_bounds = np.searchsorted(segment.ph_word, np.arange(len(segment.text) + 1))
+    group_word = segment.note_word[first_note]
+    ph_first = ph_bounds[group_word]
+    ph_count = np.where(segment.note_slur[first_note], 0, ph_bounds[group_word + 1] - ph_first)
+    ph_end = ph_first + ph_count
+    ticks_sum = np.concatenate([[0], np.cumsum(ph_ticks)])
+    heads_sum = np.concatenate([[0], np.cumsum(ph_category == head)])
+    ph_sum = ticks_sum[ph_end] - ticks_sum[ph_first]
+    heads = heads_sum[ph_end] - heads_sum[ph_first]
+    first_ticks = np.append(ph_ticks, 0)[ph_first]
+    has_head = (ph_count > 1) & (np.append(ph_category, 0)[np.maximum(ph_end - 1, 0)] == head)
+    head_ticks = np.where(has_head, np.append(ph_ticks, 0)[np.maximum(ph_end - 1, 0)], 0)
+
+    # groups the closed-form layout below reproduces exactly; a head of zero or negative
+    # length leaves the whole group to the first phoneme, like a group without a head
+    non_negative = np.minimum.reduceat(note_ticks, first_note) >= 0
+    with_head = has_head & (head_ticks > 0)
+    # the loop engine restarts the first body whenever it is used up exactly
+    resets = np.zeros(len(first_note), dtype=bool)
+    resets[group_id[~is_group_start & (prefix == first_ticks[group_id]) & (first_ticks[group_id] != 0)]] = True
+    regular = non_negative & (heads == has_head) & (~with_head | ((head_ticks <= last_ticks) & ~resets))
+
+    # a unit of the first phoneme per note, except on the last note of groups with a head
+    per_note = (regular & (ph_count > 0))[group_id]
+    per_note &= ~(with_head[group_id] & (np.arange(n_notes) == last_note[group_id]))
+    note_rows = np.flatnonzero(per_note)
+    unit_group = [group_id[note_rows]]
+    unit_order = [note_rows - first_note[group_id[note_rows]]]
+    unit_note = [note_rows]
+    unit_ph = [ph_first[group_id[note_rows]]]
+    unit_duration = [note_ticks[note_rows]]
+
+    # the bodies on the last note: the first one gets what is left of it after the
+    # notes before, and all of them the difference between notes and phonemes; once
+    # one uses up the note, the group ends, otherwise the head takes the rest
+    head_groups = np.flatnonzero(regular & with_head)
+    bodies = ph_count[head_groups] - 1
+    body_first = np.cumsum(bodies) - bodies
+    body_group = np.repeat(head_groups, bodies)
+    body_index = np.arange(len(body_group)) - np.repeat(body_first, bodies)
+    body_ph = ph_first[body_group] + body_index
+    body_duration = ph_ticks[body_ph] + (group_dur - ph_sum)[body_group]
+    body_duration[body_first] -= (group_dur - last_ticks)[head_groups]
+    used_up = body_duration >= last_ticks[body_group]
+    used_up_before = np.cumsum(used_up) - used_up
+    kept = used_up_before == np.repeat(used_up_before[body_first], bodies)
+    unit_group.append(body_group[kept])
+    unit_order.append((last_note - first_note)[body_group[kept]] + body_index[kept])
+    unit_note.append(last_note[body_group[kept]])
+    unit_ph.append(body_ph[kept])
+    unit_duration.append(body_duration[kept])
+    closed = np.add.reduceat(used_up, body_first) == 0 if len(body_first) > 0 else np.zeros(0, dtype=bool)
+    closed_groups = head_groups[closed]
+    unit_group.append(closed_groups)
+    unit_order.append((last_note - first_note + ph_count - 1)[closed_groups])
+    unit_note.append(last_note[closed_groups])
+    unit_ph.append(ph_end[closed_groups] - 1)
+    unit_duration.append(last_ticks[closed_groups] - body_duration[(body_first + bodies - 1)[closed]])
+
+    unit_group = np.concatenate(unit_group)
+    unit_order = np.concatenate(unit_order)
+    unit_note = np.concatenate(unit_note)
+    unit_ph = np.concatenate(unit_ph)
+    unit_duration = np.concatenate(unit_duration)
+    unit_pitch = segment.note_midi[unit_note]
+    unit_category = ph_category[unit_ph]
+    unit_phoneme = segment.ph_seq[unit_ph].astype(object)
+    unit_lyric = np.where(unit_category == body, note_text[unit_note], '').astype(object)
+
+    # everything else goes through the loop engine's state machine
+    fallback = {'group': [], 'order': [], 'duration': [], 'pitch': [], 'category': [], 'lyric': [], 'phoneme': []}
+    for g in np.flatnonzero(~regular).tolist():
+        notes = slice(first_note[g], last_note[g] + 1)
+        phonemes = slice(ph_first[g], ph_end[g])
+
+        def add_unit(text_lyric, text_phoneme, offset, duration, midi_pitch, category):
+            fallback['group'].append(g)
+            fallback['order'].append(len(fallback['order']))
+            fallback['duration'].append(duration)
+            fallback['pitch'].append(midi_pitch)
+            fallback['category'].append(category.value)
+            fallback['lyric'].append(str(text_lyric))
+            fallback['phoneme'].append(str(text_phoneme))
+
+        _layout_slur_group(int(group_start[g]),
+                           note_ticks[notes].tolist(),
+                           note_text[notes].tolist(),
+                           segment.note_midi[notes].tolist(),
+                           segment.ph_seq[phonemes].tolist(),
+                           ph_ticks[phonemes].tolist(),
+                           [PhonemeCategory(x) for x in ph_category[phonemes].tolist()],
+                           add_unit)
+
+    unit_group = np.append(unit_group, np.array(fallback['group'], dtype=np.int64))
+    unit_order = np.append(unit_order, np.array(fallback['order'], dtype=np.int64))
+    order = np.lexsort((unit_order, unit_group))
+    unit_group = unit_group[order]
+    unit_duration = np.append(unit_duration, np.array(fallback['duration'], dtype=np.int64))[order]
+    unit_pitch = np.append(unit_pitch, np.array(fallback['pitch'], dtype=np.int64))[order]
+    unit_category = np.append(unit_category, np.array(fallback['category'], dtype=np.int8))[order]
+    unit_lyric = np.append(unit_lyric, np.array(fallback['lyric'], dtype=object))[order]
+    unit_phoneme = np.append(unit_phoneme, np.array(fallback['phoneme'], dtype=object))[order]
+    _fill_missing_pitches(unit_pitch, unit_category)
+
+    # units of a group follow each other from the start of the group
+    unit_end = np.cumsum(unit_duration)
+    is_first = np.ones(len(unit_group), dtype=bool)
+    is_first[1:] = unit_group[1:] != unit_group[:-1]
+    first_unit = np.maximum.accumulate(np.where(is_first, np.arange(len(order)), 0))
+    unit_offset = group_start[unit_group] + (unit_end - unit_duration) - (unit_end - unit_duration)[first_unit]
+
+    strings, string_index = np.unique(np.append(unit_lyric, unit_phoneme).astype(str), return_inverse=True)
+    return VisualizeUnitTable(offset=from_ticks(unit_offset),
+                              duration=from_ticks(unit_duration),
+                              midi_pitch=unit_pitch,
+                              category=unit_category,
+                              lyric_index=string_index[:len(order)].astype(np.int32),
+                              phoneme_index=string_index[len(order):].astype(np.int32),
+                              strings=strings.tolist())
+
+
+def get_visualize_units_segment(segment: Segment) -> List[VisualizeUnit]:
+    return get_visualize_unit_table_segment(segment).to_units()
+
+
+def get_visualize_unit_table_track(track: Track) -> VisualizeUnitTable:
+    return VisualizeUnitTable.concatenate([get_visualize_unit_table_segment(x) for x in track.segments])
+
+
+def get_visualize_units_track(track: Track) -> List[VisualizeUnit]:
+    return get_visualize_unit_table_track(track).to_units()
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+__all__ = [
+    'iter_segments'
+]
+
+import json
+from typing import IO, Iterator, Mapping
+
+
+def iter_segments(fp: IO[str], chunk_size: int = 1 << 16) -> Iterator[Mapping]:
+    """Yield the raw segment dicts of a .ds project one at a time.
+
+    The top-level JSON array is tokenized incrementally, so only the segment
+    being decoded is held in memory. A project holding a single object instead
+    of an array yields that object.
+    """
+    decoder = json.JSONDecoder()
+    buf = ''
+    pos = 0
+    eof = False
+
+    def fill(size):
+        nonlocal buf, pos, eof
+        chunk = fp.read(size)
+        if not chunk:
+            eof = True
+        buf = buf[pos:] + chunk
+        pos = 0
+
+    def skip_whitespace():
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos].isspace():
+                pos += 1
+            if pos < len(buf) or eof:
+                return
+            fill(chunk_size)
+
+    skip_whitespace()
+    if pos >= len(buf):
+        return
+    if buf[pos] != '[':
+        while not eof:
+            fill(chunk_size)
+        yield json.loads(buf[pos:])
+        return
+    pos += 1
+
+    expect_value = True
+    while True:
+        skip_whitespace()
+        if pos >= len(buf):
+            raise ValueError("Unexpected end of .ds file inside top-level array")
+        if buf[pos] == ']':
+            return
+        if not expect_value:
+            if buf[pos] != ',':
+                raise ValueError("Expected ',' or ']' between items of top-level array")
+            pos += 1
+            expect_value = True
+            continue
+        while True:
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                end = None
+            # a value is only complete once the following delimiter is in the buffer
+            # (a truncated number such as `2.` would otherwise decode as `2`)
+            if end is not None and (eof or (end < len(buf) and (buf[end] in ',]' or buf[end].isspace()))):
+                break
+            # grow geometrically so that re-decoding a large segment stays linear
+            fill(max(chunk_size, len(buf) - pos))
+        pos = end
+        expect_value = False
+        yield value
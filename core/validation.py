@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+__all__ = [
+    'ValidationIssue',
+    'ValidationReport',
+    'validate_segment',
+    'validate_segments',
+    'validate_file',
+    'invalid_segment_error'
+]
+
+from dataclasses import dataclass, field
+from typing import Iterable, List, Mapping, Optional
+
+import numpy as np
+
+from utils import *
+from .readers import *
+
+_FIELDS = ('text', 'ph_seq', 'ph_dur', 'ph_num', 'note_seq', 'note_dur', 'note_slur', 'f0_seq', 'f0_timestep')
+# fields that `parse_segment` also takes as a JSON number
+_NUMBER_FIELDS = ('f0_timestep',)
+# difference (seconds) between the phoneme and note durations of a word that is reported
+_DURATION_TOLERANCE = 0.01
+# number of offending indexes shown in a message
+_MAX_SHOWN_INDEXES = 10
+
+
+@dataclass
+class ValidationIssue:
+    """A problem found in a segment (`segment` is its index, None for the whole file).
+
+    `code` names the check that failed, `indexes` are the offending items (notes,
+    phonemes, words or samples, depending on the check). Errors make `parse_segment`
+    fail or the output wrong; warnings are suspicious but render.
+    """
+    segment: Optional[int]
+    code: str
+    message: str
+    indexes: List[int] = field(default_factory=lambda: [])
+    severity: str = 'error'
+
+    def details(self) -> str:
+        text = "[{}] {}".format(self.code, self.message)
+        if self.indexes:
+            shown = ', '.join(str(x) for x in self.indexes[:_MAX_SHOWN_INDEXES])
+            if len(self.indexes) > _MAX_SHOWN_INDEXES:
+                shown += ", ... ({} in total)".format(len(self.indexes))
+            text += " at index {}".format(shown)
+        return text
+
+    def __str__(self):
+        where = "segment {}".format(self.segment) if self.segment is not None else "file"
+        return "{}: {} {}".format(where, self.severity, self.details())
+
+
+@dataclass
+class ValidationReport:
+    filename: Optional[str] = None
+    segments: int = 0
+    issues: List[ValidationIssue] = field(default_factory=lambda: [])
+
+    @property
+    def errors(self) -> List[ValidationIssue]:
+        return [x for x in self.issues if x.severity == 'error']
+
+    @property
+    def warnings(self) -> List[ValidationIssue]:
+        return [x for x in self.issues if x.severity == 'warning']
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    @property
+    def bad_segments(self) -> List[int]:
+        return sorted({x.segment for x in self.errors if x.segment is not None})
+
+    def summary(self) -> str:
+        return "{} segment(s), {} error(s) in {} segment(s), {} warning(s)".format(
+            self.segments, len(self.errors), len(self.bad_segments), len(self.warnings))
+
+
+def _parse_numbers(tokens: List[str], dtype, name: str, segment: int, issues: List[ValidationIssue]):
+    try:
+        return np.array(tokens, dtype=dtype)
+    except (ValueError, OverflowError):
+        pass
+    # find the offending tokens only once the fast path failed
+    bad = []
+    for i, token in enumerate(tokens):
+        try:
+            dtype(token)
+        except (ValueError, OverflowError):
+            bad.append(i)
+    issues.append(ValidationIssue(segment, 'bad_number', "{} has items that are not numbers".format(name), bad))
+    return None
+
+
+def validate_segment(raw_segment: Mapping, index: int = 0) -> List[ValidationIssue]:
+    """Check a raw segment of a .ds file; returns the issues found (none if it is fine).
+
+    Covers the conditions of `parse_segment` and also reports unknown note names,
+    negative or non-finite durations, phoneme durations of a word that do not add up to
+    its note durations, and unusable pitch curves.
+    """
+    issues = []
+    if not isinstance(raw_segment, Mapping):
+        return [ValidationIssue(index, 'not_a_segment', "segment is a {}, not an object".format(
+            type(raw_segment).__name__))]
+    missing = [x for x in _FIELDS
+               if not isinstance(raw_segment.get(x), (str, int, float) if x in _NUMBER_FIELDS else str)]
+    if missing:
+        return [ValidationIssue(index, 'missing_field', "missing or not a string: {}".format(', '.join(missing)))]
+
+    text = raw_segment['text'].split()
+    ph_seq = raw_segment['ph_seq'].split()
+    note_seq = raw_segment['note_seq'].split()
+    ph_dur = _parse_numbers(raw_segment['ph_dur'].split(), np.float64, 'ph_dur', index, issues)
+    note_dur = _parse_numbers(raw_segment['note_dur'].split(), np.float64, 'note_dur', index, issues)
+    ph_num = _parse_numbers(raw_segment['ph_num'].split(), np.int64, 'ph_num', index, issues)
+    note_slur = _parse_numbers(raw_segment['note_slur'].split(), np.int64, 'note_slur', index, issues)
+    f0_seq = _parse_numbers(raw_segment['f0_seq'].split(), np.float64, 'f0_seq', index, issues)
+    f0_timestep = _parse_numbers([raw_segment['f0_timestep']], np.float64, 'f0_timestep', index, issues)
+    try:
+        float(raw_segment.get('offset', 0.0))
+    except (TypeError, ValueError):
+        issues.append(ValidationIssue(index, 'bad_number', "offset is not a number"))
+
+    def check_length(name_a, length_a, name_b, length_b, code='length_mismatch'):
+        if length_a != length_b:
+            issues.append(ValidationIssue(index, code, "{} has {} item(s) but {} has {}".format(
+                name_a, length_a, name_b, length_b)))
+            return False
+        return True
+
+    notes_ok = note_dur is not None and note_slur is not None
+    notes_ok = notes_ok and check_length('note_seq', len(note_seq), 'note_dur', len(note_dur))
+    notes_ok = notes_ok and check_length('note_seq', len(note_seq), 'note_slur', len(note_slur))
+    phonemes_ok = ph_dur is not None and check_length('ph_seq', len(ph_seq), 'ph_dur', len(ph_dur))
+    words_ok = ph_num is not None and check_length('text', len(text), 'ph_num', len(ph_num), 'word_count')
+
+    if ph_num is not None:
+        bad = np.flatnonzero(ph_num < 1)
+        if len(bad) > 0:
+            words_ok = False
+            issues.append(ValidationIssue(index, 'bad_ph_num', "words must have at least one phoneme",
+                                          bad.tolist()))
+        elif int(ph_num.sum()) != len(ph_seq):
+            phonemes_ok = False
+            issues.append(ValidationIssue(index, 'phoneme_count', "ph_num adds up to {} but ph_seq has {} item(s)".format(
+                int(ph_num.sum()), len(ph_seq))))
+    if note_slur is not None:
+        bad = np.flatnonzero((note_slur != 0) & (note_slur != 1))
+        if len(bad) > 0:
+            notes_ok = False
+            issues.append(ValidationIssue(index, 'bad_slur', "note_slur must be 0 or 1", bad.tolist()))
+        elif len(note_slur) > 0 and note_slur[0] == 1:
+            notes_ok = False
+            issues.append(ValidationIssue(index, 'bad_slur', "the first note cannot be a slur", [0]))
+    if notes_ok and ph_num is not None and words_ok:
+        words_ok = check_length('non-slur notes', int(np.count_nonzero(note_slur == 0)),
+                                'ph_num', len(ph_num), 'word_count')
+
+    for name, durations in (('note_dur', note_dur), ('ph_dur', ph_dur)):
+        if durations is not None:
+            bad = np.flatnonzero(~np.isfinite(durations))
+            if len(bad) > 0:
+                issues.append(ValidationIssue(index, 'bad_duration', "{} must be finite".format(name), bad.tolist()))
+            bad = np.flatnonzero(durations < 0)
+            if len(bad) > 0:
+                issues.append(ValidationIssue(index, 'bad_duration', "{} has negative durations".format(name),
+                                              bad.tolist(), 'warning'))
+
+    if note_seq:
+        names = np.array(note_seq)
+        bad = np.flatnonzero((notes_to_midi(names) == -1) & (np.char.lower(names) != 'rest'))
+        if len(bad) > 0:
+            issues.append(ValidationIssue(index, 'unknown_note', "unknown note names: {}".format(
+                ', '.join(sorted(set(names[bad].tolist())))), bad.tolist()))
+
+    if notes_ok and phonemes_ok and words_ok and len(ph_num) > 0:
+        # each word spans its note and the slurs after it, and its phonemes
+        note_word = np.cumsum(note_slur == 0) - 1
+        ph_word = np.repeat(np.arange(len(ph_num)), ph_num)
+        word_note_dur = np.bincount(note_word, weights=note_dur, minlength=len(ph_num))
+        word_ph_dur = np.bincount(ph_word, weights=ph_dur, minlength=len(ph_num))
+        bad = np.flatnonzero(np.abs(word_note_dur - word_ph_dur) > _DURATION_TOLERANCE)
+        if len(bad) > 0:
+            issues.append(ValidationIssue(index, 'duration_mismatch',
+                                          "phoneme durations of a word do not add up to its note durations",
+                                          bad.tolist(), 'warning'))
+
+    if f0_timestep is not None and not (np.isfinite(f0_timestep[0]) and f0_timestep[0] > 0):
+        issues.append(ValidationIssue(index, 'bad_f0', "f0_timestep must be positive"))
+    if f0_seq is not None:
+        bad = np.flatnonzero(~np.isfinite(f0_seq) | (f0_seq < 0))
+        if len(bad) > 0:
+            issues.append(ValidationIssue(index, 'bad_f0', "f0_seq has negative or non-finite values (drawn as unvoiced)",
+                                          bad.tolist(), 'warning'))
+    return issues
+
+
+def validate_segments(raw_segments: Iterable[Mapping], report: Optional[ValidationReport] = None) -> ValidationReport:
+    if report is None:
+        report = ValidationReport()
+    for raw_segment in raw_segments:
+        report.issues.extend(validate_segment(raw_segment, report.segments))
+        report.segments += 1
+    return report
+
+
+def validate_file(filename: str) -> ValidationReport:
+    """Validate every segment of a .ds file. Raises `FileNotFoundError` if it does not exist."""
+    report = ValidationReport(filename=filename)
+    with open(filename, 'r', encoding='utf-8') as f:
+        try:
+            validate_segments(iter_segments(f), report)
+        except (ValueError, UnicodeDecodeError) as e:  # including `json.JSONDecodeError`
+            report.issues.append(ValidationIssue(None, 'invalid_json', "{} after {} segment(s)".format(e, report.segments)))
+    return report
+
+
+def invalid_segment_error(raw_segment: Mapping, index: int) -> ValueError:
+    """Error for a segment that failed to parse, naming the checks it fails."""
+    errors = [x.details() for x in validate_segment(raw_segment, index) if x.severity == 'error']
+    return ValueError("Segment {} is invalid: {}".format(index, '; '.join(errors) or "failed the sanity check"))
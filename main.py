@@ -1,19 +1,24 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import json
 import os
 import argparse
+import glob
 import sys
 import re
+import time
 
-from core.models import *
-from core.parsers import *
-from visualizer.visualizers import *
-from utils.misc import convert_color_str
+# NumPy, matplotlib and the parsers are imported in `main` once the arguments are
+# validated, so that `--help` and usage errors return immediately
+from visualizer.backends import *
 
 
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'convert':
+        return convert_main(sys.argv[2:])
+    if len(sys.argv) > 1 and sys.argv[1] == 'analyze':
+        return analyze_main(sys.argv[2:])
+
     version = ""
     try:
         with open(os.path.join(os.path.dirname(__file__), "VERSION"), "r", encoding="utf-8") as version_f:
@@ -31,11 +36,16 @@ def main():
     argument_parser = argparse.ArgumentParser()
     argument_parser.add_argument('-i', '--input',
                                  type=str,
-                                 help='input .ds project file')
+                                 nargs='+',
+                                 help='input .ds project file(s), directories or glob patterns')
     argument_parser.add_argument('-o', '--output',
                                  type=str,
                                  required=False,
-                                 help='output file (.svg format recommended)')
+                                 help='output file (.svg format recommended); output directory in batch mode')
+    argument_parser.add_argument('-j', '--jobs',
+                                 type=int,
+                                 required=False,
+                                 help='number of worker processes in batch mode (default: number of CPUs)')
     argument_parser.add_argument('--color-head',
                                  type=str,
                                  default='8c2128',
@@ -85,15 +95,114 @@ def main():
                                  required=False,
                                  default=False,
                                  help='do not plot pitch curve')
+    argument_parser.add_argument('--f0-decimation',
+                                 type=str,
+                                 choices=DECIMATION_METHODS,
+                                 default='minmax',
+                                 help='reduce the pitch curve to what the output resolution (--width, --dpi) can show')
+    argument_parser.add_argument('--no-label-culling',
+                                 action='store_true',
+                                 required=False,
+                                 default=False,
+                                 help='draw every label, even where labels overlap each other')
+    argument_parser.add_argument('--layout-engine',
+                                 type=str,
+                                 choices=LAYOUT_ENGINES,
+                                 default='loop',
+                                 help='implementation of note/phoneme layout (both give identical output)')
+    argument_parser.add_argument('--backend',
+                                 type=str,
+                                 choices=BACKENDS,
+                                 default='matplotlib',
+                                 help='renderer; "svg" writes .svg files directly without matplotlib')
+    argument_parser.add_argument('--combine',
+                                 type=str,
+                                 choices=TRACK_MODES,
+                                 required=False,
+                                 help='render all inputs into one file as separate tracks on a shared time axis, '
+                                      'each in a row of its own ("stacked") or over each other ("overlay")')
+    argument_parser.add_argument('--track-colors',
+                                 type=str,
+                                 required=False,
+                                 help='comma-separated colors of the tracks of --combine')
+    argument_parser.add_argument('--glyph-atlas',
+                                 type=str,
+                                 required=False,
+                                 help='file of pre-rendered label glyphs for --backend raster, created if missing')
+    argument_parser.add_argument('--tile-length',
+                                 type=float,
+                                 required=False,
+                                 help='render the track as tiles of this many seconds each (width of each tile is set by --width)')
+    argument_parser.add_argument('--start',
+                                 type=float,
+                                 required=False,
+                                 help='render only the part of the track from this time on (seconds)')
+    argument_parser.add_argument('--end',
+                                 type=float,
+                                 required=False,
+                                 help='render only the part of the track up to this time (seconds, default: its end)')
+    argument_parser.add_argument('--profile',
+                                 type=str,
+                                 nargs='?',
+                                 const='table',
+                                 choices=('table', 'json'),
+                                 help='report time and item counts of every stage, as a table (default) or JSON')
+    argument_parser.add_argument('--profile-memory',
+                                 action='store_true',
+                                 required=False,
+                                 help='with --profile, also trace the peak memory of every stage, '
+                                      'which slows down the stages it times')
+    argument_parser.add_argument('--profile-output',
+                                 type=str,
+                                 required=False,
+                                 help='write the --profile report to this file instead of the console')
+    argument_parser.add_argument('--cprofile',
+                                 type=str,
+                                 required=False,
+                                 help='dump cProfile statistics of the rendering (main process only) to this file')
+    argument_parser.add_argument('--watch',
+                                 action='store_true',
+                                 required=False,
+                                 default=False,
+                                 help='render again whenever the input file changes, re-parsing only the changed segments')
+    argument_parser.add_argument('--serve',
+                                 type=int,
+                                 metavar='PORT',
+                                 required=False,
+                                 help='run a render server on this port instead of rendering files (see README)')
+    argument_parser.add_argument('--host',
+                                 type=str,
+                                 default='127.0.0.1',
+                                 help='address the render server listens on')
+    argument_parser.add_argument('--skip-bad-segments',
+                                 action='store_true',
+                                 required=False,
+                                 default=False,
+                                 help='leave out segments that fail validation instead of failing the whole file')
+    argument_parser.add_argument('--compact',
+                                 action='store_true',
+                                 required=False,
+                                 default=False,
+                                 help='keep parsed segments in a compact form (float32 pitch curves, interned '
+                                      'phoneme and lyric strings) to use less memory on large projects')
+    argument_parser.add_argument('--check-only',
+                                 action='store_true',
+                                 required=False,
+                                 default=False,
+                                 help='only validate the input files and report every problem found, without rendering')
+    argument_parser.add_argument('--cache-dir',
+                                 type=str,
+                                 required=False,
+                                 help='directory of the render cache (disabled if not specified)')
+    argument_parser.add_argument('--cache-size',
+                                 type=int,
+                                 default=512,
+                                 help='maximum size of the render cache in MB')
 
     args = argument_parser.parse_args()
 
-    input_filename = args.input
+    input_filenames = args.input
     output_filename = args.output
-    color_head = convert_color_str(args.color_head)
-    color_body = convert_color_str(args.color_body)
-    color_f0 = convert_color_str(args.color_f0)
-    color_text = convert_color_str(args.color_text)
 
     figsize = (int(args.width), int(args.height))
     dpi = int(args.dpi)
@@ -114,17 +223,96 @@ def main():
     print(version)
     print("=" * 16)
 
-    if input_filename is None:
+    if not input_filenames and args.serve is None:
         print("ERROR: Please specify input filename!")
         return 1
 
+    if args.check_only:
+        return run_check(input_filenames, args.jobs)
+
+    from utils.misc import convert_color_str, missing_file_message
+    from visualizer.pipeline import get_output_filename, render_file
+    from visualizer.cache import RenderCache
+    from visualizer.primitives import DecimationStats
+
+    if args.backend == 'matplotlib':
+        use_non_interactive_backend()
+
+    color_head = convert_color_str(args.color_head)
+    color_body = convert_color_str(args.color_body)
+    color_f0 = convert_color_str(args.color_f0)
+    color_text = convert_color_str(args.color_text)
+
+    style = dict(color_f0=color_f0,
+                 color_body=color_body,
+                 color_head=color_head,
+                 color_text=color_text,
+                 figsize=figsize,
+                 dpi=dpi,
+                 aspect=aspect,
+                 font_name=font_name,
+                 font_size=font_size,
+                 font_style=font_style,
+                 display_f0=display_f0,
+                 f0_decimation=args.f0_decimation,
+                 label_culling=not args.no_label_culling)
+
+    cache_max_bytes = int(args.cache_size) * 1024 * 1024
+    options = dict(layout_engine=args.layout_engine,
+                   tile_length=args.tile_length,
+                   backend=args.backend,
+                   skip_bad_segments=args.skip_bad_segments)
+    if args.compact:
+        options['compact'] = True
+    if args.glyph_atlas is not None:
+        options['glyph_atlas'] = args.glyph_atlas
+    if args.start is not None or args.end is not None:
+        options['start'] = args.start
+        options['end'] = args.end
+
+    if args.serve is not None:
+        from visualizer.server import serve
+        serve(args.host, args.serve, style, options, jobs=args.jobs,
+              cache_dir=args.cache_dir, cache_max_bytes=cache_max_bytes)
+        return 0
+
+    profiler = None
+    if args.profile is not None:
+        from utils.profiling import Profiler
+        profiler = Profiler(trace_memory=args.profile_memory)
+        profiler.start()
+    c_profiler = None
+    if args.cprofile is not None:
+        import cProfile
+        c_profiler = cProfile.Profile()
+
+    is_batch = len(input_filenames) > 1 or os.path.isdir(input_filenames[0]) or glob.has_magic(input_filenames[0])
+    if args.watch and (is_batch or args.combine is not None):
+        print("ERROR: --watch takes a single input file!")
+        return 1
+    if 'start' in options:
+        if args.tile_length is not None or args.combine is not None:
+            print("ERROR: --start/--end cannot be used with --tile-length or --combine!")
+            return 1
+        if args.start is not None and args.end is not None and args.end <= args.start:
+            print("ERROR: --end must be after --start!")
+            return 1
+    if args.combine is not None:
+        if args.tile_length is not None:
+            print("ERROR: --combine does not support --tile-length!")
+            return 1
+        track_colors = None
+        if args.track_colors is not None:
+            track_colors = [convert_color_str(x) for x in args.track_colors.split(',')]
+        return run_combined(input_filenames, output_filename, args.combine, track_colors, args.jobs, style,
+                            args.cache_dir, cache_max_bytes, options, profiler, c_profiler, args)
+    if is_batch:
+        return run_batch(input_filenames, output_filename, args.jobs, style,
+                         args.cache_dir, cache_max_bytes, options, profiler, c_profiler, args)
+
+    input_filename = input_filenames[0]
     if output_filename is None:
-        output_filename_tmp = os.path.basename(input_filename)
-        basename, ext = os.path.splitext(output_filename_tmp)
-        if ext.lower() == '.ds':
-            output_filename = basename + '.svg'
-        else:
-            output_filename = output_filename_tmp + '.svg'
+        output_filename = get_output_filename(input_filename, ext=output_extension(args.backend))
         # current_wdir = os.path.realpath(os.getcwd())
         #
         # if script_dir == current_wdir:
@@ -136,37 +324,357 @@ def main():
     print("Input ds filename: " + input_filename)
     print("Output file set to " + output_filename)
     print("=" * 16)
-    print("Reading ds project file...")
+    print("Reading, parsing and visualizing ds project...")
+
+    cache = None
+    if args.cache_dir is not None:
+        cache = RenderCache(args.cache_dir, max_bytes=cache_max_bytes)
+
+    if args.watch:
+        return run_watch(input_filename, output_filename, cache, options, style, args.jobs)
 
+    # segments are read, parsed and drawn one at a time
+    f0_stats = DecimationStats()
+    validation = None
+    if args.skip_bad_segments:
+        from core.validation import ValidationReport
+        validation = ValidationReport(filename=input_filename)
     try:
-        with open(input_filename, 'r', encoding='utf-8') as f:
-            ds = json.load(f)
-        if not isinstance(ds, list):
-            ds = [ds]
-    except FileNotFoundError:
-        print("ERROR: Input file not found: " + input_filename)
+        if c_profiler is not None:
+            c_profiler.enable()
+        render_file(input_filename, output_filename, cache=cache, tile_jobs=args.jobs, f0_stats=f0_stats,
+                    profiler=profiler, validation=validation, **options, **style)
+    except FileNotFoundError as e:
+        print("ERROR: " + missing_file_message(e, input_filename))
+        report_profile(profiler, c_profiler, args)
         return 2
-
-    print("Parsing notes and phonemes...")
-    segments = [parse_segment(s) for s in ds]
-    track = Track(segments=segments)
-
-    print("Visualizing ds project...")
-    visualize_track(track, output_filename,
-                    color_f0=color_f0,
-                    color_body=color_body,
-                    color_head=color_head,
-                    color_text=color_text,
-                    figsize=figsize,
-                    dpi=dpi,
-                    aspect=aspect,
-                    font_name=font_name,
-                    font_size=font_size,
-                    font_style=font_style,
-                    display_f0=display_f0)
+    except (KeyError, ValueError) as e:
+        print("ERROR: Failed to parse {}: {}".format(input_filename, e))
+        report_profile(profiler, c_profiler, args)
+        return 3
     print("Saved visualization to " + output_filename)
+    if validation is not None:
+        report_skipped(validation)
+    if display_f0:
+        print("Pitch curve: " + str(f0_stats))
+    if cache is not None:
+        print("Render cache: " + cache.stats())
+    report_profile(profiler, c_profiler, args)
+    return 0
+
+
+def convert_main(argv):
+    argument_parser = argparse.ArgumentParser(prog='main.py convert',
+                                              description='parse .ds project files once into binary tracks (.dsb), '
+                                                          'which render and load without parsing')
+    argument_parser.add_argument('-i', '--input',
+                                 type=str,
+                                 nargs='+',
+                                 required=True,
+                                 help='input .ds project file(s), directories or glob patterns')
+    argument_parser.add_argument('-o', '--output',
+                                 type=str,
+                                 required=False,
+                                 help='output file for a single input, output directory for several '
+                                      '(default: next to each input)')
+    argument_parser.add_argument('-j', '--jobs',
+                                 type=int,
+                                 required=False,
+                                 help='number of worker processes (default: number of CPUs)')
+    args = argument_parser.parse_args(argv)
+
+    from visualizer.batch import convert_batch, expand_inputs
+    from visualizer.pipeline import get_output_filename
+
+    is_batch = len(args.input) > 1 or os.path.isdir(args.input[0]) or glob.has_magic(args.input[0])
+    input_filenames = [x for x in expand_inputs(args.input) if not x.lower().endswith('.dsb')]
+    if not input_filenames:
+        print("ERROR: No input files found!")
+        return 1
+    if is_batch and args.output is not None:
+        os.makedirs(args.output, exist_ok=True)
+
+    jobs_list = []
+    for input_filename in input_filenames:
+        if not is_batch and args.output is not None:
+            output_filename = args.output
+        else:
+            output_dir = args.output if args.output is not None else os.path.dirname(input_filename)
+            output_filename = get_output_filename(input_filename, output_dir, '.dsb')
+        jobs_list.append((input_filename, output_filename))
+
+    def report(result):
+        status = "OK" if result.ok else "FAILED ({})".format(result.error)
+        print("{} -> {} {} ({:.2f}s)".format(result.input, result.output, status, result.elapsed))
+
+    results = convert_batch(jobs_list, jobs=args.jobs, callback=report)
+    failed = [x for x in results if not x.ok]
+    print("Converted {} of {} file(s)".format(len(results) - len(failed), len(results)))
+    return 3 if failed else 0
+
+
+def analyze_main(argv):
+    argument_parser = argparse.ArgumentParser(prog='main.py analyze',
+                                              description='compute per-note pitch deviation and voicing, and phoneme '
+                                                          'duration distributions, of .ds project files as CSV tables')
+    argument_parser.add_argument('-i', '--input',
+                                 type=str,
+                                 nargs='+',
+                                 required=True,
+                                 help='input .ds project file(s) or binary tracks, directories or glob patterns')
+    argument_parser.add_argument('-o', '--output',
+                                 type=str,
+                                 required=True,
+                                 help='CSV file of the note statistics, a row per note of every file')
+    argument_parser.add_argument('--phoneme-output',
+                                 type=str,
+                                 required=False,
+                                 help='CSV file of the phoneme duration distributions '
+                                      '(default: <output>_phonemes.csv)')
+    argument_parser.add_argument('-j', '--jobs',
+                                 type=int,
+                                 required=False,
+                                 help='number of worker processes (default: number of CPUs)')
+    args = argument_parser.parse_args(argv)
+
+    import numpy as np
+    from core.analytics import phoneme_statistics, write_note_csv, write_phoneme_csv
+    from visualizer.batch import analyze_batch, expand_inputs
+
+    input_filenames = expand_inputs(args.input)
+    if not input_filenames:
+        print("ERROR: No input files found!")
+        return 1
+    phoneme_output = args.phoneme_output
+    if phoneme_output is None:
+        phoneme_output = os.path.splitext(args.output)[0] + '_phonemes.csv'
+    # fail before the analysis rather than after it
+    for output_dir in sorted({os.path.dirname(os.path.abspath(x)) for x in (args.output, phoneme_output)}):
+        if not os.path.isdir(output_dir):
+            print("ERROR: Output directory not found: {}".format(output_dir))
+            return 1
+
+    def report(analysis):
+        if not analysis.ok:
+            print("FAILED: {}: {}".format(analysis.filename, analysis.error))
+
+    start = time.perf_counter()
+    results = analyze_batch(input_filenames, jobs=args.jobs, callback=report)
+    analyses = [x for x in results if x.ok]
+    ph_seq = [x.ph_seq for x in analyses]
+    ph_dur = [x.ph_dur for x in analyses]
+    try:
+        write_note_csv(analyses, args.output)
+        write_phoneme_csv(phoneme_statistics(np.concatenate(ph_seq) if ph_seq else np.array([], dtype=str),
+                                             np.concatenate(ph_dur) if ph_dur else np.array([])), phoneme_output)
+    except OSError as e:
+        print("ERROR: Failed to save the statistics: {}".format(e))
+        return 1
+
+    notes = sum(len(x.notes) for x in analyses)
+    deviations = np.concatenate([x.notes.mean_abs_cents for x in analyses]) if analyses else np.array([])
+    deviations = deviations[np.isfinite(deviations)]
+    print("Analyzed {} of {} file(s) in {:.2f}s: {} segment(s), {} note(s)".format(
+        len(analyses), len(results), time.perf_counter() - start, sum(x.segments for x in analyses), notes))
+    if len(deviations) > 0:
+        print("Pitch deviation of voiced notes: mean {:.1f} cents, median {:.1f} cents".format(
+            float(deviations.mean()), float(np.median(deviations))))
+    print("Saved note statistics to {} and phoneme durations to {}".format(args.output, phoneme_output))
+    return 3 if len(analyses) < len(results) else 0
+
+
+def run_combined(inputs, output_filename, mode, track_colors, jobs, style, cache_dir=None, cache_max_bytes=None,
+                 options=None, profiler=None, c_profiler=None, args=None):
+    from utils.misc import missing_file_message
+    from visualizer.batch import expand_inputs
+    from visualizer.pipeline import get_output_filename, render_tracks
+    from visualizer.primitives import DecimationStats
+
+    input_filenames = expand_inputs(inputs)
+    if not input_filenames:
+        print("ERROR: No input files found!")
+        return 1
+    if output_filename is None:
+        output_filename = get_output_filename(input_filenames[0])
+    options = {k: v for k, v in options.items() if k not in ('tile_length', 'glyph_atlas')}
+
+    print("Combining {} track(s) ({}) into {}".format(len(input_filenames), mode, output_filename))
+    for index, input_filename in enumerate(input_filenames):
+        print("  {}: {}".format(index + 1, input_filename))
+    print("=" * 16)
+
+    f0_stats = DecimationStats()
+    validation = [] if options.get('skip_bad_segments') else None
+    start = time.perf_counter()
+    try:
+        if c_profiler is not None:
+            c_profiler.enable()
+        render_tracks(input_filenames, output_filename, mode=mode, track_colors=track_colors, jobs=jobs,
+                      cache_dir=cache_dir, cache_max_bytes=cache_max_bytes, f0_stats=f0_stats, profiler=profiler,
+                      validation=validation, **options, **style)
+    except FileNotFoundError as e:
+        print("ERROR: " + missing_file_message(e, input_filenames))
+        report_profile(profiler, c_profiler, args)
+        return 2
+    except (KeyError, ValueError) as e:
+        print("ERROR: Failed to render tracks: {}".format(e))
+        report_profile(profiler, c_profiler, args)
+        return 3
+    print("Saved visualization of {} track(s) to {} in {:.2f}s".format(len(input_filenames), output_filename,
+                                                                      time.perf_counter() - start))
+    for report in validation or []:
+        report_skipped(report)
+    if style['display_f0']:
+        print("Pitch curve: " + str(f0_stats))
+    report_profile(profiler, c_profiler, args)
+    return 0
+
+
+def run_watch(input_filename, output_filename, cache, options, style, jobs=None):
+    from visualizer.cache import MemoryRenderCache
+    from visualizer.watch import watch_file
+
+    def report(result):
+        timestamp = time.strftime('%H:%M:%S')
+        if result.ok:
+            print("[{}] Saved visualization to {} in {:.2f}s ({} segment(s) parsed, {} reused)".format(
+                timestamp, output_filename, result.elapsed, result.parsed, result.reused))
+        else:
+            print("[{}] ERROR: {}".format(timestamp, result.error))
+
+    print("Watching {} for changes, press Ctrl+C to stop".format(input_filename))
+    try:
+        watch_file(input_filename, output_filename, cache=MemoryRenderCache(backing=cache), callback=report,
+                   tile_jobs=jobs, **options, **style)
+    except KeyboardInterrupt:
+        pass
     return 0
 
 
+def output_extension(backend):
+    # default output format of a backend
+    return '.png' if backend == 'raster' else '.svg'
+
+
+def report_skipped(validation):
+    bad_segments = validation.bad_segments
+    if bad_segments:
+        print("Skipped {} of {} segment(s) of {}:".format(len(bad_segments), validation.segments, validation.filename))
+        for issue in validation.errors:
+            print("  " + str(issue))
+    if validation.warnings:
+        print("{} warning(s) in {}, see --check-only".format(len(validation.warnings), validation.filename))
+
+
+def run_check(inputs, jobs):
+    # reads and validates only, so neither matplotlib nor the renderers are imported
+    from visualizer.batch import check_batch, expand_inputs
+
+    # binary tracks hold parsed segments, which were validated when they were converted
+    input_filenames = [x for x in expand_inputs(inputs) if os.path.splitext(x)[1].lower() != '.dsb']
+    if not input_filenames:
+        print("ERROR: No input files found!")
+        return 1
+
+    def report(result):
+        status = "OK" if result.ok else "INVALID"
+        print("{} {} ({})".format(result.filename, status, result.summary()))
+        for issue in result.issues:
+            print("  " + str(issue))
+
+    start = time.perf_counter()
+    results = check_batch(input_filenames, jobs=jobs, callback=report)
+    invalid = [x for x in results if not x.ok]
+    print("=" * 16)
+    print("Checked {} file(s), {} segment(s) in {:.2f}s: {} invalid file(s), {} error(s), {} warning(s)".format(
+        len(results), sum(x.segments for x in results), time.perf_counter() - start, len(invalid),
+        sum(len(x.errors) for x in results), sum(len(x.warnings) for x in results)))
+    return 3 if invalid else 0
+
+
+def report_profile(profiler, c_profiler, args):
+    if c_profiler is not None:
+        c_profiler.disable()
+        c_profiler.dump_stats(args.cprofile)
+        print("cProfile statistics written to " + args.cprofile)
+    if profiler is None:
+        return
+    profiler.stop()
+    report = profiler.to_json() if args.profile == 'json' else profiler.to_table()
+    if args.profile_output is not None:
+        with open(args.profile_output, 'w', encoding='utf-8') as f:
+            f.write(report + '\n')
+        print("Profile written to " + args.profile_output)
+    else:
+        print("=" * 16)
+        print(report)
+
+
+def run_batch(inputs, output_dir, jobs, style, cache_dir=None, cache_max_bytes=None, options=None,
+              profiler=None, c_profiler=None, args=None):
+    from visualizer.batch import expand_inputs, render_batch
+    from visualizer.pipeline import get_output_filename
+
+    input_filenames = expand_inputs(inputs)
+    if not input_filenames:
+        print("ERROR: No input files found!")
+        return 1
+    if output_dir is None:
+        output_dir = os.getcwd()
+    os.makedirs(output_dir, exist_ok=True)
+
+    jobs_list = []
+    seen_outputs = set()
+    for input_filename in input_filenames:
+        output_filename = get_output_filename(input_filename, output_dir, output_extension(options['backend']))
+        if output_filename in seen_outputs:
+            print("WARNING: Skipping {}: output {} is already used by another input".format(input_filename, output_filename))
+            continue
+        seen_outputs.add(output_filename)
+        jobs_list.append((input_filename, output_filename))
+
+    print("Batch mode: {} file(s), output directory {}".format(len(jobs_list), output_dir))
+    print("=" * 16)
+
+    finished = 0
+
+    def report(result):
+        nonlocal finished
+        finished += 1
+        status = "OK" if result.ok else "FAILED ({})".format(result.error)
+        print("[{}/{}] {} {} ({:.2f}s)".format(finished, len(jobs_list), result.input, status, result.elapsed))
+
+    start = time.perf_counter()
+    if c_profiler is not None:
+        c_profiler.enable()
+    results = render_batch(jobs_list, style, jobs=jobs, callback=report,
+                           cache_dir=cache_dir, cache_max_bytes=cache_max_bytes,
+                           options=options, profile=profiler is not None,
+                           profile_memory=profiler is not None and profiler.trace_memory)
+    failed = [x for x in results if not x.ok]
+
+    print("=" * 16)
+    print("Rendered {} of {} file(s) in {:.2f}s".format(len(results) - len(failed), len(results), time.perf_counter() - start))
+    if style['display_f0']:
+        f0_points = sum(x.f0_points for x in results)
+        f0_kept = sum(x.f0_kept for x in results)
+        print("Pitch curve: {} of {} point(s) drawn, {} dropped".format(f0_kept, f0_points, f0_points - f0_kept))
+    if cache_dir is not None:
+        print("Render cache: {} hit(s), {} miss(es)".format(sum(x.cache_hits for x in results),
+                                                            sum(x.cache_misses for x in results)))
+    for result in results:
+        if result.validation is not None and (result.validation.bad_segments or result.validation.warnings):
+            report_skipped(result.validation)
+    for result in failed:
+        print("FAILED: {}: {}".format(result.input, result.error))
+    if profiler is not None:
+        # stage times are summed over all files (and workers)
+        for result in results:
+            if result.profile is not None:
+                profiler.merge(result.profile)
+    report_profile(profiler, c_profiler, args)
+    return 3 if failed else 0
+
+
 if __name__ == '__main__':
     sys.exit(main())
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""Property tests of the tick-based layout against the float layout it replaced.
+
+Segments are generated at random from fixed seeds, with words of one to four
+phonemes (vowel first, the last one a head), slurs, rests and AP/SP words.
+"""
+
+import numpy as np
+import pytest
+
+from core.models import *
+from core.parsers import *
+
+VOWELS = ['a', 'i', 'u', 'e', 'o']
+CONSONANTS = ['k', 't', 'n', 's', 'y', 'w']
+NOTES = ['C4', 'D#4', 'E♭4', 'G4', 'A𝄪3', 'B𝄫4', 'F♯5']
+
+
+def make_segment(seed: int, words: int = 40, step: float = 1 / 64, mismatch: float = 0.2) -> dict:
+    """A random raw segment; durations are multiples of `step` seconds.
+
+    With probability `mismatch`, the phoneme durations of a word do not add up to its
+    note durations, which sends heads past the last note and bodies into later notes.
+    """
+    rng = np.random.default_rng(seed)
+    text, ph_seq, ph_dur, ph_num, note_seq, note_dur, note_slur = [], [], [], [], [], [], []
+    for _ in range(words):
+        kind = rng.random()
+        if kind < 0.15:
+            phonemes = [str(rng.choice(['SP', 'AP']))]
+            names = ['rest']
+        else:
+            count = int(rng.choice([1, 2, 3, 4], p=[0.3, 0.4, 0.2, 0.1]))
+            phonemes = [str(rng.choice(VOWELS))] + [str(rng.choice(CONSONANTS)) for _ in range(count - 1)]
+            if count > 2 and rng.random() < 0.2:
+                phonemes[1] = str(rng.choice(['SP', 'AP']))
+            slurs = int(rng.geometric(0.6)) - 1
+            # rests inside sung words have no pitch, which is filled from the next note
+            names = [str(rng.choice(NOTES)) if rng.random() > 0.15 else 'rest' for _ in range(1 + slurs)]
+        ticks = rng.integers(1, 48, len(names))
+        if rng.random() < 0.05:
+            ticks[rng.integers(len(ticks))] = 0
+        total = int(ticks.sum())
+        # the vowel takes what the other phonemes leave over, at least one step
+        others = rng.integers(1, 8, len(phonemes) - 1)
+        if rng.random() < mismatch:
+            total += int(rng.integers(-total + 1, 16))
+        first = max(total - int(others.sum()), 1)
+        text.append('la' if phonemes[0] not in ('SP', 'AP') else phonemes[0])
+        ph_seq.extend(phonemes)
+        ph_dur.extend([first] + others.tolist())
+        ph_num.append(len(phonemes))
+        note_seq.extend(names)
+        note_dur.extend(ticks.tolist())
+        note_slur.extend([0] + [1] * (len(names) - 1))
+    return {
+        'offset': float(rng.integers(0, 1000)) * step,
+        'text': ' '.join(text),
+        'ph_seq': ' '.join(ph_seq),
+        'ph_dur': ' '.join(repr(x * step) for x in ph_dur),
+        'ph_num': ' '.join(str(x) for x in ph_num),
+        'note_seq': ' '.join(note_seq),
+        'note_dur': ' '.join(repr(x * step) for x in note_dur),
+        'note_slur': ' '.join(str(x) for x in note_slur),
+        'f0_seq': ' '.join(['440.0'] * 10),
+        'f0_timestep': '0.005',
+    }
+
+
+def reference_units(segment: Segment) -> list:
+    """The float layout that the tick-based layout replaced, as (lyric, phoneme, offset, duration, pitch, category)."""
+    units = []
+    slur_stack = []
+    for i, note in enumerate(segment.notes):
+        slur_stack.append(note)
+        if i + 1 < len(segment.notes) and segment.notes[i + 1].is_slur:
+            continue
+        phonemes = slur_stack[0].phonemes
+        note_durs = [x.duration for x in slur_stack]
+        heads = sum(x.duration for x in phonemes if x.category == PhonemeCategory.HEAD)
+        bodies = sum(note_durs) - heads
+        delta = bodies - sum(x.duration for x in phonemes if x.category != PhonemeCategory.HEAD)
+        offset = segment.offset + slur_stack[0].offset
+        split = 0
+        tmp = bodies
+        for duration in note_durs:
+            tmp -= duration
+            if tmp < 0:
+                break
+            split += 1
+        idx_note = idx_ph = 0
+        ph_remaining = note_remaining = 0
+        while idx_note < len(slur_stack) and idx_ph < len(phonemes):
+            phoneme = phonemes[idx_ph]
+            if ph_remaining == 0:
+                ph_remaining = phoneme.duration
+            lyric = slur_stack[idx_note].text if phoneme.category == PhonemeCategory.BODY else ''
+            pitch = slur_stack[idx_note].midi_pitch
+            if phoneme.category != PhonemeCategory.HEAD and idx_note < split:
+                duration = note_durs[idx_note]
+                ph_remaining -= duration
+                idx_note += 1
+            elif phoneme.category != PhonemeCategory.HEAD:
+                ph_remaining += delta
+                duration = ph_remaining
+                note_remaining = max(0.0, note_durs[idx_note] - ph_remaining)
+                if note_remaining == 0:
+                    idx_note += 1
+                ph_remaining = 0
+                idx_ph += 1
+            else:
+                duration = note_remaining if idx_note == split else ph_remaining
+                ph_remaining -= duration
+                idx_note += 1
+            units.append([lyric, phoneme.name, offset, duration, pitch, phoneme.category.value])
+            offset += duration
+        slur_stack.clear()
+
+    last_pitch = None
+    for unit in reversed(units):
+        if unit[5] in (PhonemeCategory.SP.value, PhonemeCategory.AP.value):
+            continue
+        if last_pitch is not None and unit[4] == -1:
+            unit[4] = last_pitch
+        last_pitch = unit[4]
+    return units
+
+
+def table_rows(table: VisualizeUnitTable) -> list:
+    return list(zip(table.text_lyric.tolist(), table.text_phoneme.tolist(), table.offset.tolist(),
+                    table.duration.tolist(), table.midi_pitch.tolist(), table.category.tolist()))
+
+
+def assert_rows_close(actual: list, expected: list):
+    # same strings, pitches and categories; times up to float rounding of the old layout
+    assert len(actual) == len(expected)
+    for a, e in zip(actual, expected):
+        assert (a[0], a[1], a[4], a[5]) == (e[0], e[1], e[4], e[5])
+        assert a[2] == pytest.approx(e[2], abs=1e-9)
+        assert a[3] == pytest.approx(e[3], abs=1e-9)
+
+
+def assert_same_columns(actual: VisualizeUnitTable, expected: VisualizeUnitTable):
+    assert actual.text_lyric.tolist() == expected.text_lyric.tolist()
+    assert actual.text_phoneme.tolist() == expected.text_phoneme.tolist()
+    np.testing.assert_array_equal(actual.offset, expected.offset)
+    np.testing.assert_array_equal(actual.duration, expected.duration)
+    np.testing.assert_array_equal(actual.midi_pitch, expected.midi_pitch)
+    np.testing.assert_array_equal(actual.category, expected.category)
+
+
+def test_generated_segments_cover_the_group_shapes():
+    raw_segments = [make_segment(seed) for seed in range(20)]
+    ph_num = np.concatenate([np.array(x['ph_num'].split(), dtype=np.int64) for x in raw_segments])
+    ph_seq = set(' '.join(x['ph_seq'] for x in raw_segments).split())
+    note_seq = ' '.join(x['note_seq'] for x in raw_segments).split()
+    assert set(ph_num.tolist()) == {1, 2, 3, 4}
+    assert {'SP', 'AP'} <= ph_seq
+    assert 'rest' in note_seq
+    assert '1' in ' '.join(x['note_slur'] for x in raw_segments).split()
+
+
+@pytest.mark.parametrize('seed', range(50))
+def test_loop_layout_matches_float_layout(seed):
+    segment = parse_segment(make_segment(seed))
+    assert_rows_close(table_rows(get_visualize_unit_table_segment(segment)), reference_units(segment))
+
+
+@pytest.mark.parametrize('seed', range(50))
+@pytest.mark.parametrize('step', [1 / 64, 0.001])
+def test_vectorized_layout_matches_loop_layout(seed, step):
+    raw_segment = make_segment(seed, step=step)
+    expected = get_visualize_unit_table_segment(parse_segment(raw_segment))
+    actual = get_visualize_unit_table_arrays(parse_segment_arrays(raw_segment))
+    assert_same_columns(actual, expected)
+
+
+@pytest.mark.parametrize('ph_num', [1, 2, 3, 4])
+@pytest.mark.parametrize('slurs', [0, 1, 3])
+def test_word_shapes(ph_num, slurs):
+    # a word sung over `1 + slurs` notes of 0.25 s whose phoneme durations add up to them
+    phonemes = ['a', 'n', 't', 's'][:ph_num]
+    ph_dur = [0.25 * (1 + slurs) - 0.0625 * (ph_num - 1)] + [0.0625] * (ph_num - 1)
+    raw_segment = {
+        'offset': 1.0,
+        'text': 'SP la AP',
+        'ph_seq': ' '.join(['SP'] + phonemes + ['AP']),
+        'ph_dur': ' '.join(str(x) for x in [0.5] + ph_dur + [0.5]),
+        'ph_num': '1 {} 1'.format(ph_num),
+        'note_seq': ' '.join(['rest'] + ['rest'] + ['C4'] * slurs + ['rest']),
+        'note_dur': ' '.join(['0.5'] + ['0.25'] * (1 + slurs) + ['0.5']),
+        'note_slur': ' '.join(['0', '0'] + ['1'] * slurs + ['0']),
+        'f0_seq': '440.0',
+        'f0_timestep': '0.005',
+    }
+    segment = parse_segment(raw_segment)
+    table = get_visualize_unit_table_segment(segment)
+    assert_same_columns(get_visualize_unit_table_arrays(parse_segment_arrays(raw_segment)), table)
+    assert_rows_close(table_rows(table), reference_units(segment))
+    assert table.offset[0] == 1.0
+    if ph_num <= 2:
+        # units tile the segment; with more phonemes, later bodies are measured against
+        # the whole note rather than what is left of it, as they always were
+        np.testing.assert_allclose(table.offset[1:], table.offset[:-1] + table.duration[:-1])
+        assert table.offset[-1] + table.duration[-1] == pytest.approx(2.0 + 0.25 * (1 + slurs))
+    # the rest the word starts on takes the pitch of its slur, SP and AP keep none
+    categories = table.category.tolist()
+    assert table.midi_pitch[[i for i, c in enumerate(categories) if c == PhonemeCategory.SP.value]].tolist() == [-1]
+    assert table.midi_pitch[[i for i, c in enumerate(categories) if c == PhonemeCategory.AP.value]].tolist() == [-1]
+    sung = [i for i, c in enumerate(categories) if c in (PhonemeCategory.BODY.value, PhonemeCategory.HEAD.value)]
+    assert table.midi_pitch[sung].tolist() == [60 if slurs else -1] * len(sung)
+    if ph_num > 1:
+        assert categories[sung[-1]] == PhonemeCategory.HEAD.value
+    if ph_num == 2:
+        assert table.duration[sung[-1]] == pytest.approx(0.0625)
+
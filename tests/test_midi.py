@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+import itertools
+
+import numpy as np
+import pytest
+
+from utils import *
+
+SHARPS = ['#', '♯', '𝄪']
+FLATS = ['b', 'B', '♭', '𝄫']
+# invalid accidentals and junk go through the memoized fallback
+OTHERS = ['x', 'X', '-', ' ', 's', '#b', 'b#', '♯b']
+
+
+def all_spellings():
+    accidentals = [''] + [''.join(x) for n in (1, 2, 3) for x in itertools.product(SHARPS + FLATS, repeat=n)] + OTHERS
+    octaves = [str(x) for x in range(-12, 21)] + ['', '-', '00', '04', '+4']
+    for letter, accidental, octave in itertools.product('ABCDEFGHabcdefgh', accidentals, octaves):
+        yield letter + accidental + octave
+    yield from ('rest', 'REST', 'Rest', 'rEsT', 'r', 'res', 'rest4', '', 'C4C5', 'xC4', 'C4 ', ' C4', '4')
+
+
+def test_notes_to_midi_matches_note_to_midi_on_every_spelling():
+    spellings = list(all_spellings())
+    expected = np.array([note_to_midi(x) for x in spellings], dtype=np.int64)
+    actual = notes_to_midi(spellings)
+    mismatches = [(spellings[i], int(expected[i]), int(actual[i])) for i in np.flatnonzero(actual != expected)]
+    assert mismatches == []
+
+
+@pytest.mark.parametrize('note, midi', [
+    ('C4', 60), ('c4', 60), ('A4', 69), ('C-1', 0), ('G9', 127), ('C#4', 61), ('C♯4', 61), ('Db4', 61),
+    ('D♭4', 61), ('DB4', 61), ('C𝄪4', 62), ('C##4', 62), ('D𝄫4', 60), ('Dbb4', 60), ('D♭♭4', 60),
+    ('rest', -1), ('REST', -1), ('', -1), ('H4', -1), ('Cx4', -1), ('C', -1),
+])
+def test_known_pitches(note, midi):
+    assert note_to_midi(note) == midi
+    assert notes_to_midi([note]).tolist() == [midi]
+
+
+def test_notes_to_midi_keeps_shape_and_order():
+    rng = np.random.default_rng(0)
+    names = np.array(['rest', 'C4', 'D#4', 'E♭5', 'weird', 'G𝄫3'])[rng.integers(0, 6, 1000)]
+    assert notes_to_midi(names).tolist() == [note_to_midi(x) for x in names.tolist()]
+    assert notes_to_midi(iter(names.tolist())).tolist() == notes_to_midi(names).tolist()
+    result = notes_to_midi([])
+    assert result.dtype == np.int64 and len(result) == 0
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+
+import pytest
+
+matplotlib = pytest.importorskip('matplotlib')
+
+from core.validation import *
+from visualizer.backends import use_non_interactive_backend
+from visualizer.cache import MemoryRenderCache
+from visualizer.pipeline import render_file
+
+from .test_layout import make_segment
+
+FONT = os.path.join(matplotlib.get_data_path(), 'fonts', 'ttf', 'DejaVuSans.ttf')
+
+
+@pytest.fixture
+def track_with_bad_segment(tmp_path):
+    raw_segments = [dict(make_segment(seed, words=10), offset=20.0 * seed) for seed in range(3)]
+    del raw_segments[1]['ph_seq']
+    filename = str(tmp_path / 'track.ds')
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump(raw_segments, f)
+    return filename
+
+
+def render_reporting(filename, output, **options):
+    validation = ValidationReport(filename=filename)
+    cache = MemoryRenderCache()
+    render_file(filename, output, cache=cache, skip_bad_segments=True, validation=validation,
+                font_name=FONT, **options)
+    return validation, (cache.hits, cache.misses)
+
+
+def test_tiles_report_every_segment_once(track_with_bad_segment, tmp_path):
+    use_non_interactive_backend()
+    validation, counts = render_reporting(track_with_bad_segment, str(tmp_path / 'whole.png'))
+    tiled_validation, tiled_counts = render_reporting(track_with_bad_segment, str(tmp_path / 'tiles.png'),
+                                                      tile_length=30, figsize=(4, 1))
+    assert validation.segments == 3
+    assert validation.bad_segments == [1]
+    assert tiled_validation == validation
+    assert tiled_counts == counts == (0, 2)
+    assert os.path.exists(str(tmp_path / 'tiles_000.png'))
+
+
+def test_svg_embeds_the_label_glyphs(track_with_bad_segment, tmp_path):
+    pytest.importorskip('fontTools')
+    output = str(tmp_path / 'track.svg')
+    render_file(track_with_bad_segment, output, backend='svg', skip_bad_segments=True, font_name=FONT)
+    with open(output, 'r', encoding='utf-8') as f:
+        svg = f.read()
+    assert 'src: url(data:font/woff;base64,' in svg
+    assert os.path.dirname(FONT) not in svg and 'file:' not in svg
+
+
+def test_svg_reports_a_missing_font(track_with_bad_segment, tmp_path):
+    output = str(tmp_path / 'track.svg')
+    with pytest.raises(FileNotFoundError):
+        render_file(track_with_bad_segment, output, backend='svg', skip_bad_segments=True,
+                    font_name=str(tmp_path / 'missing.ttf'))
+    assert not os.path.exists(output)
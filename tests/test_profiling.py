@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+import tracemalloc
+
+import pytest
+
+from utils.profiling import *
+
+
+@pytest.mark.parametrize('trace_memory', [False, True])
+def test_memory_is_traced_only_on_request(trace_memory):
+    assert not tracemalloc.is_tracing()
+    profiler = Profiler(trace_memory=trace_memory)
+    profiler.start()
+    with profiler.stage('parse'):
+        assert tracemalloc.is_tracing() == trace_memory
+        data = [bytearray(1 << 20)]
+    profiler.stop()
+    assert not tracemalloc.is_tracing()
+    assert (profiler.stages['parse']['peak_memory'] >= len(data[0])) == trace_memory
+    table = profiler.to_table()
+    assert ('times include the overhead of tracing memory allocations' in table) == trace_memory
+    assert profiler.to_dict()['trace_memory'] == trace_memory
+
+
+def test_merged_reports_keep_the_memory_note():
+    worker = Profiler(trace_memory=True)
+    worker.start()
+    with worker.stage('parse'):
+        pass
+    worker.stop()
+    profiler = Profiler()
+    profiler.merge(worker.to_dict())
+    assert profiler.trace_memory
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from visualizer.server import RenderServer
+
+
+@pytest.fixture
+def server():
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        server = RenderServer(('127.0.0.1', 0), executor, style={}, options={}, quiet=True)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        yield server
+        server.shutdown()
+        server.server_close()
+
+
+def post(server, headers: str) -> bytes:
+    # raw request, so that the headers are sent as given
+    with socket.create_connection(server.server_address, timeout=5) as connection:
+        connection.sendall('POST /render HTTP/1.1\r\nHost: localhost\r\n{}\r\n'.format(headers).encode('ascii'))
+        return connection.recv(65536)
+
+
+def test_negative_content_length_is_rejected(server):
+    assert post(server, 'Content-Length: -1\r\n').startswith(b'HTTP/1.0 400 ')
+    assert server.metrics.to_dict()['errors'] == 1
+
+
+def test_missing_content_length_is_rejected(server):
+    assert post(server, 'Transfer-Encoding: chunked\r\n').startswith(b'HTTP/1.0 411 ')
+
+
+def test_oversized_body_is_rejected(server):
+    server.max_body_bytes = 10
+    assert post(server, 'Content-Length: 11\r\n').startswith(b'HTTP/1.0 400 ')
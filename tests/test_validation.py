@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from core.parsers import *
+from core.validation import *
+
+SEGMENT = {
+    'offset': 0.5,
+    'text': 'SP la AP',
+    'ph_seq': 'SP l a AP',
+    'ph_dur': '0.5 0.1 0.4 0.5',
+    'ph_num': '1 2 1',
+    'note_seq': 'rest C4 rest',
+    'note_dur': '0.5 0.5 0.5',
+    'note_slur': '0 0 0',
+    'f0_seq': '261.6 261.6 261.6',
+    'f0_timestep': '0.005',
+}
+
+
+@pytest.mark.parametrize('f0_timestep', ['0.005', 0.005, 1])
+def test_numeric_f0_timestep_is_valid(f0_timestep):
+    raw_segment = dict(SEGMENT, f0_timestep=f0_timestep)
+    assert validate_segment(raw_segment) == []
+    assert parse_segment(raw_segment) is not None
+
+
+@pytest.mark.parametrize('f0_timestep', [None, [0.005], {'value': 0.005}])
+def test_other_f0_timestep_is_missing(f0_timestep):
+    raw_segment = dict(SEGMENT, f0_timestep=f0_timestep)
+    assert [x.code for x in validate_segment(raw_segment)] == ['missing_field']
+    with pytest.raises((TypeError, ValueError)):
+        parse_segment(raw_segment)
@@ -2,4 +2,6 @@
 
 from .midi import *
 from .numeric import *
+from .decimation import *
 from .misc import *
+from .profiling import *
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+__all__ = [
+    'lttb_indices',
+    'minmax_indices',
+    'decimate_curve'
+]
+
+import math
+
+import numpy as np
+
+
+def lttb_indices(x: "np.array", y: "np.array", n_out: int) -> "np.array":
+    """Indices of the points kept by largest-triangle-three-buckets (Steinarsson, 2013).
+
+    The first and last points are always kept; the points in between are split into
+    `n_out - 2` buckets of equal count, and the point of each bucket that forms the
+    largest triangle with the previously kept point and the mean of the next bucket wins.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    # mean of each bucket, and of the last point as the bucket after the last one
+    sums_x = np.add.reduceat(x[:-1], edges[:-1])
+    sums_y = np.add.reduceat(y[:-1], edges[:-1])
+    counts = np.diff(edges)
+    mean_x = np.append(sums_x / counts, x[-1])
+    mean_y = np.append(sums_y / counts, y[-1])
+
+    kept = np.empty(n_out, dtype=np.int64)
+    kept[0] = 0
+    kept[-1] = n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        ax, ay = x[a], y[a]
+        areas = np.abs((ax - mean_x[i + 1]) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (mean_y[i + 1] - ay))
+        a = lo + int(np.argmax(areas))
+        kept[i + 1] = a
+    return kept
+
+
+def minmax_indices(x: "np.array", y: "np.array", bucket_width: float) -> "np.array":
+    """Indices of the first, minimum, maximum and last point of each `bucket_width` wide bucket of x."""
+    n = len(x)
+    if n <= 2:
+        return np.arange(n)
+    buckets = np.floor(x / bucket_width).astype(np.int64)
+    # sort by bucket, then by y: the first item of each bucket is its minimum, the last its maximum
+    order = np.lexsort((y, buckets))
+    starts = np.flatnonzero(np.diff(buckets[order], prepend=buckets[order][0] - 1))
+    ends = np.append(starts[1:], n) - 1
+    kept = np.zeros(n, dtype=bool)
+    kept[order[starts]] = True
+    kept[order[ends]] = True
+    kept[0] = kept[-1] = True
+    return np.flatnonzero(kept)
+
+
+def decimate_curve(x: "np.array", y: "np.array", pixel_width: float, method: str = 'minmax'):
+    """Reduce a curve to about what fits into pixels of `pixel_width` units of x.
+
+    `method` is 'lttb' (`lttb_indices`, one point per pixel), 'minmax' (`minmax_indices`)
+    or 'none'. Runs of finite y values are decimated separately and joined by a single
+    NaN, so that plotting breaks the curve at unvoiced samples. Returns the new (x, y).
+    """
+    if method not in ('none', 'lttb', 'minmax'):
+        raise ValueError("Unknown decimation method: {}".format(method))
+    finite = np.isfinite(y)
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], finite.astype(np.int8), [0]])))
+    pieces = []
+    for start, end in zip(edges[::2].tolist(), edges[1::2].tolist()):
+        if method == 'lttb':
+            n_out = max(3, math.ceil((x[end - 1] - x[start]) / pixel_width) + 1)
+            indices = lttb_indices(x[start:end], y[start:end], n_out)
+        elif method == 'minmax':
+            indices = minmax_indices(x[start:end], y[start:end], pixel_width)
+        else:
+            indices = np.arange(end - start)
+        pieces.append(indices + start)
+    if not pieces:
+        return x[:0], y[:0]
+    # a break between two runs repeats the last x of the run (x stays sorted) with y = NaN
+    indices = np.concatenate([np.append(piece, piece[-1]) for piece in pieces[:-1]] + [pieces[-1]])
+    breaks = np.cumsum([len(piece) + 1 for piece in pieces[:-1]], dtype=np.int64) - 1
+    new_y = y[indices]
+    new_y[breaks] = np.nan
+    return x[indices], new_y
@@ -3,9 +3,13 @@
 __all__ = [
     'f0_to_midi',
     'note_to_midi',
+    'notes_to_midi',
 ]
 
+import functools
+import itertools
 import re
+from typing import Iterable, Union
 
 
 import numpy as np
@@ -43,3 +47,46 @@ def note_to_midi(note: str) -> int:
     midi_value += {'c': 0, 'd': 2, 'e': 4, 'f': 5, 'g': 7, 'a': 9, 'b': 11}[note_letter.lower()]
     midi_value += {'#': 1, '##': 2, 'b': -1, 'bb': -2}.get(accidental.lower(), 0)
     return midi_value
+
+
+# spellings of the accidentals accepted by `note_to_midi`, in every case and Unicode form;
+# double accidentals may also be written as two single ones (e.g. 'b\u266d')
+_SHARPS = ['#', '\u266f']
+_FLATS = ['b', 'B', '\u266d']
+_ACCIDENTAL_SPELLINGS = [''] + _SHARPS + _FLATS \
+    + [a + b for a, b in itertools.product(_SHARPS, repeat=2)] \
+    + [a + b for a, b in itertools.product(_FLATS, repeat=2)] \
+    + ['\U0001d12a', '\U0001d12b']
+_TABLE_OCTAVES = range(-1, 10)
+
+
+@functools.lru_cache(maxsize=1)
+def _note_table() -> dict:
+    # built by `note_to_midi` itself, so that the table cannot disagree with it
+    spellings = [letter + accidental + str(octave)
+                 for letter in 'CDEFGABcdefgab'
+                 for accidental in _ACCIDENTAL_SPELLINGS
+                 for octave in _TABLE_OCTAVES]
+    spellings += [''.join(x) for x in itertools.product(*zip('REST', 'rest'))]
+    return {x: note_to_midi(x) for x in spellings}
+
+
+@functools.lru_cache(maxsize=4096)
+def _note_to_midi_cached(note: str) -> int:
+    return note_to_midi(note)
+
+
+def notes_to_midi(notes: Union["np.array", Iterable[str]]) -> "np.array":
+    """`note_to_midi` of a whole `note_seq` at once, as an int64 array.
+
+    Each distinct name is looked up once, in a precomputed table of the usual
+    spellings or, for anything else, through a memoized `note_to_midi`.
+    """
+    notes = np.asarray(notes if isinstance(notes, np.ndarray) else list(notes), dtype=str)
+    if len(notes) == 0:
+        return np.zeros(0, dtype=np.int64)
+    table = _note_table()
+    unique_notes, inverse = np.unique(notes, return_inverse=True)
+    unique_midi = np.array([table[x] if x in table else _note_to_midi_cached(x) for x in unique_notes.tolist()],
+                           dtype=np.int64)
+    return unique_midi[inverse.reshape(-1)]
@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
+import os
 import re
+from typing import Sequence, Union
 
 
 def convert_color_str(s):
@@ -8,3 +10,25 @@ def convert_color_str(s):
         new_s = '#{}'.format(s1)
         return new_s
     return s
+
+
+def shade_color(color: str, factor: float) -> str:
+    """Scale the channels of a '#rrggbb' color by `factor` (below 1 darkens)."""
+    channels = [int(color[i:i + 2], 16) for i in (1, 3, 5)]
+    return '#' + ''.join('{:02x}'.format(min(255, max(0, round(x * factor)))) for x in channels)
+
+
+def missing_file_message(error: FileNotFoundError, input_filenames: Union[str, Sequence[str]]) -> str:
+    """Describe a `FileNotFoundError` raised while working on `input_filenames`.
+
+    Names a missing input if there is one, otherwise the file the error is about,
+    such as the font or an output path in a directory that does not exist.
+    """
+    if isinstance(input_filenames, str):
+        input_filenames = [input_filenames]
+    missing = [x for x in input_filenames if not os.path.exists(x)]
+    if missing:
+        return "Input file not found: {}".format(missing[0])
+    if error.filename is None:
+        return str(error)
+    return "{}: {}".format(error.strerror or "File not found", error.filename)
@@ -1,14 +1,44 @@
 # -*- coding: utf-8 -*-
 
 __all__ = [
-    'float_sum'
+    'TIME_RESOLUTION',
+    'float_sum',
+    'to_ticks',
+    'from_ticks',
+    'ticks_cumsum'
 ]
 
 from typing import Iterable
 
+import numpy as np
 
-def float_sum(nums: Iterable[float], /, epsilon: int = 10000) -> float:
-    s = 0
-    for num in nums:
-        s += num * epsilon
-    return s / epsilon
+# Integer time base used by the parser and layout code: ticks per second.
+# Durations in .ds files have at most 6 decimals, so 1 tick = 1 microsecond keeps
+# them exact and avoids things like 0.1 + 0.2 -> 0.30000000000000004.
+TIME_RESOLUTION = 1000000
+
+
+def to_ticks(seconds, resolution: int = TIME_RESOLUTION):
+    """Round seconds (a scalar or an array) to integer ticks."""
+    if isinstance(seconds, np.ndarray):
+        return np.rint(seconds * resolution).astype(np.int64)
+    return round(float(seconds) * resolution)
+
+
+def from_ticks(ticks, resolution: int = TIME_RESOLUTION):
+    return ticks / resolution
+
+
+def ticks_cumsum(seconds: "np.array", initial: int = 0, resolution: int = TIME_RESOLUTION) -> "np.array":
+    """Exclusive cumulative sum of durations in ticks, i.e. the tick offset of each item."""
+    ticks = to_ticks(np.asarray(seconds, dtype=np.float64), resolution)
+    offsets = np.empty_like(ticks)
+    offsets[:1] = initial
+    np.cumsum(ticks[:-1], out=offsets[1:])
+    offsets[1:] += initial
+    return offsets
+
+
+def float_sum(nums: Iterable[float], /, epsilon: int = TIME_RESOLUTION) -> float:
+    """Sum of seconds (scalars or arrays), rounded to the time base."""
+    return from_ticks(sum(to_ticks(num, epsilon) for num in nums), epsilon)
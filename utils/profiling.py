@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+__all__ = [
+    'Profiler',
+    'profile_stage'
+]
+
+import contextlib
+import json
+import time
+import tracemalloc
+from typing import Dict, Optional
+
+
+class Profiler:
+    """Wall time, CPU time and peak memory per pipeline stage, plus named counters.
+
+    Stages may nest (e.g. parsing happens while the renderer pulls the next segment);
+    the time of a nested stage is not counted again in the enclosing one, so stage
+    times add up to the total. With `trace_memory`, peak memory is that of the Python heap
+    (`tracemalloc`, which includes NumPy arrays) while the stage was active, nested stages
+    included; tracing hooks every allocation, so the times then include its overhead.
+    """
+
+    def __init__(self, trace_memory: bool = False):
+        self.stages = {}  # name -> {'wall', 'cpu', 'peak_memory', 'calls'}
+        self.counts = {}
+        self.trace_memory = trace_memory
+        self._stack = []
+        self._last_wall = None
+        self._last_cpu = None
+        self.total_wall = None
+        self._started = None
+        self._own_tracing = False
+
+    def start(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._own_tracing = True
+        self._started = time.perf_counter()
+
+    def stop(self):
+        self.total_wall = time.perf_counter() - self._started
+        if self._own_tracing:
+            tracemalloc.stop()
+            self._own_tracing = False
+
+    def _switch(self):
+        # charge the time since the last switch to the innermost stage, and the
+        # heap peak since then to every active stage
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        if self._stack:
+            stage = self.stages[self._stack[-1]]
+            stage['wall'] += wall - self._last_wall
+            stage['cpu'] += cpu - self._last_cpu
+            if tracemalloc.is_tracing():
+                peak = tracemalloc.get_traced_memory()[1]
+                for name in self._stack:
+                    self.stages[name]['peak_memory'] = max(self.stages[name]['peak_memory'], peak)
+        if tracemalloc.is_tracing() and hasattr(tracemalloc, 'reset_peak'):  # Python 3.9+
+            tracemalloc.reset_peak()
+        self._last_wall = wall
+        self._last_cpu = cpu
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        if name not in self.stages:
+            self.stages[name] = {'wall': 0.0, 'cpu': 0.0, 'peak_memory': 0, 'calls': 0}
+        self.stages[name]['calls'] += 1
+        self._switch()
+        self._stack.append(name)
+        try:
+            yield
+        finally:
+            self._switch()
+            self._stack.pop()
+
+    def count(self, name: str, n: int = 1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def merge(self, report: Dict):
+        """Add a report of another profiler (see `to_dict`), e.g. from a worker process."""
+        for name, stage in report['stages'].items():
+            mine = self.stages.setdefault(name, {'wall': 0.0, 'cpu': 0.0, 'peak_memory': 0, 'calls': 0})
+            mine['wall'] += stage['wall']
+            mine['cpu'] += stage['cpu']
+            mine['calls'] += stage['calls']
+            mine['peak_memory'] = max(mine['peak_memory'], stage['peak_memory'])
+        for name, n in report['counts'].items():
+            self.count(name, n)
+        self.trace_memory = self.trace_memory or report.get('trace_memory', False)
+
+    def to_dict(self) -> Dict:
+        report = {'stages': self.stages, 'counts': self.counts, 'trace_memory': self.trace_memory}
+        if self.total_wall is not None:
+            report['total_wall'] = self.total_wall
+        try:
+            import resource
+            # kilobytes on Linux
+            report['max_rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        except ImportError:  # not available on Windows
+            pass
+        return report
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=1)
+
+    def to_table(self) -> str:
+        report = self.to_dict()
+        lines = ["{:<12s} {:>10s} {:>10s} {:>14s} {:>8s}".format('stage', 'wall [s]', 'cpu [s]', 'peak mem [MB]', 'calls')]
+        wall = cpu = 0.0
+        for name, stage in report['stages'].items():
+            peak = "{:.1f}".format(stage['peak_memory'] / 2 ** 20) if self.trace_memory else '-'
+            lines.append("{:<12s} {:>10.3f} {:>10.3f} {:>14s} {:>8d}".format(
+                name, stage['wall'], stage['cpu'], peak, stage['calls']))
+            wall += stage['wall']
+            cpu += stage['cpu']
+        lines.append("{:<12s} {:>10.3f} {:>10.3f}".format('(stages)', wall, cpu))
+        if 'total_wall' in report:
+            lines.append("{:<12s} {:>10.3f}".format('(total)', report['total_wall']))
+        if 'max_rss' in report:
+            lines.append("max RSS: {:.1f} MB".format(report['max_rss'] / 2 ** 20))
+        if report['counts']:
+            lines.append("counts: " + ", ".join("{} {}".format(k, v) for k, v in report['counts'].items()))
+        if self.trace_memory:
+            lines.append("times include the overhead of tracing memory allocations")
+        return "\n".join(lines)
+
+
+def profile_stage(profiler: Optional[Profiler], name: str):
+    """`profiler.stage(name)`, or a no-op if `profiler` is None."""
+    if profiler is None:
+        return contextlib.nullcontext()
+    return profiler.stage(name)
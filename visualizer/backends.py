@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""Names of the rendering options, kept free of heavy imports for the command line."""
+
+__all__ = [
+    'BACKENDS',
+    'DECIMATION_METHODS',
+    'LAYOUT_ENGINES',
+    'TRACK_MODES',
+    'TRACK_COLORS',
+    'use_non_interactive_backend'
+]
+
+# 'loop': `parse_segment` + `get_visualize_unit_table_segment`
+# 'vectorized': `parse_segment_arrays` + `get_visualize_unit_table_arrays`
+LAYOUT_ENGINES = ('loop', 'vectorized')
+
+# 'matplotlib': `render_primitives`, any format matplotlib can save
+# 'svg': `render_primitives_svg`, writes SVG directly and never imports matplotlib
+# 'raster': `render_primitives_raster`, draws into a NumPy array and writes PNG directly
+BACKENDS = ('matplotlib', 'svg', 'raster')
+
+# pitch curve decimation of `decimate_curve`: 'minmax' keeps the extremes of every
+# pixel column, 'lttb' keeps one point per pixel, 'none' keeps every voiced sample
+DECIMATION_METHODS = ('none', 'lttb', 'minmax')
+
+# several tracks in one figure (`render_tracks`): 'stacked' gives each a row,
+# 'overlay' draws them over each other; each track gets the next color in turn
+TRACK_MODES = ('stacked', 'overlay')
+TRACK_COLORS = ('#d34343', '#3c78d8', '#38a169', '#d69e2e', '#805ad5', '#319795', '#d53f8c', '#718096')
+
+
+def use_non_interactive_backend():
+    """Select matplotlib's Agg backend, which also writes .svg/.pdf, so that no GUI toolkit is probed."""
+    import matplotlib
+    matplotlib.use('Agg')
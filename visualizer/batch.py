@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+__all__ = [
+    'BatchResult',
+    'expand_inputs',
+    'render_batch',
+    'convert_batch',
+    'check_batch',
+    'analyze_batch'
+]
+
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Callable, Iterable, List, Optional
+
+if TYPE_CHECKING:  # imported by the workers that need them, see `_check_one` and `_analyze_one`
+    from core.analytics import FileAnalysis
+    from core.validation import ValidationReport
+
+
+@dataclass
+class BatchResult:
+    input: str
+    output: str
+    error: Optional[str] = None
+    elapsed: float = 0.0
+    cache_hits: int = 0
+    cache_misses: int = 0
+    f0_points: int = 0
+    f0_kept: int = 0
+    profile: Optional[dict] = None  # `Profiler.to_dict()`, if profiling was requested
+    validation: Optional['ValidationReport'] = None  # issues of all segments, with `skip_bad_segments`
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def expand_inputs(inputs: Iterable[str]) -> List[str]:
+    """Expand directories (recursively, `.ds` and `.dsb` files only) and glob patterns into file paths."""
+    filenames = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, dirs, files in os.walk(item):
+                dirs.sort()
+                filenames.extend(os.path.join(root, x) for x in sorted(files)
+                                 if os.path.splitext(x)[1].lower() in ('.ds', '.dsb'))
+        elif glob.has_magic(item):
+            filenames.extend(sorted(glob.glob(item, recursive=True)))
+        else:
+            # missing files are kept so that they are reported as failures
+            filenames.append(item)
+    return filenames
+
+
+_worker_cache = None
+
+
+def _run_chunk(function: Callable, chunk: List[tuple]) -> list:
+    return [function(*args) for args in chunk]
+
+
+def _failed_file(args: tuple, message: str) -> BatchResult:
+    return BatchResult(input=args[0], output=args[1], error=message)
+
+
+def _run_jobs(function: Callable, args_list: List[tuple], failure: Callable[[tuple, str], object],
+              jobs: Optional[int] = None, callback: Optional[Callable] = None, chunked: bool = False,
+              initializer: Optional[Callable] = None, initargs: tuple = ()) -> list:
+    """Call `function(*args)` for each item of `args_list` across a process pool; results are in input order.
+
+    A job whose worker fails (e.g. the process died) gets `failure(args, message)` as its result.
+    `callback` is called as each job finishes, or in input order if `chunked`, which hands
+    the jobs to the workers in chunks. With `jobs=1` or a single job, everything runs in this process.
+    """
+    results = [None] * len(args_list)
+    if jobs == 1 or len(args_list) <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        for index, args in enumerate(args_list):
+            results[index] = function(*args)
+            if callback is not None:
+                callback(results[index])
+        return results
+
+    workers = jobs or os.cpu_count() or 1
+    chunksize = max(1, min(64, len(args_list) // (workers * 4))) if chunked else 1
+    reported = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as executor:
+        futures = {executor.submit(_run_chunk, function, args_list[start:start + chunksize]): start
+                   for start in range(0, len(args_list), chunksize)}
+        for future in as_completed(futures):
+            start = futures[future]
+            chunk = args_list[start:start + chunksize]
+            try:
+                chunk_results = future.result()
+            except Exception as e:  # e.g. a worker process died
+                chunk_results = [failure(args, "{}: {}".format(type(e).__name__, e)) for args in chunk]
+            results[start:start + len(chunk)] = chunk_results
+            if callback is None:
+                continue
+            if not chunked:
+                for result in chunk_results:
+                    callback(result)
+                continue
+            while reported < len(results) and results[reported] is not None:
+                callback(results[reported])
+                reported += 1
+    return results
+
+
+def _init_worker(font_name: str, font_size: float, font_style: str,
+                 cache_dir: Optional[str] = None, cache_max_bytes: int = 512 * 1024 * 1024,
+                 backend: str = 'matplotlib'):
+    # import matplotlib and load the font once per worker process
+    global _worker_cache
+    if backend == 'matplotlib':
+        from visualizer.backends import use_non_interactive_backend
+        use_non_interactive_backend()
+        from matplotlib import font_manager
+        from visualizer.visualizers import get_font_properties
+        try:
+            get_font_properties(font_name, font_size, font_style)
+            font_manager.get_font(font_name)
+        except OSError:
+            pass  # e.g. a missing font, which each render then reports
+    if cache_dir is not None:
+        from visualizer.cache import RenderCache
+        _worker_cache = RenderCache(cache_dir, max_bytes=cache_max_bytes)
+
+
+def _render_one(input_filename: str, output_filename: str, style: dict, options: dict,
+                profile: bool = False, profile_memory: bool = False) -> BatchResult:
+    from core.validation import ValidationReport
+    from utils.misc import missing_file_message
+    from utils.profiling import Profiler
+    from visualizer.pipeline import render_file
+    from visualizer.primitives import DecimationStats
+
+    hits = _worker_cache.hits if _worker_cache is not None else 0
+    misses = _worker_cache.misses if _worker_cache is not None else 0
+    f0_stats = DecimationStats()
+    profiler = Profiler(trace_memory=profile_memory) if profile else None
+    validation = ValidationReport(filename=input_filename) if options.get('skip_bad_segments') else None
+    if profiler is not None:
+        profiler.start()
+    start = time.perf_counter()
+    try:
+        render_file(input_filename, output_filename, cache=_worker_cache, f0_stats=f0_stats, profiler=profiler,
+                    validation=validation, **options, **style)
+        error = None
+    except FileNotFoundError as e:
+        error = missing_file_message(e, input_filename)
+    except Exception as e:
+        error = "{}: {}".format(type(e).__name__, e)
+    result = BatchResult(input=input_filename, output=output_filename,
+                         error=error, elapsed=time.perf_counter() - start,
+                         f0_points=f0_stats.points, f0_kept=f0_stats.kept, validation=validation)
+    if profiler is not None:
+        profiler.stop()
+        result.profile = profiler.to_dict()
+    if _worker_cache is not None:
+        result.cache_hits = _worker_cache.hits - hits
+        result.cache_misses = _worker_cache.misses - misses
+    return result
+
+
+def render_batch(jobs_list: List[tuple], style: dict,
+                 jobs: Optional[int] = None,
+                 callback: Optional[Callable[[BatchResult], None]] = None,
+                 cache_dir: Optional[str] = None,
+                 cache_max_bytes: int = 512 * 1024 * 1024,
+                 options: Optional[dict] = None,
+                 profile: bool = False,
+                 profile_memory: bool = False) -> List[BatchResult]:
+    """Render `(input_filename, output_filename)` pairs across a process pool.
+
+    Every file succeeds or fails on its own; failures are reported in the
+    returned `BatchResult`s in input order. `callback` is called as each file finishes.
+    Workers share the on-disk render cache in `cache_dir`, if given. `options` are
+    further keyword arguments of `render_file` (e.g. `layout_engine`, `tile_length`, `backend`).
+    With `profile`, each result carries the stage report of its file, with peak memory if `profile_memory`.
+    """
+    options = dict(options or {}, tile_jobs=1)  # no nested process pools
+    init_args = (style['font_name'], style['font_size'], style['font_style'], cache_dir, cache_max_bytes,
+                 options.get('backend', 'matplotlib'))
+    return _run_jobs(_render_one, [(x, y, style, options, profile, profile_memory) for x, y in jobs_list], _failed_file,
+                     jobs=jobs, callback=callback, initializer=_init_worker, initargs=init_args)
+
+
+def _convert_one(input_filename: str, output_filename: str) -> BatchResult:
+    from utils.misc import missing_file_message
+    from visualizer.pipeline import convert_file
+
+    start = time.perf_counter()
+    try:
+        convert_file(input_filename, output_filename)
+        error = None
+    except FileNotFoundError as e:
+        error = missing_file_message(e, input_filename)
+    except Exception as e:
+        error = "{}: {}".format(type(e).__name__, e)
+    return BatchResult(input=input_filename, output=output_filename,
+                       error=error, elapsed=time.perf_counter() - start)
+
+
+def convert_batch(jobs_list: List[tuple],
+                  jobs: Optional[int] = None,
+                  callback: Optional[Callable[[BatchResult], None]] = None) -> List[BatchResult]:
+    """Convert `(input_filename, output_filename)` pairs to binary tracks across a process pool, like `render_batch`."""
+    return _run_jobs(_convert_one, jobs_list, _failed_file, jobs=jobs, callback=callback)
+
+
+def _check_one(input_filename: str) -> 'ValidationReport':
+    from core.validation import validate_file
+    from utils.misc import missing_file_message
+
+    try:
+        return validate_file(input_filename)
+    except FileNotFoundError as e:
+        message = missing_file_message(e, input_filename)
+    except OSError as e:
+        message = "{}: {}".format(type(e).__name__, e)
+    return _failed_check((input_filename,), message)
+
+
+def _failed_check(args: tuple, message: str) -> 'ValidationReport':
+    from core.validation import ValidationIssue, ValidationReport
+    return ValidationReport(filename=args[0], issues=[ValidationIssue(None, 'unreadable', message)])
+
+
+def check_batch(filenames: List[str],
+                jobs: Optional[int] = None,
+                callback: Optional[Callable[['ValidationReport'], None]] = None) -> List['ValidationReport']:
+    """Validate .ds files across a process pool; returns a `ValidationReport` per file, in input order.
+
+    Only the readers and the validation are imported, never matplotlib. `callback` is
+    called with each report in input order. Files are handed to the workers in chunks,
+    since each one is usually checked much faster than a process round trip.
+    """
+    return _run_jobs(_check_one, [(x,) for x in filenames], _failed_check,
+                     jobs=jobs, callback=callback, chunked=True)
+
+
+def _analyze_one(input_filename: str) -> 'FileAnalysis':
+    from core.analytics import analyze_file
+    from utils.misc import missing_file_message
+
+    try:
+        return analyze_file(input_filename)
+    except FileNotFoundError as e:
+        error = missing_file_message(e, input_filename)
+    except Exception as e:
+        error = "{}: {}".format(type(e).__name__, e)
+    return _failed_analysis((input_filename,), error)
+
+
+def _failed_analysis(args: tuple, message: str) -> 'FileAnalysis':
+    from core.analytics import FileAnalysis
+    return FileAnalysis(filename=args[0], error=message)
+
+
+def analyze_batch(filenames: List[str],
+                  jobs: Optional[int] = None,
+                  callback: Optional[Callable[['FileAnalysis'], None]] = None) -> List['FileAnalysis']:
+    """Compute the note and phoneme statistics of files across a process pool (see `analyze_file`), like `check_batch`."""
+    return _run_jobs(_analyze_one, [(x,) for x in filenames], _failed_analysis,
+                     jobs=jobs, callback=callback, chunked=True)
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+__all__ = [
+    'CacheEntry',
+    'RenderCache',
+    'MemoryRenderCache'
+]
+
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+from dataclasses import dataclass
+from typing import Dict, Mapping, Optional
+
+from core.models import *
+
+# bump when the layout of cached units or primitives changes
+CACHE_FORMAT_VERSION = 5
+
+
+@dataclass
+class CacheEntry:
+    visualize_units: VisualizeUnitTable
+    primitives: SegmentPrimitives
+
+
+class RenderCache:
+    """On-disk cache of per-segment visualize units and drawing primitives.
+
+    Entries are keyed by a hash of the raw segment dict, the style options and
+    whether segments are parsed compact (see `parse_segment`), and evicted least-recently-used first once the directory exceeds `max_bytes`.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 512 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._total_bytes = None
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(raw_segment: Mapping, style: Mapping, compact: bool = False) -> str:
+        h = hashlib.sha256()
+        h.update(str(CACHE_FORMAT_VERSION).encode('utf-8'))
+        h.update(b'compact' if compact else b'default')
+        h.update(json.dumps(raw_segment, sort_keys=True, separators=(',', ':')).encode('utf-8'))
+        h.update(json.dumps(style, sort_keys=True, separators=(',', ':')).encode('utf-8'))
+        return h.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + '.pkl')
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                entry = pickle.load(f)
+            os.utime(path)  # mark as recently used
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, TypeError, ImportError):
+            # entries of other versions of the classes they hold count as misses
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def put(self, key: str, entry: CacheEntry):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        if self._total_bytes is None:
+            self._total_bytes = self._scan()[1]
+        else:
+            self._total_bytes += size
+        if self._total_bytes > self.max_bytes:
+            self._evict()
+
+    def _scan(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith('.pkl'):
+                continue
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except OSError:  # removed by another process
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+            total += st.st_size
+        return entries, total
+
+    def _evict(self):
+        entries, total = self._scan()
+        entries.sort()
+        # evict down to 90% of the limit so that eviction does not run on every put
+        target = self.max_bytes * 0.9
+        for mtime, size, name in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+                self.evictions += 1
+            except OSError:
+                pass
+            total -= size
+        self._total_bytes = total
+
+    def stats(self) -> str:
+        return "{} hit(s), {} miss(es), {} eviction(s)".format(self.hits, self.misses, self.evictions)
+
+
+class MemoryRenderCache:
+    """In-process cache of the entries used by the latest render, e.g. in watch mode.
+
+    Has the interface of `RenderCache`. `next_generation()` forgets every entry that
+    was not used since its previous call, so the cache only holds the segments of
+    the current version of a track. Misses fall through to `backing`, if given, and
+    new entries are written to it as well.
+    """
+
+    key = staticmethod(RenderCache.key)
+
+    def __init__(self, backing: Optional[RenderCache] = None):
+        self.backing = backing
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: Dict[str, CacheEntry] = {}
+        self._used = set()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is None and self.backing is not None:
+            entry = self.backing.get(key)
+            if entry is not None:
+                self._entries[key] = entry
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._used.add(key)
+        return entry
+
+    def put(self, key: str, entry: CacheEntry):
+        self._entries[key] = entry
+        self._used.add(key)
+        if self.backing is not None:
+            self.backing.put(key, entry)
+
+    def next_generation(self):
+        for key in set(self._entries) - self._used:
+            del self._entries[key]
+            self.evictions += 1
+        self._used = set()
+
+    def stats(self) -> str:
+        return "{} hit(s), {} miss(es), {} eviction(s)".format(self.hits, self.misses, self.evictions)
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+__all__ = [
+    'LabelLayout',
+    'estimate_text_extent',
+    'cull_labels',
+    'layout_labels'
+]
+
+import functools
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+from core.models import *
+
+
+@functools.lru_cache(maxsize=65536)
+def estimate_text_extent(text: str, font_size: float) -> Tuple[float, float, float, float]:
+    """Approximate ink box (x0, y0, x1, y1) in pt of `text` at `font_size`, relative to its left baseline point.
+
+    Used where the font is not loaded (the SVG writer): wide East Asian characters
+    take a full em, anything else about half of one.
+    """
+    width = sum(font_size if unicodedata.east_asian_width(c) in 'WF' else 0.55 * font_size for c in text)
+    return 0.0, -0.2 * font_size, width, 0.8 * font_size
+
+
+def cull_labels(boxes: "np.array") -> "np.array":
+    """Greedily keep the boxes (rows of x0, y0, x1, y1) that do not overlap a box kept before.
+
+    Boxes are visited in the given order, so earlier ones win. Returns a boolean mask.
+    """
+    keep = np.zeros(len(boxes), dtype=bool)
+    if len(boxes) == 0:
+        return keep
+    # kept boxes are registered in every grid cell they touch
+    cell_width = max(float(np.median(boxes[:, 2] - boxes[:, 0])) * 2, 1e-6)
+    cell_height = max(float(np.median(boxes[:, 3] - boxes[:, 1])) * 2, 1e-6)
+    grid = {}
+    for i, (x0, y0, x1, y1) in enumerate(boxes.tolist()):
+        cells = [(cx, cy)
+                 for cx in range(int(x0 // cell_width), int(x1 // cell_width) + 1)
+                 for cy in range(int(y0 // cell_height), int(y1 // cell_height) + 1)]
+        if any(x0 < b[2] and b[0] < x1 and y0 < b[3] and b[1] < y1 for cell in cells for b in grid.get(cell, ())):
+            continue
+        keep[i] = True
+        for cell in cells:
+            grid.setdefault(cell, []).append((x0, y0, x1, y1))
+    return keep
+
+
+@dataclass
+class LabelLayout:
+    """Labels left to draw after `layout_labels`."""
+    ph_labels: List[Label] = field(default_factory=lambda: [])
+    lyrics_labels: List[Label] = field(default_factory=lambda: [])
+    dropped: int = 0
+    # (x0, y0, x1, y1) in data units around the ink of the labels left to draw
+    bounds: Optional[Tuple[float, float, float, float]] = None
+
+
+def layout_labels(ph_labels: List[Label], lyrics_labels: List[Label],
+                  measure: Callable[[str], Tuple[float, float, float, float]],
+                  scale_x: float, scale_y: float,
+                  padding: float = 0.0,
+                  cull: bool = True) -> LabelLayout:
+    """Drop labels that would overlap a neighbour in the output.
+
+    `measure(text)` returns the ink box of `text` in pt relative to its left baseline
+    point, and `scale_x`/`scale_y` are pt per data unit. Phoneme labels are centered
+    on their anchor, lyrics start at it. Lyrics take precedence over phonemes and,
+    within each kind, earlier labels over later ones. Empty labels are always dropped;
+    with `cull` off, nothing else is.
+    """
+    ph_labels = [x for x in ph_labels if x.text]
+    lyrics_labels = [x for x in lyrics_labels if x.text]
+
+    def boxes(labels, centered):
+        extents = np.array([measure(x.text) for x in labels], dtype=np.float64).reshape(-1, 4)
+        anchors = np.array([(x.x * scale_x, x.y * scale_y) for x in labels], dtype=np.float64).reshape(-1, 2)
+        if centered:
+            anchors[:, 0] -= (extents[:, 0] + extents[:, 2]) / 2
+        return extents + np.tile(anchors, 2)
+
+    lyrics_order = np.argsort([x.x for x in lyrics_labels], kind='stable')
+    ph_order = np.argsort([x.x for x in ph_labels], kind='stable')
+    all_boxes = np.concatenate([boxes(lyrics_labels, False)[lyrics_order], boxes(ph_labels, True)[ph_order]])
+    if cull:
+        keep = cull_labels(all_boxes + np.array([-padding, 0, padding, 0]))
+    else:
+        keep = np.ones(len(all_boxes), dtype=bool)
+    keep_lyrics = np.zeros(len(lyrics_labels), dtype=bool)
+    keep_lyrics[lyrics_order] = keep[:len(lyrics_labels)]
+    keep_ph = np.zeros(len(ph_labels), dtype=bool)
+    keep_ph[ph_order] = keep[len(lyrics_labels):]
+
+    layout = LabelLayout(ph_labels=[x for x, k in zip(ph_labels, keep_ph.tolist()) if k],
+                         lyrics_labels=[x for x, k in zip(lyrics_labels, keep_lyrics.tolist()) if k],
+                         dropped=len(keep) - int(keep.sum()))
+    if keep.any():
+        kept_boxes = all_boxes[keep]
+        layout.bounds = (kept_boxes[:, 0].min() / scale_x, kept_boxes[:, 1].min() / scale_y,
+                         kept_boxes[:, 2].max() / scale_x, kept_boxes[:, 3].max() / scale_y)
+    return layout
@@ -0,0 +1,496 @@
+# -*- coding: utf-8 -*-
+__all__ = [
+    'BACKENDS',
+    'LAYOUT_ENGINES',
+    'TRACK_MODES',
+    'TRACK_COLORS',
+    'get_output_filename',
+    'render_segments',
+    'render_range',
+    'render_file',
+    'render_tracks',
+    'convert_file'
+]
+
+import contextlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, List, Mapping, Optional, Sequence, Union
+
+from core.binary import *
+from core.index import *
+from core.models import *
+from core.parsers import *
+from core.readers import *
+from core.validation import *
+from utils import *
+from visualizer.backends import *
+from visualizer.primitives import *
+from visualizer.cache import *
+from visualizer.raster import *
+from visualizer.svg import *
+
+
+def get_output_filename(input_filename: str, output_dir: Optional[str] = None, ext: str = '.svg') -> str:
+    output_filename = os.path.basename(input_filename)
+    basename, input_ext = os.path.splitext(output_filename)
+    if input_ext.lower() in ('.ds', TRACK_BINARY_EXTENSION):
+        output_filename = basename + ext
+    else:
+        output_filename = output_filename + ext
+    if output_dir is not None:
+        output_filename = os.path.join(output_dir, output_filename)
+    return output_filename
+
+
+# style options consumed by `get_segment_primitives`; the rest go to `render_primitives`
+_PRIMITIVE_OPTIONS = ('display_f0', 'color_head', 'color_body')
+
+# brightness of the "head" phonemes of a track relative to its color
+_TRACK_HEAD_SHADE = 0.65
+
+_END = object()
+
+
+def _count_segment(profiler: Profiler, segment: Union[Segment, SegmentArrays]):
+    if isinstance(segment, SegmentArrays):
+        profiler.count('notes', len(segment.note_midi))
+        profiler.count('phonemes', len(segment.ph_seq))
+    else:
+        profiler.count('notes', len(segment.notes))
+        profiler.count('phonemes', sum(len(x.phonemes) for x in segment.notes))
+    profiler.count('f0_samples', len(segment.pitch_curve.f0))
+
+
+def _parse(raw_segment: Union[Mapping, SegmentArrays], index: int, layout_engine: str, compact: bool = False):
+    # segments of binary tracks are memory-mapped, which `compact` would only copy
+    if isinstance(raw_segment, SegmentArrays):
+        return raw_segment if layout_engine == 'vectorized' else raw_segment.to_segment()
+    try:
+        if layout_engine == 'vectorized':
+            segment = parse_segment_arrays(raw_segment, compact)
+        else:
+            segment = parse_segment(raw_segment, compact)
+    except (KeyError, TypeError, ValueError, AttributeError):
+        segment = None
+    if segment is None:
+        raise invalid_segment_error(raw_segment, index)
+    return segment
+
+
+def _validate(raw_segment: Mapping, index: int, profiler: Optional[Profiler],
+              validation: Optional[ValidationReport]) -> bool:
+    # whether the segment is free of errors; issues are added to `validation`
+    with profile_stage(profiler, 'validate'):
+        issues = validate_segment(raw_segment, index)
+    if validation is not None:
+        validation.issues.extend(issues)
+        validation.segments += 1
+    if any(x.severity == 'error' for x in issues):
+        if profiler is not None:
+            profiler.count('skipped_segments')
+        return False
+    return True
+
+
+def _iter_primitives(raw_segments: Iterator[Union[Mapping, SegmentArrays]], style: Mapping,
+                     cache: Optional[RenderCache] = None,
+                     layout_engine: str = 'loop',
+                     profiler: Optional[Profiler] = None,
+                     skip_bad_segments: bool = False,
+                     validation: Optional[ValidationReport] = None,
+                     compact: bool = False) -> Iterator[SegmentPrimitives]:
+    # items are raw segment dicts, or `SegmentArrays` that are already parsed (e.g. read
+    # from a binary track), which skip the cache and validation
+    primitive_options = {k: v for k, v in style.items() if k in _PRIMITIVE_OPTIONS}
+    raw_segments = iter(raw_segments)
+    index = 0
+    while True:
+        # stages must not be open across `yield`, where the consumer runs
+        with profile_stage(profiler, 'read'):
+            raw_segment = next(raw_segments, _END)
+        if raw_segment is _END:
+            return
+        if profiler is not None:
+            profiler.count('segments')
+        key = None
+        parsed = isinstance(raw_segment, SegmentArrays)
+        if skip_bad_segments and not parsed and not _validate(raw_segment, index, profiler, validation):
+            index += 1
+            continue
+        if cache is not None and not parsed:
+            with profile_stage(profiler, 'cache'):
+                key = cache.key(raw_segment, style, compact)
+                entry = cache.get(key)
+            if entry is not None:
+                if profiler is not None:
+                    profiler.count('cached_segments')
+                yield entry.primitives
+                index += 1
+                continue
+        with profile_stage(profiler, 'parse'):
+            segment = _parse(raw_segment, index, layout_engine, compact)
+        with profile_stage(profiler, 'layout'):
+            if layout_engine == 'vectorized':
+                visualize_units = get_visualize_unit_table_arrays(segment)
+            else:
+                visualize_units = get_visualize_unit_table_segment(segment)
+        with profile_stage(profiler, 'primitives'):
+            primitives = get_segment_primitives(segment, visualize_units, **primitive_options)
+        if profiler is not None:
+            _count_segment(profiler, segment)
+            profiler.count('visualize_units', len(visualize_units))
+        if key is not None:
+            with profile_stage(profiler, 'cache'):
+                cache.put(key, CacheEntry(visualize_units=visualize_units, primitives=primitives))
+        yield primitives
+        index += 1
+
+
+@contextlib.contextmanager
+def _open_segments(input_filename: str):
+    # raw segments of a .ds file, or the parsed segments of a binary track
+    if is_track_binary(input_filename):
+        yield iter(read_track_binary(input_filename))
+        return
+    with open(input_filename, 'r', encoding='utf-8') as f:
+        yield iter_segments(f)
+
+
+def render_segments(raw_segments: Iterable[Mapping], output_filename: str,
+                    cache: Optional[RenderCache] = None,
+                    layout_engine: str = 'loop',
+                    backend: str = 'matplotlib',
+                    f0_stats: Optional[DecimationStats] = None,
+                    profiler: Optional[Profiler] = None,
+                    skip_bad_segments: bool = False,
+                    validation: Optional[ValidationReport] = None,
+                    glyph_atlas: Optional[str] = None,
+                    compact: bool = False, **style):
+    """Parse and visualize raw segments (e.g. a .ds document already in memory) into one file.
+
+    Takes the same options as `render_file`, except that it never renders tiles.
+    """
+    if layout_engine not in LAYOUT_ENGINES:
+        raise ValueError("Unknown layout engine: {}".format(layout_engine))
+    if backend not in BACKENDS:
+        raise ValueError("Unknown backend: {}".format(backend))
+    render_options = {k: v for k, v in style.items() if k not in _PRIMITIVE_OPTIONS}
+    primitives_iter = _iter_primitives(raw_segments, style, cache, layout_engine, profiler,
+                                       skip_bad_segments, validation, compact)
+    _render_primitives(primitives_iter, output_filename, backend, f0_stats, profiler, glyph_atlas, render_options)
+
+
+def _render_primitives(primitives_iter: Iterable[SegmentPrimitives], output_filename: str, backend: str,
+                       f0_stats: Optional[DecimationStats], profiler: Optional[Profiler],
+                       glyph_atlas: Optional[str], render_options: dict, xlim=None):
+    if backend == 'svg':
+        if os.path.splitext(output_filename)[1].lower() != '.svg':
+            raise ValueError("The svg backend can only write .svg files")
+        render_primitives_svg(primitives_iter, output_filename, f0_stats=f0_stats, xlim=xlim, profiler=profiler,
+                              **render_options)
+        return
+    if backend == 'raster':
+        if os.path.splitext(output_filename)[1].lower() != '.png':
+            raise ValueError("The raster backend can only write .png files")
+        render_primitives_raster(primitives_iter, output_filename, f0_stats=f0_stats, glyph_atlas=glyph_atlas,
+                                 xlim=xlim, profiler=profiler, **render_options)
+        return
+
+    # matplotlib is only imported when it is actually used
+    with profile_stage(profiler, 'import'):
+        from visualizer.visualizers import render_primitives
+    render_primitives(primitives_iter, output_filename, f0_stats=f0_stats, xlim=xlim, profiler=profiler,
+                      **render_options)
+
+
+def render_range(segments: Union[TrackIndex, Track, Sequence[Union[Segment, SegmentArrays]]],
+                 start: float, end: float, output_filename: str,
+                 backend: str = 'matplotlib',
+                 f0_stats: Optional[DecimationStats] = None,
+                 profiler: Optional[Profiler] = None,
+                 glyph_atlas: Optional[str] = None, **style):
+    """Visualize the time window [start, end] (seconds) of parsed segments into one file.
+
+    Only the segments overlapping the window are laid out, and only their visualize
+    units and pitch samples inside it are drawn (see `TrackIndex`): rectangles are cut
+    at the window borders, labels outside it are dropped, and the pitch axis fits what
+    is left. Pass the same `TrackIndex` to render several windows of a track, so that
+    segments are laid out once, with the engine matching their type (`Segment` or
+    `SegmentArrays`).
+    Raises `ValueError` if no notes fall into the window. Otherwise takes the options
+    of `render_segments`.
+    """
+    if not end > start:
+        raise ValueError("The end of the range must be after its start")
+    if backend not in BACKENDS:
+        raise ValueError("Unknown backend: {}".format(backend))
+    primitive_options = {k: v for k, v in style.items() if k in _PRIMITIVE_OPTIONS}
+    render_options = {k: v for k, v in style.items() if k not in _PRIMITIVE_OPTIONS}
+    with profile_stage(profiler, 'index'):
+        index = segments if isinstance(segments, TrackIndex) else TrackIndex(segments)
+        visible = index.segments_in(start, end)
+
+    primitives_list = []
+    for i in visible:
+        segment = index.segments[i]
+        with profile_stage(profiler, 'layout'):
+            units = index.units(i).take(index.units_in(i, start, end))
+        with profile_stage(profiler, 'primitives'):
+            primitives = get_segment_primitives(segment, units, f0_range=index.f0_range(i, start, end),
+                                                **primitive_options)
+            primitives_list.append(crop_primitives(primitives, start, end))
+        if profiler is not None:
+            profiler.count('segments')
+            profiler.count('visualize_units', len(units))
+            profiler.count('f0_samples', len(primitives.f0_t) if primitives.f0_t is not None else 0)
+    if all(len(x.rects) == 0 for x in primitives_list):
+        raise ValueError("Nothing to visualize: no notes between {:g}s and {:g}s".format(start, end))
+    _render_primitives(primitives_list, output_filename, backend, f0_stats, profiler, glyph_atlas, render_options,
+                       xlim=(start, end))
+
+
+def _segments_in_range(raw_segments: Iterator[Union[Mapping, SegmentArrays]], start: float,
+                       end: Optional[float], layout_engine: str,
+                       profiler: Optional[Profiler] = None,
+                       skip_bad_segments: bool = False,
+                       validation: Optional[ValidationReport] = None,
+                       compact: bool = False):
+    # parsed segments overlapping [start, end], and the end (that of the track if None);
+    # only segments that may overlap the window are kept while reading
+    candidates = []
+    track_end = 0.0
+    first_issue = len(validation.issues) if validation is not None else 0
+    with profile_stage(profiler, 'read'):
+        for index, raw_segment in enumerate(raw_segments):
+            try:
+                segment_start, segment_end = segment_span(raw_segment)
+            except (KeyError, TypeError, ValueError, AttributeError):
+                if not skip_bad_segments:
+                    raise invalid_segment_error(raw_segment, index)
+                _validate(raw_segment, index, profiler, validation)
+                continue
+            track_end = max(track_end, segment_end)
+            if segment_end > start and (end is None or segment_start < end):
+                candidates.append((index, raw_segment, segment_start))
+    if end is None:
+        end = track_end
+    segments = []
+    for index, raw_segment, segment_start in candidates:
+        if segment_start >= end:
+            continue
+        if skip_bad_segments and not isinstance(raw_segment, SegmentArrays) \
+                and not _validate(raw_segment, index, profiler, validation):
+            continue
+        with profile_stage(profiler, 'parse'):
+            segment = _parse(raw_segment, index, layout_engine, compact)
+        if profiler is not None:
+            _count_segment(profiler, segment)
+        segments.append(segment)
+    if validation is not None:
+        # segments were validated out of order, in two passes
+        validation.issues[first_issue:] = sorted(validation.issues[first_issue:], key=lambda x: x.segment)
+    return segments, end
+
+
+def render_file(input_filename: str, output_filename: str,
+                cache: Optional[RenderCache] = None,
+                layout_engine: str = 'loop',
+                tile_length: Optional[float] = None,
+                tile_jobs: Optional[int] = 1,
+                backend: str = 'matplotlib',
+                f0_stats: Optional[DecimationStats] = None,
+                profiler: Optional[Profiler] = None,
+                skip_bad_segments: bool = False,
+                validation: Optional[ValidationReport] = None,
+                glyph_atlas: Optional[str] = None,
+                start: Optional[float] = None,
+                end: Optional[float] = None,
+                compact: bool = False, **style):
+    """Read, parse and visualize one .ds file (or binary track, see `write_track_binary`) segment by segment.
+
+    `style` takes the keyword arguments of `visualize_segments`. Segments found in
+    `cache` skip parsing and layout. Raises `FileNotFoundError` if the input does
+    not exist and `ValueError` if a segment cannot be parsed. `layout_engine` is one
+    of `LAYOUT_ENGINES`; both produce identical output. With `tile_length` (seconds),
+    the track is written as tiles by `render_tiles` using `tile_jobs` processes.
+    `backend` is one of `BACKENDS`; the 'svg' backend only writes untiled .svg files,
+    the 'raster' backend untiled .png files, with label glyphs kept in the atlas file
+    `glyph_atlas` if given (see `GlyphAtlas`).
+    Pitch curve point counts before and after decimation are added to `f0_stats`.
+    With a `profiler`, the time, memory and item counts of every stage are recorded.
+    A segment that cannot be parsed raises a `ValueError` naming the checks it failed
+    (see `validate_segment`); with `skip_bad_segments`, every segment is validated
+    first, those with errors are left out, and all issues found are added to `validation`.
+    With `start` or `end` (seconds), only that window of the track is rendered by
+    `render_range` (`end` defaults to the end of the track): the durations of every
+    segment are read to find the window, but only the segments overlapping it are
+    validated, parsed and laid out, and the cache is not used. With `compact`, segments
+    are parsed into the compact form (see `parse_segment`), whose pitch curves and
+    thus the pitch of the drawn curves are float32.
+    """
+    if start is not None or end is not None:
+        if tile_length is not None:
+            raise ValueError("A time range cannot be rendered as tiles")
+        if layout_engine not in LAYOUT_ENGINES:
+            raise ValueError("Unknown layout engine: {}".format(layout_engine))
+        with _open_segments(input_filename) as segments:
+            segments, track_end = _segments_in_range(segments, start or 0.0, end, layout_engine, profiler,
+                                                     skip_bad_segments, validation, compact)
+        if end is None:
+            if track_end <= (start or 0.0):
+                raise ValueError("Nothing to visualize: the track ends at {:g}s".format(track_end))
+            end = track_end
+        render_range(segments, start or 0.0, end, output_filename, backend=backend, f0_stats=f0_stats,
+                     profiler=profiler, glyph_atlas=glyph_atlas, **style)
+        return
+
+    if tile_length is None:
+        with _open_segments(input_filename) as segments:
+            render_segments(segments, output_filename, cache=cache, layout_engine=layout_engine,
+                            backend=backend, f0_stats=f0_stats, profiler=profiler,
+                            skip_bad_segments=skip_bad_segments, validation=validation,
+                            glyph_atlas=glyph_atlas, compact=compact, **style)
+        return
+
+    if layout_engine not in LAYOUT_ENGINES:
+        raise ValueError("Unknown layout engine: {}".format(layout_engine))
+    if backend in ('svg', 'raster'):
+        raise ValueError("The {} backend does not support tiled rendering".format(backend))
+    if backend not in BACKENDS:
+        raise ValueError("Unknown backend: {}".format(backend))
+    render_options = {k: v for k, v in style.items() if k not in _PRIMITIVE_OPTIONS}
+
+    with profile_stage(profiler, 'import'):
+        from visualizer.tiles import render_tiles
+
+    passes = []
+
+    def primitives_factory():
+        # `render_tiles` reads the track twice; issues, stage times and cache counts are those of the first pass
+        first = not passes
+        passes.append(None)
+        counts = (cache.hits, cache.misses) if cache is not None else None
+        try:
+            with _open_segments(input_filename) as tile_segments:
+                yield from _iter_primitives(tile_segments, style, cache, layout_engine,
+                                            profiler if first else None, skip_bad_segments,
+                                            validation if first else None, compact)
+        finally:
+            if not first and cache is not None:
+                cache.hits, cache.misses = counts
+
+    render_tiles(primitives_factory, output_filename, tile_length, jobs=tile_jobs, f0_stats=f0_stats,
+                 profiler=profiler, **render_options)
+
+
+def _load_track(input_filename: str, style: dict, color: str,
+                layout_engine: str = 'loop',
+                cache_dir: Optional[str] = None,
+                cache_max_bytes: int = 512 * 1024 * 1024,
+                skip_bad_segments: bool = False,
+                profile: bool = False,
+                compact: bool = False,
+                profile_memory: bool = False):
+    # runs in the worker processes of `render_tracks`
+    cache = RenderCache(cache_dir, max_bytes=cache_max_bytes) if cache_dir is not None else None
+    validation = ValidationReport(filename=input_filename) if skip_bad_segments else None
+    profiler = Profiler(trace_memory=profile_memory) if profile else None
+    if profiler is not None:
+        profiler.start()
+    track = TrackPrimitives(name=os.path.basename(input_filename), color=color)
+    with _open_segments(input_filename) as segments:
+        try:
+            for primitives in _iter_primitives(segments, style, cache, layout_engine, profiler,
+                                               skip_bad_segments, validation, compact):
+                track.add(primitives)
+        except ValueError as e:
+            raise ValueError("{}: {}".format(input_filename, e)) from e
+    if profiler is not None:
+        profiler.stop()
+    return track, validation, profiler.to_dict() if profiler is not None else None
+
+
+def render_tracks(input_filenames: Sequence[str], output_filename: str,
+                  mode: str = 'stacked',
+                  track_colors: Optional[Sequence[str]] = None,
+                  jobs: Optional[int] = None,
+                  layout_engine: str = 'loop',
+                  backend: str = 'matplotlib',
+                  cache_dir: Optional[str] = None,
+                  cache_max_bytes: int = 512 * 1024 * 1024,
+                  f0_stats: Optional[DecimationStats] = None,
+                  profiler: Optional[Profiler] = None,
+                  skip_bad_segments: bool = False,
+                  validation: Optional[List[ValidationReport]] = None,
+                  compact: bool = False, **style):
+    """Render several .ds files (or binary tracks) as separate tracks on a shared time axis into one file.
+
+    `mode` is one of `TRACK_MODES`: 'stacked' gives each track a row, 'overlay' draws
+    them over each other. Track i is drawn in `track_colors[i]` ('#rrggbb', cycling
+    through `TRACK_COLORS` by default): its vowels in the color, its consonants darker.
+    The files are read and parsed concurrently in `jobs` processes (each with the
+    render cache in `cache_dir`, if given), and the axis limits are merged from the
+    extents of each track. With `skip_bad_segments`, a `ValidationReport` per file is
+    appended to `validation`. Otherwise takes the options of `render_file`.
+    """
+    if mode not in TRACK_MODES:
+        raise ValueError("Unknown track mode: {}".format(mode))
+    if layout_engine not in LAYOUT_ENGINES:
+        raise ValueError("Unknown layout engine: {}".format(layout_engine))
+    if backend not in BACKENDS:
+        raise ValueError("Unknown backend: {}".format(backend))
+    if backend == 'raster':
+        raise ValueError("The raster backend does not support several tracks")
+    if backend == 'svg' and os.path.splitext(output_filename)[1].lower() != '.svg':
+        raise ValueError("The svg backend can only write .svg files")
+    track_colors = list(track_colors or TRACK_COLORS)
+    render_options = {k: v for k, v in style.items() if k not in _PRIMITIVE_OPTIONS}
+
+    loads = []
+    for index, input_filename in enumerate(input_filenames):
+        color = track_colors[index % len(track_colors)]
+        track_style = dict(style, color_body=color, color_head=shade_color(color, _TRACK_HEAD_SHADE))
+        loads.append((input_filename, track_style, color, layout_engine, cache_dir, cache_max_bytes,
+                      skip_bad_segments, profiler is not None, compact,
+                      profiler is not None and profiler.trace_memory))
+    # stages of the workers are summed, like in batch mode
+    if jobs == 1 or len(loads) <= 1:
+        results = [_load_track(*x) for x in loads]
+    else:
+        with ProcessPoolExecutor(max_workers=min(jobs or len(loads), len(loads))) as executor:
+            results = list(executor.map(_load_track, *zip(*loads)))
+    tracks = []
+    for track, track_validation, profile in results:
+        tracks.append(track)
+        if validation is not None and track_validation is not None:
+            validation.append(track_validation)
+        if profiler is not None:
+            profiler.merge(profile)
+
+    if backend == 'svg':
+        render_tracks_svg(tracks, output_filename, stacked=mode == 'stacked', f0_stats=f0_stats,
+                          profiler=profiler, **render_options)
+        return
+    with profile_stage(profiler, 'import'):
+        from visualizer.visualizers import render_tracks_primitives
+    render_tracks_primitives(tracks, output_filename, stacked=mode == 'stacked', f0_stats=f0_stats,
+                             profiler=profiler, **render_options)
+
+
+def convert_file(input_filename: str, output_filename: str):
+    """Parse a .ds file once and store it as a binary track (see `write_track_binary`), which renders without parsing.
+
+    Raises `FileNotFoundError` if the input does not exist and `ValueError` if a segment cannot be parsed.
+    """
+    segments = []
+    with open(input_filename, 'r', encoding='utf-8') as f:
+        for index, raw_segment in enumerate(iter_segments(f)):
+            try:
+                segment = parse_segment_arrays(raw_segment)
+            except (KeyError, TypeError, ValueError, AttributeError):
+                segment = None
+            if segment is None:
+                raise invalid_segment_error(raw_segment, index)
+            segments.append(segment)
+    write_track_binary(segments, output_filename)
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+__all__ = [
+    'get_segment_primitives',
+    'crop_primitives',
+    'decimate_f0',
+    'DecimationStats',
+    'Extents',
+    'TrackPrimitives',
+    'fit_plot'
+]
+
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple, Union
+
+import numpy as np
+
+from core.models import *
+from utils import *
+from core.parsers import *
+
+
+def get_segment_primitives(segment: Union[Segment, SegmentArrays],
+                           visualize_units: Optional[VisualizeUnitTable] = None,
+                           display_f0: bool = True,
+                           color_head: str = '#8c2128',
+                           color_body: str = '#d34343',
+                           f0_range: Optional[slice] = None) -> SegmentPrimitives:
+    """Rectangles, labels and pitch curve of a segment; only the samples in `f0_range` of the curve if given."""
+    if visualize_units is None:
+        visualize_units = get_visualize_unit_table_segment(segment)
+    primitives = SegmentPrimitives()
+
+    if display_f0:
+        # compact pitch curves convert the whole curve once, so windows slice the result
+        f0_midi = segment.pitch_curve.get_midi_pitch()
+        first = 0
+        if f0_range is not None:
+            first = f0_range.indices(len(f0_midi))[0]
+            f0_midi = f0_midi[f0_range]
+        timestep = segment.pitch_curve.timestep
+        # sample i is drawn at offset + (i + 1) * timestep, rounded to the time base
+        f0_t = to_ticks(np.arange(first + 1, first + len(f0_midi) + 1) * timestep) + to_ticks(segment.offset)
+        primitives.f0_t = from_ticks(f0_t)
+        primitives.f0_midi = f0_midi
+
+    if len(visualize_units) == 0:
+        return primitives
+
+    offset = visualize_units.offset
+    duration = visualize_units.duration
+    midi_pitch = visualize_units.midi_pitch
+    category = visualize_units.category
+    drawn = (category != PhonemeCategory.SP.value) & (category != PhonemeCategory.AP.value)
+    x = offset[drawn]
+    w = duration[drawn]
+    y = midi_pitch[drawn]
+    strings = visualize_units.strings
+
+    primitives.rects = np.stack([x, y - 0.5, w, np.ones_like(x)], axis=1)
+    primitives.rect_colors = np.where(category[drawn] == PhonemeCategory.BODY.value,
+                                      color_body, color_head).tolist()
+    primitives.ph_labels = [Label(text=strings[i], x=lx, y=ly) for i, lx, ly in
+                            zip(visualize_units.phoneme_index[drawn].tolist(), (x + w / 2).tolist(), (y - 1).tolist())]
+    primitives.lyrics_labels = [Label(text=strings[i], x=lx, y=ly) for i, lx, ly in
+                                zip(visualize_units.lyric_index[drawn].tolist(), (x + 0.01).tolist(), (y + 0.75).tolist())]
+
+    voiced_pitch = midi_pitch[midi_pitch != -1]
+    primitives.pitch_max = int(midi_pitch.max())
+    primitives.pitch_min = int(voiced_pitch.min()) if len(voiced_pitch) > 0 else -1
+    primitives.xmax = float((offset + duration).max())
+    return primitives
+
+
+def crop_primitives(primitives: SegmentPrimitives, t0: float, t1: float) -> SegmentPrimitives:
+    """Cut the rectangles of `primitives` at t0 and t1, in place, and drop those and the labels outside [t0, t1].
+
+    Pitch curves are left as they are; see `get_segment_primitives` for drawing part of one.
+    """
+    if len(primitives.rects) > 0:
+        x0 = np.maximum(primitives.rects[:, 0], t0)
+        x1 = np.minimum(primitives.rects[:, 0] + primitives.rects[:, 2], t1)
+        keep = x1 > x0
+        rects = primitives.rects[keep]
+        rects[:, 0] = x0[keep]
+        rects[:, 2] = (x1 - x0)[keep]
+        primitives.rects = rects
+        primitives.rect_colors = [c for c, k in zip(primitives.rect_colors, keep.tolist()) if k]
+    primitives.ph_labels = [x for x in primitives.ph_labels if t0 <= x.x <= t1]
+    primitives.lyrics_labels = [x for x in primitives.lyrics_labels if t0 <= x.x <= t1]
+    return primitives
+
+
+@dataclass
+class DecimationStats:
+    """Number of pitch curve samples before and after `decimate_f0`."""
+    points: int = 0
+    kept: int = 0
+
+    @property
+    def dropped(self) -> int:
+        return self.points - self.kept
+
+    def __str__(self):
+        return "{} of {} point(s) drawn, {} dropped".format(self.kept, self.points, self.dropped)
+
+
+def decimate_f0(f0_t: "np.array", f0_midi: "np.array", pixel_width: float, method: str = 'minmax',
+                stats: Optional[DecimationStats] = None):
+    """Decimate a pitch curve for a plot where one pixel spans `pixel_width` seconds.
+
+    `method` is one of `DECIMATION_METHODS` (see `decimate_curve`). Unvoiced (NaN) samples are dropped and
+    break the curve. Returns the new (f0_t, f0_midi) and adds the counts to `stats`.
+    """
+    points = len(f0_midi)
+    f0_t, f0_midi = decimate_curve(f0_t, f0_midi, pixel_width, method)
+    if stats is not None:
+        stats.points += points
+        stats.kept += int(np.count_nonzero(np.isfinite(f0_midi)))
+    return f0_t, f0_midi
+
+
+@dataclass
+class Extents:
+    """Running axis extents over the primitives of several segments.
+
+    The x axis spans from 0 to one second after the last note, or `window` if set.
+    """
+    xmax: Optional[float] = None
+    pitch_min: Optional[int] = None
+    pitch_max: Optional[int] = None
+    window: Optional[Tuple[float, float]] = None
+
+    def update(self, primitives: SegmentPrimitives):
+        if primitives.xmax is None:
+            return
+        self.xmax = primitives.xmax if self.xmax is None else max(self.xmax, primitives.xmax)
+        self.pitch_max = primitives.pitch_max if self.pitch_max is None else max(self.pitch_max, primitives.pitch_max)
+        if primitives.pitch_min != -1:
+            self.pitch_min = primitives.pitch_min if self.pitch_min in [None, -1] \
+                else min(self.pitch_min, primitives.pitch_min)
+        elif self.pitch_min is None:
+            self.pitch_min = -1
+
+    def merge(self, other: 'Extents'):
+        """Widen to also cover `other`, e.g. the extents of another track."""
+        if other.empty:
+            return
+        self.update(SegmentPrimitives(xmax=other.xmax, pitch_min=other.pitch_min, pitch_max=other.pitch_max))
+
+    @property
+    def empty(self) -> bool:
+        return self.xmax is None
+
+    @property
+    def xlim(self):
+        if self.window is not None:
+            return self.window
+        return 0, self.xmax + 1
+
+    @property
+    def ylim(self):
+        return self.pitch_min - 1, self.pitch_max + 1
+
+
+@dataclass
+class TrackPrimitives:
+    """Drawing primitives of all segments of one track, for rendering several tracks together.
+
+    `extents` are collected while the segments are added, so the shared axis limits
+    of several tracks come from merging one `Extents` per track. `color` is the
+    track's name label and, when tracks are overlaid, its pitch curve.
+    """
+    name: str = ''
+    primitives: List[SegmentPrimitives] = field(default_factory=lambda: [])
+    extents: Extents = field(default_factory=Extents)
+    color: str = '#d34343'
+
+    def add(self, primitives: SegmentPrimitives):
+        self.primitives.append(primitives)
+        self.extents.update(primitives)
+
+
+def fit_plot(extents: Extents, box_width: float, box_height: float, aspect: float) -> Tuple[float, float]:
+    """Largest (width, height) inside the box at which the plot has a y/x display ratio of `aspect`, like `set_aspect`."""
+    x0, x1 = extents.xlim
+    y0, y1 = extents.ylim
+    width = box_width
+    height = width * aspect * (y1 - y0) / (x1 - x0)
+    if height > box_height:
+        height = box_height
+        width = height * (x1 - x0) / (aspect * (y1 - y0))
+    return width, height
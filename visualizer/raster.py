@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+__all__ = [
+    'GlyphAtlas',
+    'get_glyph_atlas',
+    'write_png',
+    'render_primitives_raster'
+]
+
+import functools
+import os
+import struct
+import zlib
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+from core.models import *
+from utils import *
+from visualizer.primitives import *
+from visualizer.labels import *
+
+# largest framebuffer (width * height) drawn, 512 MB of RGBA
+_MAX_PIXELS = 1 << 27
+_EDGE_COLOR = '#400d51'
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# share of the figure taken by the axes of `render_primitives` (matplotlib's default subplot)
+_AXES_WIDTH = 0.775
+_AXES_HEIGHT = 0.77
+
+
+@functools.lru_cache(maxsize=256)
+def _parse_color(color: str) -> Tuple[int, int, int, int]:
+    value = color.strip().lstrip('#')
+    if len(value) == 3:
+        value = ''.join(c * 2 for c in value)
+    if len(value) == 6:
+        value += 'ff'
+    try:
+        if len(value) != 8:
+            raise ValueError
+        return tuple(int(value[i:i + 2], 16) for i in range(0, 8, 2))
+    except ValueError:
+        raise ValueError("The raster backend takes colors as #rrggbb, not {!r}".format(color)) from None
+
+
+class GlyphAtlas:
+    """Anti-aliased glyph bitmaps of one font at one pixel size, for drawing labels into a framebuffer.
+
+    Glyphs are rasterized with matplotlib's FreeType wrapper the first time a character
+    is needed; an atlas saved with `save` and read back with `load` holds them
+    pre-rendered, so that labels of those characters are drawn without loading the font
+    or importing matplotlib. Each glyph is stored with its left bearing, the rows above
+    the baseline and the advance, all in pixels; kerning is not applied.
+    """
+
+    def __init__(self, font_name: str, size: float):
+        self.font_name = font_name
+        self.size = float(size)  # pixels per em
+        self.modified = False
+        self._glyphs: Dict[str, Tuple["np.array", int, int, float]] = {}
+        self._font = None
+        self._labels = {}
+
+    def _rasterize(self, char: str):
+        if self._font is None:
+            from matplotlib.ft2font import FT2Font
+            self._font = FT2Font(self.font_name)
+            # 72 dpi, so that the size in pt is the size in pixels
+            self._font.set_size(self.size, 72)
+        self._font.set_text(char, 0)
+        self._font.draw_glyphs_to_bitmap(antialiased=True)
+        bitmap = np.array(self._font.get_image(), dtype=np.uint8)
+        left = int(round(self._font.get_bitmap_offset()[0] / 64))
+        top = bitmap.shape[0] - int(round(self._font.get_descent() / 64))
+        advance = self._font.load_char(ord(char)).linearHoriAdvance / 65536
+        self._glyphs[char] = (bitmap, left, top, advance)
+        self.modified = True
+
+    def glyph(self, char: str) -> Tuple["np.array", int, int, float]:
+        """(alpha bitmap, left, top, advance) of `char`."""
+        if char not in self._glyphs:
+            self._rasterize(char)
+        return self._glyphs[char]
+
+    def render(self, text: str) -> Tuple["np.array", int, int]:
+        """Alpha bitmap of `text`, with its left and top edges relative to the left baseline point."""
+        label = self._labels.get(text)
+        if label is not None:
+            return label
+        glyphs = []
+        pen = 0.0
+        for char in text:
+            bitmap, left, top, advance = self.glyph(char)
+            glyphs.append((bitmap, int(round(pen)) + left, top))
+            pen += advance
+        glyphs = [x for x in glyphs if x[0].size > 0]
+        if not glyphs:
+            label = (np.zeros((0, 0), dtype=np.uint8), 0, 0)
+        else:
+            x0 = min(x for _, x, _ in glyphs)
+            x1 = max(x + bitmap.shape[1] for bitmap, x, _ in glyphs)
+            y0 = max(top for _, _, top in glyphs)
+            y1 = min(top - bitmap.shape[0] for bitmap, _, top in glyphs)
+            image = np.zeros((y0 - y1, x1 - x0), dtype=np.uint8)
+            for bitmap, x, top in glyphs:
+                region = image[y0 - top:y0 - top + bitmap.shape[0], x - x0:x - x0 + bitmap.shape[1]]
+                np.maximum(region, bitmap, out=region)
+            label = (image, x0, y0)
+        self._labels[text] = label
+        return label
+
+    def extent(self, text: str) -> Tuple[float, float, float, float]:
+        """Ink box (x0, y0, x1, y1) in pixels of `text`, y up, relative to its left baseline point."""
+        image, left, top = self.render(text)
+        return left, top - image.shape[0], left + image.shape[1], top
+
+    def save(self, filename: str):
+        """Store the glyphs rendered so far in a .npz file, see `load`."""
+        chars = sorted(self._glyphs)
+        bitmaps = [self._glyphs[x][0] for x in chars]
+        tmp_path = '{}.{}.tmp'.format(filename, os.getpid())
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.savez(f,
+                         size=np.array(self.size),
+                         chars=np.array([ord(x) for x in chars], dtype=np.int32),
+                         shapes=np.array([x.shape for x in bitmaps], dtype=np.int32).reshape(-1, 2),
+                         metrics=np.array([self._glyphs[x][1:] for x in chars], dtype=np.float64).reshape(-1, 3),
+                         data=np.concatenate([x.ravel() for x in bitmaps]) if bitmaps else np.zeros(0, np.uint8))
+            os.replace(tmp_path, filename)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.modified = False
+
+    @classmethod
+    def load(cls, filename: str, font_name: str) -> 'GlyphAtlas':
+        """Read an atlas written by `save`; missing glyphs are rendered from `font_name`."""
+        with np.load(filename) as f:
+            atlas = cls(font_name, float(f['size']))
+            position = 0
+            for char, shape, (left, top, advance) in zip(f['chars'].tolist(), f['shapes'].tolist(),
+                                                         f['metrics'].tolist()):
+                count = shape[0] * shape[1]
+                bitmap = f['data'][position:position + count].reshape(shape)
+                position += count
+                atlas._glyphs[chr(char)] = (bitmap, int(left), int(top), advance)
+        return atlas
+
+
+@functools.lru_cache(maxsize=16)
+def get_glyph_atlas(font_name: str, size: float, filename: Optional[str] = None) -> GlyphAtlas:
+    """Glyph atlas of `font_name` at `size` pixels, shared within the process.
+
+    With `filename`, the atlas is read from that file if it exists and has the same size.
+    """
+    if filename is not None and os.path.exists(filename):
+        atlas = GlyphAtlas.load(filename, font_name)
+        if atlas.size == float(size):
+            return atlas
+    return GlyphAtlas(font_name, size)
+
+
+def write_png(filename: str, image: "np.array", compression: int = 6):
+    """Write an RGBA uint8 array of shape (height, width, 4) as an 8-bit PNG file."""
+    height, width = image.shape[:2]
+    # every row starts with its filter type, 0 (none)
+    rows = np.zeros((height, width * 4 + 1), dtype=np.uint8)
+    rows[:, 1:] = image.reshape(height, width * 4)
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+    with open(filename, 'wb') as f:
+        f.write(_PNG_SIGNATURE)
+        f.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)))
+        f.write(chunk(b'IDAT', zlib.compress(rows.tobytes(), compression)))
+        f.write(chunk(b'IEND', b''))
+
+
+def _fill_rects(image: "np.array", boxes: "np.array", colors: "np.array", edge: Optional["np.array"], edge_width: int):
+    """Fill `boxes`, rows of integer (x0, y0, x1, y1) clipped to the image, in order, outlined with `edge`.
+
+    The fill is a loop over the rectangles, each one or two slice assignments. Painting every
+    pixel at once is slower: later rectangles win where they overlap, which takes a per-pixel
+    maximum over all the covered pixels rather than a memset per row of a rectangle.
+    """
+    if edge is not None:
+        inner = boxes + np.array([edge_width, edge_width, -edge_width, -edge_width])
+        outlined = ((inner[:, 2] > inner[:, 0]) & (inner[:, 3] > inner[:, 1])).tolist()
+    for i, (x0, y0, x1, y1) in enumerate(boxes.tolist()):
+        if edge is not None and outlined[i]:
+            image[y0:y1, x0:x1] = edge
+            x0, y0, x1, y1 = inner[i].tolist()
+        image[y0:y1, x0:x1] = colors[i]
+
+
+def _draw_polyline(image: "np.array", xs: "np.array", ys: "np.array", color: "np.array", line_width: int):
+    # every segment between two finite points is sampled at least once per pixel
+    finite = np.isfinite(xs) & np.isfinite(ys)
+    starts = np.flatnonzero(finite[:-1] & finite[1:])
+    if len(starts) == 0:
+        return
+    x0, y0 = xs[starts], ys[starts]
+    dx, dy = xs[starts + 1] - x0, ys[starts + 1] - y0
+    steps = np.ceil(np.maximum(np.abs(dx), np.abs(dy))).astype(np.int64) + 1
+    segment = np.repeat(np.arange(len(starts)), steps)
+    t = (np.arange(len(segment)) - np.repeat(np.cumsum(steps) - steps, steps)) / np.repeat(np.maximum(steps - 1, 1), steps)
+    px = np.rint(x0[segment] + t * dx[segment]).astype(np.int64)
+    py = np.rint(y0[segment] + t * dy[segment]).astype(np.int64)
+    radius = (line_width - 1) // 2
+    height, width = image.shape[:2]
+    for oy in range(-radius, line_width - radius):
+        for ox in range(-radius, line_width - radius):
+            qx, qy = px + ox, py + oy
+            inside = (qx >= 0) & (qx < width) & (qy >= 0) & (qy < height)
+            image[qy[inside], qx[inside]] = color
+
+
+def _blend(image: "np.array", alpha: "np.array", x: int, y: int, color: Tuple[int, int, int, int]):
+    # composite `color` with coverage `alpha` over the image, top left corner at (x, y)
+    height, width = image.shape[:2]
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + alpha.shape[1], width), min(y + alpha.shape[0], height)
+    if x1 <= x0 or y1 <= y0:
+        return
+    region = image[y0:y1, x0:x1].astype(np.float32) / 255
+    a = alpha[y0 - y:y1 - y, x0 - x:x1 - x, None].astype(np.float32) / 255 * (color[3] / 255)
+    out_alpha = a + region[..., 3:] * (1 - a)
+    rgb = (np.array(color[:3], dtype=np.float32) / 255 * a + region[..., :3] * region[..., 3:] * (1 - a)) \
+        / np.maximum(out_alpha, 1e-6)
+    image[y0:y1, x0:x1, :3] = np.rint(rgb * 255)
+    image[y0:y1, x0:x1, 3:] = np.rint(out_alpha * 255)
+
+
+def render_primitives_raster(primitives_iter: Iterable[SegmentPrimitives], output: str,
+                             color_f0: str = '#e0e0e0',
+                             color_text: str = '#000000',
+                             figsize=(1280, 15),
+                             dpi=50,
+                             aspect=0.125,
+                             font_name='fonts/NotoSansCJKsc-Medium.otf',
+                             font_size=12,
+                             font_style='normal',
+                             f0_decimation='minmax',
+                             f0_stats: Optional[DecimationStats] = None,
+                             label_culling: bool = True,
+                             glyph_atlas: Optional[str] = None,
+                             xlim: Optional[Tuple[float, float]] = None,
+                             profiler: Optional[Profiler] = None):
+    """Draw the primitives straight into an RGBA NumPy array and write it as a PNG file.
+
+    Takes the same arguments as `render_primitives` and draws the plot at the same
+    size: it is fitted into the axes box of a `figsize` x `dpi` pixel figure keeping
+    `aspect`, and the image is cropped to what was drawn, with a transparent background. Rectangles,
+    the pitch curve and labels are drawn without anti-aliasing of their edges; labels
+    are blended from a `GlyphAtlas` (`font_style` is not applied), read from and saved
+    back to the file `glyph_atlas` if given. `profiler` records the 'draw' and 'save' stages.
+    """
+    primitives_list = list(primitives_iter)
+    extents = Extents(window=xlim)
+    for primitives in primitives_list:
+        extents.update(primitives)
+    if extents.empty:
+        raise ValueError("Nothing to visualize: the track has no notes")
+    x0, x1 = extents.xlim
+    y0, y1 = extents.ylim
+
+    width, height = fit_plot(extents, figsize[0] * dpi * _AXES_WIDTH, figsize[1] * dpi * _AXES_HEIGHT, aspect)
+    font_pixels = font_size * dpi / 72
+    pad = int(np.ceil(font_pixels * 1.5))  # room for labels outside the axes
+    shape = (int(np.ceil(height)) + 2 * pad, int(np.ceil(width)) + 2 * pad)
+    if shape[0] * shape[1] > _MAX_PIXELS:
+        raise ValueError("Output of {}x{} pixels is too large for the raster backend".format(shape[1], shape[0]))
+    sx = width / (x1 - x0)
+    sy = height / (y1 - y0)
+
+    def tx(x):
+        return pad + (x - x0) * sx
+
+    def ty(y):
+        return pad + (y1 - y) * sy
+
+    with profile_stage(profiler, 'draw'):
+        image = np.zeros(shape + (4,), dtype=np.uint8)
+        edge = np.array(_parse_color(_EDGE_COLOR), dtype=np.uint8)
+        edge_width = max(1, int(round(0.5 * dpi / 72)))
+        ph_labels = []
+        lyrics_labels = []
+        for primitives in primitives_list:
+            if len(primitives.rects) > 0:
+                x, y, w, h = primitives.rects.T
+                boxes = np.stack([np.rint(tx(x)), np.rint(ty(y + h)), np.rint(tx(x + w)), np.rint(ty(y))], axis=1)
+                boxes = boxes.astype(np.int64)
+                # at least one pixel each way
+                boxes[:, 2:] = np.maximum(boxes[:, 2:], boxes[:, :2] + 1)
+                boxes[:, 0::2] = np.clip(boxes[:, 0::2], 0, shape[1])
+                boxes[:, 1::2] = np.clip(boxes[:, 1::2], 0, shape[0])
+                colors = np.array([_parse_color(c) for c in primitives.rect_colors], dtype=np.uint8)
+                _fill_rects(image, boxes, colors, edge, edge_width)
+            ph_labels.extend(primitives.ph_labels)
+            lyrics_labels.extend(primitives.lyrics_labels)
+            if profiler is not None:
+                profiler.count('rects', len(primitives.rects))
+
+        # pitch curves over the rectangles, like `render_primitives`
+        pixel_width = 1 / sx
+        f0_color = np.array(_parse_color(color_f0), dtype=np.uint8)
+        line_width = max(1, int(round(1.5 * dpi / 72)))
+        for primitives in primitives_list:
+            if primitives.f0_t is not None:
+                f0_t, f0_midi = decimate_f0(primitives.f0_t, primitives.f0_midi, pixel_width, f0_decimation, f0_stats)
+                _draw_polyline(image, tx(f0_t), ty(f0_midi), f0_color, line_width)
+
+        atlas = get_glyph_atlas(font_name, round(font_pixels, 2), glyph_atlas)
+        layout = layout_labels(ph_labels, lyrics_labels, atlas.extent, sx, sy,
+                               padding=font_pixels * 0.1, cull=label_culling)
+        text_color = _parse_color(color_text)
+        for labels, centered in ((layout.ph_labels, True), (layout.lyrics_labels, False)):
+            for label in labels:
+                alpha, left, top = atlas.render(label.text)
+                x = tx(label.x) + left
+                if centered:
+                    x -= left + alpha.shape[1] / 2
+                _blend(image, alpha, int(round(x)), int(round(ty(label.y))) - top, text_color)
+    if profiler is not None:
+        profiler.count('labels', len(layout.ph_labels) + len(layout.lyrics_labels))
+        profiler.count('labels_dropped', layout.dropped)
+
+    with profile_stage(profiler, 'save'):
+        # crop to the pixels drawn, like a tight bounding box
+        rows = np.flatnonzero(image[:, :, 3].any(axis=1))
+        columns = np.flatnonzero(image[:, :, 3].any(axis=0))
+        if len(rows) > 0:
+            image = image[rows[0]:rows[-1] + 1, columns[0]:columns[-1] + 1]
+        write_png(output, image)
+        if glyph_atlas is not None and atlas.modified:
+            atlas.save(glyph_atlas)
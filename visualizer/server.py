@@ -0,0 +1,358 @@
+# -*- coding: utf-8 -*-
+"""Resident HTTP render server.
+
+`POST /render` takes a .ds document as the request body and style options as query
+parameters (named like the command line options, e.g. `?format=png&color_f0=ff0000&dpi=100`),
+and answers with the rendered SVG or PNG. `GET /metrics` returns request counts and
+latencies as JSON, `GET /health` answers "ok". Renders run on a pool of worker
+processes which import matplotlib, load the font and render a small warm-up document
+once, when they start.
+"""
+
+__all__ = [
+    'FORMATS',
+    'LatencyMetrics',
+    'RenderServer',
+    'serve',
+    'request_render'
+]
+
+import collections
+import io
+import json
+import os
+import shutil
+import signal
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Mapping, Optional, Tuple
+
+from utils.misc import convert_color_str
+from visualizer.backends import *
+
+# output format -> content type
+FORMATS = {
+    'svg': 'image/svg+xml',
+    'png': 'image/png',
+}
+
+_WARMUP_SEGMENT = {
+    'offset': 0.0,
+    'text': 'SP la',
+    'ph_seq': 'SP l a',
+    'ph_dur': '0.2 0.05 0.3',
+    'ph_num': '1 2',
+    'note_seq': 'rest C4',
+    'note_dur': '0.2 0.35',
+    'note_slur': '0 0',
+    'f0_seq': '0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 '
+              '261.6 261.6 261.6 261.6 261.6 261.6 261.6 261.6 261.6 261.6',
+    'f0_timestep': '0.01',
+}
+
+_worker_cache = None
+_worker_dir = None
+
+
+def _init_worker(work_dir: str, style: dict,
+                 cache_dir: Optional[str] = None, cache_max_bytes: int = 512 * 1024 * 1024):
+    # pay for the imports, the font and the first-render costs before the first request
+    global _worker_cache, _worker_dir
+    # the server process handles interrupts and shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    use_non_interactive_backend()
+    from visualizer.pipeline import render_segments
+    _worker_dir = work_dir
+    for backend, fmt in (('matplotlib', 'png'), ('svg', 'svg'), ('raster', 'png')):
+        output_filename = os.path.join(_worker_dir, '{}-warmup.{}'.format(os.getpid(), fmt))
+        render_segments([_WARMUP_SEGMENT], output_filename, backend=backend, **style)
+        os.remove(output_filename)
+    if cache_dir is not None:
+        from visualizer.cache import RenderCache
+        _worker_cache = RenderCache(cache_dir, max_bytes=cache_max_bytes)
+
+
+def _render_request(body: bytes, fmt: str, style: dict, options: dict) -> Tuple[bytes, float]:
+    """Render a .ds document in a worker; returns the output and the time spent rendering it."""
+    from core.readers import iter_segments
+    from visualizer.pipeline import render_segments
+
+    start = time.perf_counter()
+    output_filename = os.path.join(_worker_dir, '{}.{}'.format(os.getpid(), fmt))
+    try:
+        render_segments(iter_segments(io.StringIO(body.decode('utf-8'))), output_filename,
+                        cache=_worker_cache, **options, **style)
+        with open(output_filename, 'rb') as f:
+            data = f.read()
+    finally:
+        if os.path.exists(output_filename):
+            os.remove(output_filename)
+    return data, time.perf_counter() - start
+
+
+class LatencyMetrics:
+    """Request counts and latency percentiles over the most recent `window` requests."""
+
+    def __init__(self, window: int = 1024):
+        self._lock = threading.Lock()
+        self._latencies = collections.deque(maxlen=window)
+        self._render_times = collections.deque(maxlen=window)
+        self.started = time.time()
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+
+    def begin(self):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+
+    def end(self, latency: float, render_time: Optional[float] = None, error: bool = False):
+        with self._lock:
+            self.in_flight -= 1
+            if error:
+                self.errors += 1
+                return
+            self._latencies.append(latency)
+            self._render_times.append(render_time)
+
+    @staticmethod
+    def _summary(values) -> Dict[str, float]:
+        if not values:
+            return {}
+        values = sorted(values)
+
+        def percentile(p):
+            return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+        return {
+            'mean': sum(values) / len(values),
+            'p50': percentile(50),
+            'p90': percentile(90),
+            'p99': percentile(99),
+            'max': values[-1],
+        }
+
+    def to_dict(self) -> Dict:
+        """Latencies are in seconds: `latency` as seen by the server, `render` inside the worker."""
+        with self._lock:
+            return {
+                'uptime': time.time() - self.started,
+                'requests': self.requests,
+                'errors': self.errors,
+                'in_flight': self.in_flight,
+                'window': len(self._latencies),
+                'latency': self._summary(self._latencies),
+                'render': self._summary(self._render_times),
+            }
+
+
+def _parse_bool(value: str) -> bool:
+    if value.lower() in ('1', 'true', 'yes', 'on'):
+        return True
+    if value.lower() in ('0', 'false', 'no', 'off'):
+        return False
+    raise ValueError("not a boolean: {}".format(value))
+
+
+def _parse_choice(choices):
+    def parse(value: str) -> str:
+        if value not in choices:
+            raise ValueError("must be one of {}".format(', '.join(choices)))
+        return value
+    return parse
+
+
+# query parameter -> converter; the font file is fixed by the server
+_STYLE_PARAMETERS = {
+    'color_head': convert_color_str,
+    'color_body': convert_color_str,
+    'color_f0': convert_color_str,
+    'color_text': convert_color_str,
+    'dpi': int,
+    'aspect': float,
+    'font_size': float,
+    'font_style': str,
+    'display_f0': _parse_bool,
+    'f0_decimation': _parse_choice(DECIMATION_METHODS),
+    'label_culling': _parse_bool,
+}
+# longest side of the output, Agg's limit
+_MAX_PIXELS = 1 << 16
+
+_OPTION_PARAMETERS = {
+    'layout_engine': _parse_choice(LAYOUT_ENGINES),
+    'backend': _parse_choice(BACKENDS),
+    'skip_bad_segments': _parse_bool,
+}
+
+
+def _parse_query(query: str, style: Mapping, options: Mapping) -> Tuple[str, dict, dict]:
+    """Return the format, style and options of a request, starting from the server defaults."""
+    style = dict(style)
+    options = dict(options)
+    fmt = 'svg'
+    width, height = style['figsize']
+    for key, values in urllib.parse.parse_qs(query, keep_blank_values=True).items():
+        value = values[-1]
+        try:
+            if key == 'format':
+                fmt = _parse_choice(tuple(FORMATS))(value)
+            elif key == 'width':
+                width = int(value)
+            elif key == 'height':
+                height = int(value)
+            elif key in _STYLE_PARAMETERS:
+                style[key] = _STYLE_PARAMETERS[key](value)
+            elif key in _OPTION_PARAMETERS:
+                options[key] = _OPTION_PARAMETERS[key](value)
+            else:
+                raise ValueError("unknown parameter")
+        except ValueError as e:
+            raise ValueError("Invalid query parameter {}={!r}: {}".format(key, value, e))
+    style['figsize'] = (width, height)
+    if max(width, height) * style['dpi'] > _MAX_PIXELS:
+        raise ValueError("Output larger than {} pixels".format(_MAX_PIXELS))
+    if options.get('backend') == 'svg' and fmt != 'svg':
+        raise ValueError("The svg backend can only write svg")
+    if options.get('backend') == 'raster' and fmt != 'png':
+        raise ValueError("The raster backend can only write png")
+    return fmt, style, options
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    server: 'RenderServer'
+
+    def _send(self, status: int, content_type: str, data: bytes):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status: int, message: str):
+        self._send(status, 'text/plain; charset=utf-8', (message + '\n').encode('utf-8'))
+
+    def do_GET(self):
+        path = urllib.parse.urlsplit(self.path).path
+        if path == '/health':
+            self._send(200, 'text/plain; charset=utf-8', b'ok\n')
+        elif path == '/metrics':
+            self._send(200, 'application/json', json.dumps(self.server.metrics.to_dict(), indent=1).encode('utf-8'))
+        else:
+            self._send_error(404, "Not found")
+
+    def do_POST(self):
+        url = urllib.parse.urlsplit(self.path)
+        if url.path != '/render':
+            self._send_error(404, "Not found")
+            return
+        metrics = self.server.metrics
+        metrics.begin()
+        start = time.perf_counter()
+        if self.headers.get('Content-Length') is None:
+            # e.g. a chunked body, which is not read
+            metrics.end(time.perf_counter() - start, error=True)
+            self._send_error(411, "Content-Length is required")
+            return
+        try:
+            length = int(self.headers['Content-Length'])
+            if length < 0:
+                raise ValueError("Content-Length must not be negative")
+            if length > self.server.max_body_bytes:
+                raise ValueError("Request body exceeds {} bytes".format(self.server.max_body_bytes))
+            body = self.rfile.read(length)
+            fmt, style, options = _parse_query(url.query, self.server.style, self.server.options)
+            data, render_time = self.server.executor.submit(_render_request, body, fmt, style, options).result()
+        except (KeyError, ValueError, UnicodeDecodeError) as e:
+            metrics.end(time.perf_counter() - start, error=True)
+            self._send_error(400, "{}: {}".format(type(e).__name__, e))
+            return
+        except Exception as e:
+            metrics.end(time.perf_counter() - start, error=True)
+            self._send_error(500, "{}: {}".format(type(e).__name__, e))
+            return
+        metrics.end(time.perf_counter() - start, render_time)
+        self._send(200, FORMATS[fmt], data)
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+class RenderServer(ThreadingHTTPServer):
+    """HTTP server that renders on `executor`; `style` and `options` are the defaults of every request."""
+    daemon_threads = True
+
+    def __init__(self, address, executor, style: dict, options: dict,
+                 max_body_bytes: int = 256 * 1024 * 1024,
+                 quiet: bool = False):
+        super().__init__(address, _RequestHandler)
+        self.executor = executor
+        self.style = style
+        self.options = options
+        self.max_body_bytes = max_body_bytes
+        self.quiet = quiet
+        self.metrics = LatencyMetrics()
+
+
+def _raise_keyboard_interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def serve(host: str, port: int, style: dict, options: Optional[dict] = None,
+          jobs: Optional[int] = None,
+          cache_dir: Optional[str] = None,
+          cache_max_bytes: int = 512 * 1024 * 1024,
+          quiet: bool = False):
+    """Run a `RenderServer` with `jobs` worker processes until interrupted (SIGINT or SIGTERM).
+
+    `style` takes the keyword arguments of `render_segments`' style; `options` may
+    set `layout_engine` and `backend`.
+    """
+    options = {k: v for k, v in (options or {}).items() if k in _OPTION_PARAMETERS}
+    signal.signal(signal.SIGTERM, _raise_keyboard_interrupt)
+    jobs = jobs or os.cpu_count() or 1
+    work_dir = tempfile.mkdtemp(prefix='ds-render-')
+    executor = ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                                   initargs=(work_dir, style, cache_dir, cache_max_bytes))
+    try:
+        # start (and warm up) the workers before accepting requests
+        for future in [executor.submit(os.getpid) for _ in range(jobs)]:
+            future.result()
+        server = RenderServer((host, port), executor, style, options, quiet=quiet)
+        print("Serving on http://{}:{}/ with {} worker(s)".format(host, server.server_address[1], jobs), flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+    finally:
+        executor.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def request_render(url: str, document, fmt: str = 'svg', timeout: float = 60.0, **parameters) -> bytes:
+    """Client of `RenderServer`: render `document` (a .ds file name, bytes, or a parsed project) at `url`.
+
+    `parameters` are query parameters such as `dpi=100`. Raises `urllib.error.HTTPError` on failure.
+    """
+    if isinstance(document, str):
+        with open(document, 'rb') as f:
+            body = f.read()
+    elif isinstance(document, bytes):
+        body = document
+    else:
+        body = json.dumps(document, ensure_ascii=False).encode('utf-8')
+    query = urllib.parse.urlencode(dict(parameters, format=fmt))
+    request = urllib.request.Request(url.rstrip('/') + '/render?' + query, data=body, method='POST',
+                                     headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return response.read()
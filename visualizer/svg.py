@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+__all__ = [
+    'render_primitives_svg',
+    'render_tracks_svg'
+]
+
+import base64
+import errno
+import functools
+import io
+import os
+from typing import Iterable, List, Optional, Tuple
+from xml.sax.saxutils import escape, quoteattr
+
+import numpy as np
+
+from core.models import *
+from utils import *
+from visualizer.primitives import *
+from visualizer.labels import *
+
+_FONT_FAMILY = 'ds-visualizer'
+
+
+def _fmt(value: float) -> str:
+    return '{:.2f}'.format(value)
+
+
+def _finite_runs(mask: "np.array") -> List[slice]:
+    # slices of consecutive True values
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], mask.astype(np.int8), [0]])))
+    return [slice(start, end) for start, end in zip(edges[::2].tolist(), edges[1::2].tolist())]
+
+
+def _write_header(f, width: float, height: float, pad: float,
+                  color_text: str, font_size: float, font_style: str):
+    f.write('<?xml version="1.0" encoding="utf-8" standalone="no"?>\n')
+    f.write('<svg xmlns="http://www.w3.org/2000/svg" width="{0}pt" height="{1}pt" '
+            'viewBox="{2} {2} {0} {1}" version="1.1">\n'.format(_fmt(width + 2 * pad), _fmt(height + 2 * pad),
+                                                              _fmt(-pad)))
+    f.write('<style>\n'
+            'text {{ font-family: "{family}", sans-serif; font-size: {size}px; font-style: {style}; fill: {color}; }}\n'
+            '.ph {{ text-anchor: middle; }}\n'
+            '</style>\n'.format(family=_FONT_FAMILY, size=_fmt(font_size),
+                                style=escape(font_style), color=escape(color_text)))
+
+
+@functools.lru_cache(maxsize=32)
+def _font_data(font_name: str, chars: str) -> Optional[bytes]:
+    # WOFF of the glyphs of `chars` in the font; None without fontTools
+    try:
+        from fontTools import subset
+    except ImportError:
+        return None
+    options = subset.Options()
+    options.flavor = 'woff'
+    options.drop_tables += ['FFTM']
+    font = subset.load_font(font_name, options)
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(text=chars)
+    subsetter.subset(font)
+    buffer = io.BytesIO()
+    subset.save_font(font, buffer, options)
+    return buffer.getvalue()
+
+
+def _check_font(font_name: str):
+    # before the output is opened, rather than when the font is embedded at its end
+    if not os.path.isfile(font_name):
+        raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), font_name)
+
+
+def _write_font(f, font_name: str, texts: Iterable[str]):
+    # a style sheet applies to the whole document, so the font can follow the texts it is subset to
+    data = _font_data(font_name, ''.join(sorted(set(''.join(texts)))))
+    if data is None:
+        return
+    f.write('<style>\n@font-face {{ font-family: "{}"; src: url(data:font/woff;base64,{}) format("woff"); }}\n'
+            '</style>\n'.format(_FONT_FAMILY, base64.b64encode(data).decode('ascii')))
+
+
+def _write_primitives(f, primitives_list: Iterable[SegmentPrimitives], tx, ty, sx: float, sy: float,
+                      pixel_width: float, color_f0: str, f0_decimation: str,
+                      f0_stats: Optional[DecimationStats] = None,
+                      profiler: Optional[Profiler] = None,
+                      opacity: Optional[float] = None,
+                      draw_f0: bool = True,
+                      draw_rects: bool = True) -> Tuple[List[Label], List[Label]]:
+    # pitch curves and rectangles; returns the labels of the rectangles, which are culled and written last
+    ph_labels = []
+    lyrics_labels = []
+    for primitives in primitives_list:
+        if draw_f0 and primitives.f0_t is not None:
+            f0_t, f0_midi = decimate_f0(primitives.f0_t, primitives.f0_midi, pixel_width, f0_decimation, f0_stats)
+            xs = tx(f0_t)
+            ys = ty(f0_midi)
+            # unvoiced samples (NaN) break the curve
+            for run in _finite_runs(np.isfinite(ys)):
+                points = ' '.join('{:.2f},{:.2f}'.format(x, y) for x, y in zip(xs[run].tolist(), ys[run].tolist()))
+                f.write('<polyline fill="none" stroke={} stroke-width="1.5" stroke-linejoin="round" '
+                        'points="{}"/>\n'.format(quoteattr(color_f0), points))
+
+        if not draw_rects:
+            continue
+        if len(primitives.rects) > 0:
+            if opacity is None:
+                f.write('<g stroke="#400d51" stroke-width="0.5">\n')
+            else:
+                f.write('<g stroke="#400d51" stroke-width="0.5" opacity="{}">\n'.format(_fmt(opacity)))
+            for (x, y, w, h), color in zip(primitives.rects.tolist(), primitives.rect_colors):
+                f.write('<rect x="{}" y="{}" width="{}" height="{}" fill={}/>\n'.format(
+                    _fmt(tx(x)), _fmt(ty(y + h)), _fmt(w * sx), _fmt(h * sy), quoteattr(color)))
+            f.write('</g>\n')
+
+        ph_labels.extend(primitives.ph_labels)
+        lyrics_labels.extend(primitives.lyrics_labels)
+        if profiler is not None:
+            profiler.count('rects', len(primitives.rects))
+    return ph_labels, lyrics_labels
+
+
+def _write_labels(f, ph_labels: List[Label], lyrics_labels: List[Label], tx, ty, sx: float, sy: float,
+                  font_size: float, label_culling: bool, profiler: Optional[Profiler] = None) -> List[str]:
+    # returns the texts written
+    with profile_stage(profiler, 'draw'):
+        layout = layout_labels(ph_labels, lyrics_labels, lambda text: estimate_text_extent(text, font_size),
+                               sx, sy, padding=font_size * 0.1, cull=label_culling)
+    if profiler is not None:
+        profiler.count('labels', len(layout.ph_labels) + len(layout.lyrics_labels))
+        profiler.count('labels_dropped', layout.dropped)
+    f.write('<g class="ph">\n')
+    for label in layout.ph_labels:
+        f.write('<text x="{}" y="{}">{}</text>\n'.format(_fmt(tx(label.x)), _fmt(ty(label.y)), escape(label.text)))
+    f.write('</g>\n<g>\n')
+    for label in layout.lyrics_labels:
+        f.write('<text x="{}" y="{}">{}</text>\n'.format(_fmt(tx(label.x)), _fmt(ty(label.y)), escape(label.text)))
+    f.write('</g>\n')
+    return [x.text for x in layout.ph_labels] + [x.text for x in layout.lyrics_labels]
+
+
+def render_primitives_svg(primitives_iter: Iterable[SegmentPrimitives], output: str,
+                          color_f0: str = '#e0e0e0',
+                          color_text: str = '#000000',
+                          figsize=(1280, 15),
+                          dpi=50,
+                          aspect=0.125,
+                          font_name='fonts/NotoSansCJKsc-Medium.otf',
+                          font_size=12,
+                          font_style='normal',
+                          f0_decimation='minmax',
+                          f0_stats: Optional[DecimationStats] = None,
+                          label_culling: bool = True,
+                          xlim: Optional[Tuple[float, float]] = None,
+                          profiler: Optional[Profiler] = None):
+    """Write the primitives as SVG elements directly, without matplotlib.
+
+    Takes the same arguments as `render_primitives`. The plot is scaled to fit
+    `figsize` (inches) while keeping `aspect`, like matplotlib's `set_aspect`; `dpi`
+    only sets the pixel size that pitch curves are decimated to. The glyphs of the
+    labels are embedded from the font file by `@font-face` as a WOFF subset (with
+    fontTools; without it, viewers fall back to a sans-serif font); label overlaps are culled with estimated text extents
+    (`estimate_text_extent`). `profiler` records writing the file as the 'save' stage
+    and the label layout as 'draw'.
+    """
+    primitives_list = list(primitives_iter)
+    extents = Extents(window=xlim)
+    for primitives in primitives_list:
+        extents.update(primitives)
+    if extents.empty:
+        raise ValueError("Nothing to visualize: the track has no notes")
+    x0, x1 = extents.xlim
+    y0, y1 = extents.ylim
+
+    # fit the plot into the figure box (in pt)
+    width, height = fit_plot(extents, figsize[0] * 72, figsize[1] * 72, aspect)
+    sx = width / (x1 - x0)
+    sy = height / (y1 - y0)
+    pad = font_size * 1.5  # room for labels outside the axes
+    pixel_width = (x1 - x0) / (width / 72 * dpi)
+
+    def tx(x):
+        return (x - x0) * sx
+
+    def ty(y):
+        return (y1 - y) * sy
+
+    _check_font(font_name)
+    with profile_stage(profiler, 'save'), open(output, 'w', encoding='utf-8') as f:
+        _write_header(f, width, height, pad, color_text, font_size, font_style)
+        ph_labels, lyrics_labels = _write_primitives(f, primitives_list, tx, ty, sx, sy, pixel_width, color_f0,
+                                                     f0_decimation, f0_stats, profiler)
+        texts = _write_labels(f, ph_labels, lyrics_labels, tx, ty, sx, sy, font_size, label_culling, profiler)
+        _write_font(f, font_name, texts)
+        f.write('</svg>\n')
+
+
+def render_tracks_svg(tracks: List[TrackPrimitives], output: str,
+                      stacked: bool = True,
+                      color_f0: str = '#e0e0e0',
+                      color_text: str = '#000000',
+                      figsize=(1280, 15),
+                      dpi=50,
+                      aspect=0.125,
+                      font_name='fonts/NotoSansCJKsc-Medium.otf',
+                      font_size=12,
+                      font_style='normal',
+                      f0_decimation='minmax',
+                      f0_stats: Optional[DecimationStats] = None,
+                      label_culling: bool = True,
+                      overlay_opacity: float = 0.5,
+                      profiler: Optional[Profiler] = None):
+    """Write several tracks on a shared time axis, like `render_tracks_primitives`, without matplotlib."""
+    extents = Extents()
+    for track in tracks:
+        extents.merge(track.extents)
+    if extents.empty:
+        raise ValueError("Nothing to visualize: the tracks have no notes")
+    x0, x1 = extents.xlim
+    y0, y1 = extents.ylim
+
+    rows = [[x] for x in tracks] if stacked else [tracks]
+    name_band = font_size * 1.5  # track names above each row
+    gap = font_size * 1.5 + name_band  # labels below a row, and the names of the next one
+    box_height = max(figsize[1] * 72 - name_band - (len(rows) - 1) * gap, 1.0) / len(rows)
+    width, height = fit_plot(extents, figsize[0] * 72, box_height, aspect)
+    sx = width / (x1 - x0)
+    sy = height / (y1 - y0)
+    pad = font_size * 1.5
+    pixel_width = (x1 - x0) / (width / 72 * dpi)
+
+    def tx(x):
+        return (x - x0) * sx
+
+    _check_font(font_name)
+    with profile_stage(profiler, 'save'), open(output, 'w', encoding='utf-8') as f:
+        _write_header(f, width, name_band + len(rows) * height + (len(rows) - 1) * gap, pad,
+                      color_text, font_size, font_style)
+        texts = [x.name for x in tracks]
+        for index, row in enumerate(rows):
+            top = name_band + index * (height + gap)
+
+            def ty(y, top=top):
+                return top + (y1 - y) * sy
+
+            name_x = 0.0
+            for track in row:
+                f.write('<text x="{}" y="{}" style="fill: {}">{}</text>\n'.format(
+                    _fmt(name_x), _fmt(top - font_size * 0.5), escape(track.color), escape(track.name)))
+                name_x += estimate_text_extent(track.name, font_size)[2] + font_size
+            # all rectangles first, so that no track covers the pitch curve of another
+            ph_labels = []
+            lyrics_labels = []
+            for track in row:
+                track_ph_labels, track_lyrics_labels = _write_primitives(
+                    f, track.primitives, tx, ty, sx, sy, pixel_width, color_f0, f0_decimation,
+                    profiler=profiler, opacity=None if stacked else overlay_opacity, draw_f0=False)
+                ph_labels.extend(track_ph_labels)
+                lyrics_labels.extend(track_lyrics_labels)
+            for track in row:
+                _write_primitives(f, track.primitives, tx, ty, sx, sy, pixel_width,
+                                  color_f0 if stacked else track.color, f0_decimation, f0_stats, draw_rects=False)
+            texts.extend(_write_labels(f, ph_labels, lyrics_labels, tx, ty, sx, sy, font_size, label_culling,
+                                       profiler))
+        _write_font(f, font_name, texts)
+        f.write('</svg>\n')
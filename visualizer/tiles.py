@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+__all__ = [
+    'clip_primitives',
+    'get_tile_filename',
+    'render_tiles'
+]
+
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterable, List, Optional
+
+import numpy as np
+
+from core.models import *
+from utils import *
+from visualizer.backends import *
+from visualizer.primitives import *
+from visualizer.visualizers import *
+
+
+def get_tile_filename(output: str, index: int) -> str:
+    basename, ext = os.path.splitext(output)
+    return '{}_{:03d}{}'.format(basename, index, ext)
+
+
+def _time_span(primitives: SegmentPrimitives):
+    starts = []
+    ends = []
+    if len(primitives.rects) > 0:
+        starts.append(primitives.rects[:, 0].min())
+        ends.append((primitives.rects[:, 0] + primitives.rects[:, 2]).max())
+    if primitives.f0_t is not None and len(primitives.f0_t) > 0:
+        starts.append(primitives.f0_t[0])
+        ends.append(primitives.f0_t[-1])
+    if primitives.xmax is not None:
+        ends.append(primitives.xmax)
+    if not starts:
+        return None
+    return min(starts), max(ends)
+
+
+def clip_primitives(primitives: SegmentPrimitives, t0: float, t1: float,
+                    margin: float = 0.0) -> Optional[SegmentPrimitives]:
+    """Keep the rectangles, labels and f0 samples of `primitives` that intersect [t0, t1).
+
+    Labels anchored up to `margin` outside the window are kept so that text crossing
+    the window border is drawn in both neighbours. Returns None if nothing is left.
+    """
+    clipped = SegmentPrimitives()
+    x = primitives.rects[:, 0]
+    w = primitives.rects[:, 2]
+    keep = (x < t1) & (x + w > t0)
+    clipped.rects = primitives.rects[keep]
+    clipped.rect_colors = [c for c, k in zip(primitives.rect_colors, keep.tolist()) if k]
+    clipped.ph_labels = [x for x in primitives.ph_labels if t0 - margin <= x.x < t1 + margin]
+    clipped.lyrics_labels = [x for x in primitives.lyrics_labels if t0 - margin <= x.x < t1 + margin]
+    if primitives.f0_t is not None and len(primitives.f0_t) > 0:
+        # one sample beyond each border keeps the curve continuous across tiles
+        lo = max(np.searchsorted(primitives.f0_t, t0, side='left') - 1, 0)
+        hi = np.searchsorted(primitives.f0_t, t1, side='right') + 1
+        if hi - lo > 0:
+            clipped.f0_t = primitives.f0_t[lo:hi]
+            clipped.f0_midi = primitives.f0_midi[lo:hi]
+    if len(clipped.rects) == 0 and not clipped.ph_labels and not clipped.lyrics_labels \
+            and (clipped.f0_t is None or len(clipped.f0_t) == 0):
+        return None
+    return clipped
+
+
+def _init_tile_worker(font_name: str, font_size: float, font_style: str):
+    use_non_interactive_backend()
+    get_font_properties(font_name, font_size, font_style)
+
+
+def render_tiles(primitives_factory: Callable[[], Iterable[SegmentPrimitives]], output: str,
+                 tile_length: float,
+                 jobs: Optional[int] = 1,
+                 color_f0: str = '#e0e0e0',
+                 color_text: str = '#000000',
+                 figsize=(40, 15),
+                 dpi=50,
+                 aspect=0.125,
+                 font_name='fonts/NotoSansCJKsc-Medium.otf',
+                 font_size=12,
+                 font_style='normal',
+                 f0_decimation='minmax',
+                 f0_stats: Optional[DecimationStats] = None,
+                 label_culling: bool = True,
+                 profiler: Optional[Profiler] = None) -> List[dict]:
+    """Render the track as numbered tiles of `tile_length` seconds each.
+
+    `primitives_factory` must return a fresh iterator over the segment primitives
+    in time order; it is consumed twice, once for the axis extents and once for
+    drawing, and only the segments intersecting the current tile are held in memory.
+    Each tile is `figsize[0]` inches wide; its height follows from `aspect`. Writes
+    `<output>_NNN<ext>` tiles, a JSON index and, for .svg outputs, a stitched SVG at
+    `output` that references the tiles. Pitch curves are decimated per tile as in
+    `render_primitives`. `profiler` records the 'clip' stage and, as 'render', the
+    drawing and saving of tiles or the time spent waiting for the workers to do so.
+    Returns the index entries.
+    """
+    extents = Extents()
+    for primitives in primitives_factory():
+        extents.update(primitives)
+    if extents.empty:
+        raise ValueError("Nothing to visualize: the track has no notes")
+    xmin, xmax = extents.xlim
+    ylim = extents.ylim
+    tile_count = max(1, math.ceil((xmax - xmin) / tile_length))
+    width = figsize[0]
+    height = width * aspect * (ylim[1] - ylim[0]) / tile_length
+    label_margin = tile_length * 0.25
+    pixel_width = tile_length / (width * dpi)
+    window_options = dict(color_f0=color_f0, color_text=color_text, figsize=(width, height), dpi=dpi,
+                          font_name=font_name, font_size=font_size, font_style=font_style,
+                          label_culling=label_culling)
+
+    executor = None
+    if jobs is None or jobs > 1:
+        executor = ProcessPoolExecutor(max_workers=jobs, initializer=_init_tile_worker,
+                                       initargs=(font_name, font_size, font_style))
+    # bound the number of clipped tiles waiting in the queue
+    max_pending = 2 * (jobs or os.cpu_count() or 1)
+    pending = []
+    index = []
+
+    def flush(tile_index, buffer):
+        t0 = xmin + tile_index * tile_length
+        t1 = t0 + tile_length
+        with profile_stage(profiler, 'clip'):
+            clipped = [x for x in (clip_primitives(p, t0, t1, label_margin) for p in buffer) if x is not None]
+            for primitives in clipped:
+                if primitives.f0_t is not None:
+                    primitives.f0_t, primitives.f0_midi = decimate_f0(primitives.f0_t, primitives.f0_midi,
+                                                                      pixel_width, f0_decimation, f0_stats)
+        tile_filename = get_tile_filename(output, tile_index)
+        index.append({'file': os.path.basename(tile_filename), 'start': t0, 'end': t1})
+        if profiler is not None:
+            profiler.count('tiles')
+        with profile_stage(profiler, 'render'):
+            if executor is None:
+                render_window(clipped, tile_filename, (t0, t1), ylim, **window_options)
+                return
+            pending.append(executor.submit(render_window, clipped, tile_filename, (t0, t1), ylim, **window_options))
+            while len(pending) > max_pending:
+                pending.pop(0).result()
+
+    try:
+        buffer = []  # (start, end, primitives) of segments that may still intersect a tile
+        tile_index = 0
+        for primitives in primitives_factory():
+            span = _time_span(primitives)
+            if span is None:
+                continue
+            start, end = span
+            if tile_index > 0 and start < xmin + tile_index * tile_length + label_margin:
+                # this segment would also belong to a tile that is already written
+                raise ValueError("Segments must be in time order for tiled rendering")
+            # every tile that ends before this segment starts is complete
+            while tile_index < tile_count and start >= xmin + (tile_index + 1) * tile_length + label_margin:
+                flush(tile_index, [x[2] for x in buffer])
+                tile_index += 1
+                t0 = xmin + tile_index * tile_length - label_margin
+                buffer = [x for x in buffer if x[1] > t0]
+            buffer.append((start, end, primitives))
+        while tile_index < tile_count:
+            flush(tile_index, [x[2] for x in buffer])
+            tile_index += 1
+            t0 = xmin + tile_index * tile_length - label_margin
+            buffer = [x for x in buffer if x[1] > t0]
+        with profile_stage(profiler, 'render'):
+            for future in pending:
+                future.result()
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    width_pt = width * 72
+    height_pt = height * 72
+    for entry in index:
+        entry['width_pt'] = width_pt
+        entry['height_pt'] = height_pt
+    basename, ext = os.path.splitext(output)
+    with open(basename + '.json', 'w', encoding='utf-8') as f:
+        json.dump({'tile_length': tile_length, 'xlim': [xmin, xmax], 'ylim': list(ylim), 'tiles': index}, f, indent=1)
+    if ext.lower() == '.svg':
+        with open(output, 'w', encoding='utf-8') as f:
+            f.write('<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" '
+                    'width="{0}pt" height="{1}pt" viewBox="0 0 {0} {1}">\n'.format(width_pt * len(index), height_pt))
+            for i, entry in enumerate(index):
+                f.write('  <image x="{}" y="0" width="{}" height="{}" xlink:href="{}"/>\n'.format(
+                    width_pt * i, width_pt, height_pt, entry['file']))
+            f.write('</svg>\n')
+    return index
@@ -1,19 +1,342 @@
 # -*- coding: utf-8 -*-
 __all__ = [
+    'get_font_properties',
+    'get_segment_primitives',  # re-exported from visualizer.primitives
+    'Extents',  # re-exported from visualizer.primitives
+    'get_text_path',
+    'get_text_extent',
+    'draw_primitives',
+    'draw_labels',
+    'render_primitives',
+    'render_tracks_primitives',
+    'render_window',
+    'visualize_segments',
     'visualize_track'
 ]
 
-from dataclasses import dataclass
+import functools
+from typing import Iterable, List, Optional, Tuple
 
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.collections as mc
 from matplotlib.patches import Rectangle
+from matplotlib.path import Path
+from matplotlib.textpath import TextPath
+from matplotlib.transforms import Affine2D, Bbox, ScaledTranslation
 from matplotlib import font_manager
 
 from core.models import *
 from utils import *
 from core.parsers import *
+from visualizer.primitives import *
+from visualizer.labels import *
+
+
+@functools.lru_cache(maxsize=None)
+def get_font_properties(font_name: str, font_size: float, font_style: str) -> font_manager.FontProperties:
+    return font_manager.FontProperties(
+        fname=font_name,
+        size=font_size,
+        style=font_style)
+
+
+@functools.lru_cache(maxsize=65536)
+def get_text_path(text: str, font_name: str, font_size: float, font_style: str, centered: bool = False) -> Path:
+    """Outline of `text` in pt with its left (or, if `centered`, middle) baseline point at the origin."""
+    path = TextPath((0, 0), text, prop=get_font_properties(font_name, font_size, font_style))
+    if centered:
+        extents = path.get_extents()
+        path = Affine2D().translate(-(extents.x0 + extents.x1) / 2, 0).transform_path(path)
+    return path
+
+
+@functools.lru_cache(maxsize=65536)
+def get_text_extent(text: str, font_name: str, font_size: float, font_style: str):
+    extents = get_text_path(text, font_name, font_size, font_style).get_extents()
+    return extents.x0, extents.y0, extents.x1, extents.y1
+
+
+def draw_primitives(ax, primitives: SegmentPrimitives,
+                    color_f0: str = '#e0e0e0',
+                    draw_f0: bool = True,
+                    alpha: Optional[float] = None):
+    """Draw the pitch curve and note rectangles of one segment; labels are drawn by `draw_labels`."""
+    if draw_f0 and primitives.f0_t is not None:
+        ax.plot(primitives.f0_t, primitives.f0_midi, color=color_f0)
+
+    patches = [Rectangle(xy=(x, y), width=w, height=h) for x, y, w, h in primitives.rects.tolist()]
+    pc = mc.PatchCollection(patches, facecolors=primitives.rect_colors, edgecolors='#400d51', linewidths=0.5,
+                            alpha=alpha)
+    ax.add_collection(pc)
+
+
+def draw_labels(ax, ph_labels: List[Label], lyrics_labels: List[Label],
+                color_text: str = '#000000',
+                font_name='fonts/NotoSansCJKsc-Medium.otf',
+                font_size=12,
+                font_style='normal',
+                label_culling: bool = True,
+                clip_on: bool = False) -> LabelLayout:
+    """Draw phoneme and lyric labels as two collections of cached text outlines.
+
+    Must be called once the axis limits and aspect are final: with `label_culling`,
+    labels that would overlap a neighbour at the output resolution are dropped first.
+    """
+    fig = ax.get_figure()
+    bbox = ax.get_window_extent()
+    xlim = ax.get_xlim()
+    ylim = ax.get_ylim()
+    scale_x = bbox.width * 72 / fig.dpi / (xlim[1] - xlim[0])
+    scale_y = bbox.height * 72 / fig.dpi / (ylim[1] - ylim[0])
+    layout = layout_labels(ph_labels, lyrics_labels,
+                           lambda text: get_text_extent(text, font_name, font_size, font_style),
+                           scale_x, scale_y, padding=font_size * 0.1, cull=label_culling)
+
+    # outlines are in pt around each label's anchor in data coordinates
+    transform = Affine2D().scale(1 / 72) + fig.dpi_scale_trans
+    for labels, centered in ((layout.ph_labels, True), (layout.lyrics_labels, False)):
+        if not labels:
+            continue
+        paths = [get_text_path(x.text, font_name, font_size, font_style, centered) for x in labels]
+        offsets = np.array([(x.x, x.y) for x in labels], dtype=np.float64)
+        collection = mc.PathCollection(paths, offsets=offsets, offset_transform=ax.transData, transform=transform,
+                                       facecolors=color_text, edgecolors='none', linewidths=0, zorder=3)
+        collection.set_clip_on(clip_on)
+        ax.add_collection(collection, autolim=False)
+    return layout
+
+
+def render_primitives(primitives_iter: Iterable[SegmentPrimitives], output: str,
+                      color_f0: str = '#e0e0e0',
+                      color_text: str = '#000000',
+                      figsize=(1280, 15),
+                      dpi=50,
+                      aspect=0.125,
+                      font_name='fonts/NotoSansCJKsc-Medium.otf',
+                      font_size=12,
+                      font_style='normal',
+                      f0_decimation='minmax',
+                      f0_stats: Optional[DecimationStats] = None,
+                      label_culling: bool = True,
+                      xlim: Optional[Tuple[float, float]] = None,
+                      profiler: Optional[Profiler] = None):
+    """Draw the primitives of a whole track and save the figure to `output`.
+
+    Pitch curves are decimated with `f0_decimation` (see `decimate_f0`) to
+    the pixel width of the axes, known once all segments are drawn; until then each
+    curve is kept at the min/max of the pixels of the extents so far, which are never
+    wider. The point counts are added to `f0_stats`. Labels are drawn last, see `draw_labels`. `xlim` fixes
+    the time axis, e.g. to a window of the track (see `render_range`). `profiler`
+    records the 'draw' (artist creation) and 'save' stages.
+    """
+    with profile_stage(profiler, 'draw'):
+        fig, ax = plt.subplots(1, 1, figsize=figsize, dpi=dpi)
+        # the axes box in pixels, before `set_aspect` shrinks it
+        box_width = ax.get_position().width * figsize[0] * dpi
+        box_height = ax.get_position().height * figsize[1] * dpi
+
+    extents = Extents(window=xlim)
+    curves = []
+    f0_points = 0
+    ph_labels = []
+    lyrics_labels = []
+    # primitives are drawn and released one segment at a time
+    for primitives in primitives_iter:
+        with profile_stage(profiler, 'draw'):
+            draw_primitives(ax, primitives, color_f0=color_f0, draw_f0=False)
+            extents.update(primitives)
+            if primitives.f0_t is not None:
+                f0_t, f0_midi = primitives.f0_t, primitives.f0_midi
+                f0_points += len(f0_midi)
+                if f0_decimation != 'none' and not extents.empty:
+                    # pixels only get wider as the extents grow
+                    x0, x1 = extents.xlim
+                    width, _ = fit_plot(extents, box_width, box_height, aspect)
+                    f0_t, f0_midi = decimate_f0(f0_t, f0_midi, (x1 - x0) / width, 'minmax')
+                curves.append((f0_t, f0_midi))
+            ph_labels.extend(primitives.ph_labels)
+            lyrics_labels.extend(primitives.lyrics_labels)
+        if profiler is not None:
+            profiler.count('rects', len(primitives.rects))
+
+    if extents.empty:
+        plt.close(fig)
+        raise ValueError("Nothing to visualize: the track has no notes")
+    with profile_stage(profiler, 'draw'):
+        ax.axis('off')
+        ax.set_aspect(aspect=aspect)
+        plt.xlim(extents.xlim)
+        plt.ylim(extents.ylim)
+        ax.apply_aspect()
+        pixel_width = (extents.xlim[1] - extents.xlim[0]) / (ax.get_position().width * figsize[0] * dpi)
+        curve_stats = DecimationStats()
+        for f0_t, f0_midi in curves:
+            ax.plot(*decimate_f0(f0_t, f0_midi, pixel_width, f0_decimation, curve_stats), color=color_f0)
+        if f0_stats is not None:
+            f0_stats.points += f0_points
+            f0_stats.kept += curve_stats.kept
+        layout = draw_labels(ax, ph_labels, lyrics_labels, color_text=color_text, font_name=font_name,
+                             font_size=font_size, font_style=font_style, label_culling=label_culling)
+    if profiler is not None:
+        profiler.count('labels', len(layout.ph_labels) + len(layout.lyrics_labels))
+        profiler.count('labels_dropped', layout.dropped)
+    with profile_stage(profiler, 'save'):
+        # the tight bounding box does not see the text outlines, so add them explicitly
+        bbox = fig.get_tightbbox(fig.canvas.get_renderer())
+        if layout.bounds is not None:
+            x0, y0, x1, y1 = layout.bounds
+            label_bbox = Bbox(ax.transData.transform([(x0, y0), (x1, y1)])).transformed(fig.dpi_scale_trans.inverted())
+            bbox = Bbox.union([bbox, label_bbox])
+        plt.savefig(output, transparent=True, bbox_inches=bbox, pad_inches=0)
+        plt.close(fig)
+
+
+def render_tracks_primitives(tracks: List[TrackPrimitives], output: str,
+                             stacked: bool = True,
+                             color_f0: str = '#e0e0e0',
+                             color_text: str = '#000000',
+                             figsize=(1280, 15),
+                             dpi=50,
+                             aspect=0.125,
+                             font_name='fonts/NotoSansCJKsc-Medium.otf',
+                             font_size=12,
+                             font_style='normal',
+                             f0_decimation='minmax',
+                             f0_stats: Optional[DecimationStats] = None,
+                             label_culling: bool = True,
+                             overlay_alpha: float = 0.5,
+                             profiler: Optional[Profiler] = None):
+    """Draw several tracks on a shared time axis and save the figure to `output`.
+
+    With `stacked`, every track gets a row of its own (splitting the height of
+    `figsize`), otherwise all tracks are overlaid in one, their rectangles drawn with
+    `overlay_alpha` and their pitch curves in the track color. All rows share the
+    axis limits, merged from the extents of each track. Track names are written
+    above their row in the track color. Otherwise like `render_primitives`.
+    """
+    extents = Extents()
+    for track in tracks:
+        extents.merge(track.extents)
+    if extents.empty:
+        raise ValueError("Nothing to visualize: the tracks have no notes")
+
+    # rows are placed in inches, at the size that keeps `aspect` (see `fit_plot`)
+    rows = [[x] for x in tracks] if stacked else [tracks]
+    name_band = font_size * 1.5 / 72
+    gap = font_size * 1.5 / 72 + name_band
+    box_height = max(figsize[1] - name_band - (len(rows) - 1) * gap, 0.01) / len(rows)
+    width, height = fit_plot(extents, figsize[0], box_height, aspect)
+    pixel_width = (extents.xlim[1] - extents.xlim[0]) / (width * dpi)
+
+    with profile_stage(profiler, 'draw'):
+        fig = plt.figure(figsize=figsize, dpi=dpi)
+        font_properties = get_font_properties(font_name, font_size, font_style)
+    label_bounds = []
+    for index, row in enumerate(rows):
+        with profile_stage(profiler, 'draw'):
+            top = figsize[1] - name_band - index * (height + gap)
+            ax = fig.add_axes((0, (top - height) / figsize[1], width / figsize[0], height / figsize[1]))
+            ax.axis('off')
+            ax.set_xlim(extents.xlim)
+            ax.set_ylim(extents.ylim)
+            name_x = 0.0
+            for track in row:
+                name_transform = ax.transAxes + ScaledTranslation(name_x / 72, font_size * 0.5 / 72,
+                                                                  fig.dpi_scale_trans)
+                ax.text(0, 1, track.name, transform=name_transform, color=track.color,
+                        fontproperties=font_properties, ha='left', va='baseline')
+                name_x += get_text_extent(track.name, font_name, font_size, font_style)[2] + font_size
+            ph_labels = []
+            lyrics_labels = []
+            for track in row:
+                for primitives in track.primitives:
+                    draw_primitives(ax, primitives, draw_f0=False, alpha=None if stacked else overlay_alpha)
+                    ph_labels.extend(primitives.ph_labels)
+                    lyrics_labels.extend(primitives.lyrics_labels)
+                    if profiler is not None:
+                        profiler.count('rects', len(primitives.rects))
+            for track in row:
+                for primitives in track.primitives:
+                    if primitives.f0_t is not None:
+                        ax.plot(*decimate_f0(primitives.f0_t, primitives.f0_midi, pixel_width, f0_decimation,
+                                             f0_stats), color=color_f0 if stacked else track.color)
+            layout = draw_labels(ax, ph_labels, lyrics_labels, color_text=color_text, font_name=font_name,
+                                 font_size=font_size, font_style=font_style, label_culling=label_culling)
+            if layout.bounds is not None:
+                x0, y0, x1, y1 = layout.bounds
+                label_bounds.append(Bbox(ax.transData.transform([(x0, y0), (x1, y1)])))
+        if profiler is not None:
+            profiler.count('labels', len(layout.ph_labels) + len(layout.lyrics_labels))
+            profiler.count('labels_dropped', layout.dropped)
+    with profile_stage(profiler, 'save'):
+        # the tight bounding box does not see the text outlines, so add them explicitly
+        bbox = fig.get_tightbbox(fig.canvas.get_renderer())
+        bbox = Bbox.union([bbox] + [x.transformed(fig.dpi_scale_trans.inverted()) for x in label_bounds])
+        fig.savefig(output, transparent=True, bbox_inches=bbox, pad_inches=0)
+        plt.close(fig)
+
+
+def render_window(primitives_list: List[SegmentPrimitives], output: str,
+                  xlim, ylim,
+                  color_f0: str = '#e0e0e0',
+                  color_text: str = '#000000',
+                  figsize=(40, 5),
+                  dpi=50,
+                  font_name='fonts/NotoSansCJKsc-Medium.otf',
+                  font_size=12,
+                  font_style='normal',
+                  label_culling: bool = True):
+    """Render the primitives inside fixed axis limits onto a figure of exactly `figsize`.
+
+    Unlike `render_primitives`, nothing outside the limits is drawn and the output
+    is not cropped, so windows of equal size line up when placed side by side.
+    """
+    fig = plt.figure(figsize=figsize, dpi=dpi)
+    ax = fig.add_axes((0, 0, 1, 1))
+    for primitives in primitives_list:
+        draw_primitives(ax, primitives, color_f0=color_f0)
+    ax.axis('off')
+    ax.set_xlim(xlim)
+    ax.set_ylim(ylim)
+    draw_labels(ax, [x for p in primitives_list for x in p.ph_labels],
+                [x for p in primitives_list for x in p.lyrics_labels],
+                color_text=color_text, font_name=font_name, font_size=font_size, font_style=font_style,
+                label_culling=label_culling, clip_on=True)
+    fig.savefig(output, transparent=True)
+    plt.close(fig)
+
+
+def visualize_segments(segments: Iterable[Segment], output: str,
+                       display_f0: bool = True,
+                       color_head: str = '#8c2128',
+                       color_body: str = '#d34343',
+                       color_f0: str = '#e0e0e0',
+                       color_text: str = '#000000',
+                       figsize=(1280, 15),
+                       dpi=50,
+                       aspect=0.125,
+                       font_name='fonts/NotoSansCJKsc-Medium.otf',
+                       font_size=12,
+                       font_style='normal',
+                       f0_decimation='minmax',
+                       label_culling=True):
+    primitives_iter = (get_segment_primitives(segment,
+                                              display_f0=display_f0,
+                                              color_head=color_head,
+                                              color_body=color_body)
+                       for segment in segments)
+    render_primitives(primitives_iter, output,
+                      color_f0=color_f0,
+                      color_text=color_text,
+                      figsize=figsize,
+                      dpi=dpi,
+                      aspect=aspect,
+                      font_name=font_name,
+                      font_size=font_size,
+                      font_style=font_style,
+                      f0_decimation=f0_decimation,
+                      label_culling=label_culling)
 
 
 def visualize_track(track: Track, output: str,
@@ -27,55 +350,20 @@ def visualize_track(track: Track, output: str,
                     aspect=0.125,
                     font_name='fonts/NotoSansCJKsc-Medium.otf',
                     font_size=12,
-                    font_style='normal'):
-    fig, ax = plt.subplots(1, 1, figsize=figsize, dpi=dpi)
-
-    if display_f0:
-        for segment in track.segments:
-            f0_midi = segment.pitch_curve.get_midi_pitch()
-            timestep = segment.pitch_curve.timestep
-            f0_t = np.full_like(f0_midi, timestep)
-            f0_t = float_sum([f0_t.cumsum(), segment.offset])
-            ax.plot(f0_t, f0_midi, color=color_f0)
-
-    visualize_units_track = get_visualize_units_track(track)
-    patches = []
-    colors = []
-    ph_labels = []
-    lyrics_labels = []
-    for vu in visualize_units_track:
-        if vu.category in [PhonemeCategory.SP, PhonemeCategory.AP]:
-            continue
-        patch = Rectangle(
-            xy=(vu.offset, vu.midi_pitch - 0.5),
-            width=vu.duration,
-            height=1.0
-        )
-        patches.append(patch)
-        colors.append(color_body if vu.category == PhonemeCategory.BODY else color_head)
-        ph_labels.append(Label(text=vu.text_phoneme, x=float_sum([vu.offset * 2, vu.duration]) / 2, y=vu.midi_pitch - 1))
-        lyrics_labels.append(Label(text=vu.text_lyric, x=float_sum([vu.offset, 0.01]), y=vu.midi_pitch + 0.75))
-
-    #print(ph_labels)
-    pc = mc.PatchCollection(patches, facecolors=colors, edgecolors='#400d51', linewidths=0.5)
-    ax.add_collection(pc)
-    #print('\n'.join(str(_) for _ in patches))
-
-    font = font_manager.FontProperties(
-        fname=font_name,
-        size=font_size,
-        style=font_style)
-    for ph_label in ph_labels:
-        ax.text(x=ph_label.x, y=ph_label.y, s=ph_label.text, horizontalalignment='center', color=color_text, fontproperties=font)
-    for lyric_label in lyrics_labels:
-        ax.text(x=lyric_label.x, y=lyric_label.y, s=lyric_label.text, horizontalalignment='left', color=color_text, fontproperties=font)
-
-    ymax = max(visualize_units_track, key=lambda x: x.midi_pitch).midi_pitch + 1
-    ymin = min(visualize_units_track, key=lambda x: x.midi_pitch if x.midi_pitch != -1 else ymax).midi_pitch - 1
-    xmin = 0
-    xmax = max([float_sum([x.duration, x.offset]) for x in visualize_units_track]) + 1
-    ax.axis('off')
-    ax.set_aspect(aspect=aspect)
-    plt.xlim((xmin, xmax))
-    plt.ylim((ymin, ymax))
-    plt.savefig(output, transparent=True, bbox_inches='tight', pad_inches=0)
+                    font_style='normal',
+                    f0_decimation='minmax',
+                    label_culling=True):
+    visualize_segments(track.segments, output,
+                       display_f0=display_f0,
+                       color_head=color_head,
+                       color_body=color_body,
+                       color_f0=color_f0,
+                       color_text=color_text,
+                       figsize=figsize,
+                       dpi=dpi,
+                       aspect=aspect,
+                       font_name=font_name,
+                       font_size=font_size,
+                       font_style=font_style,
+                       f0_decimation=f0_decimation,
+                       label_culling=label_culling)
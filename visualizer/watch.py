@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+__all__ = [
+    'WatchResult',
+    'watch_file'
+]
+
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from utils import *
+from visualizer.cache import *
+from visualizer.pipeline import *
+
+
+@dataclass
+class WatchResult:
+    """One render of `watch_file`: `reused` segments came from the cache, `parsed` ones were changed or new."""
+    elapsed: float = 0.0
+    reused: int = 0
+    parsed: int = 0
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def _signature(filename: str):
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def watch_file(input_filename: str, output_filename: str,
+               interval: float = 0.5,
+               cache: Optional[MemoryRenderCache] = None,
+               callback: Optional[Callable[[WatchResult], None]] = None,
+               stop: Optional[threading.Event] = None,
+               **render_options):
+    """Render `input_filename` with `render_file`, and again every time the file changes.
+
+    The file is polled every `interval` seconds, and a change is rendered once two
+    polls in a row see the same modification time and size, so that a file being
+    written is not read halfway. Segments are matched to the previous version by
+    content (see `RenderCache.key`): only changed and new segments are parsed and laid
+    out again, the primitives of the others are taken from `cache`. A render that
+    fails (e.g. on a file saved in the middle of an edit) is reported to `callback`
+    like a successful one, and watching goes on. Runs until `stop` is set or the
+    process is interrupted.
+    """
+    if cache is None:
+        cache = MemoryRenderCache()
+    stop = stop or threading.Event()
+    rendered = None
+    previous = _signature(input_filename)
+    while not stop.is_set():
+        current = _signature(input_filename)
+        if current is not None and current == previous and current != rendered:
+            rendered = current
+            hits, misses = cache.hits, cache.misses
+            start = time.perf_counter()
+            try:
+                render_file(input_filename, output_filename, cache=cache, **render_options)
+                error = None
+            except FileNotFoundError as e:
+                error = missing_file_message(e, input_filename)
+            except Exception as e:
+                error = "{}: {}".format(type(e).__name__, e)
+            else:
+                # forget the segments of the previous version only once the new one rendered
+                cache.next_generation()
+            result = WatchResult(elapsed=time.perf_counter() - start,
+                                 reused=cache.hits - hits, parsed=cache.misses - misses, error=error)
+            if callback is not None:
+                callback(result)
+        previous = current
+        stop.wait(interval)